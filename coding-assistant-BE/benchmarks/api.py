@@ -0,0 +1,234 @@
+"""End-to-end latency and throughput of the API, through the FastAPI app and a simulated LLM.
+
+Drives the app in process over httpx's ASGI transport with LLM_BACKEND=fake, against a
+scratch `bench_api` schema of the configured Postgres database. Each scenario sends
+`--requests` requests at `--concurrency` and reports p50/p95/p99 latency, requests/sec and
+the time spent per stage (db.*, llm.*, answer_cache.*, thread.wait) as JSON:
+
+    python -m benchmarks.api --requests 500 --concurrency 32 --llm-latency 0.2 --output bench.json
+
+With `--baseline bench.json` the run exits with status 1 when a scenario's p95 latency
+or requests/sec is more than `--max-regression` worse than in the baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+SCHEMA = "bench_api"
+SCENARIOS = ["create_thread", "send_message", "list_messages", "list_threads"]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ms = sorted(sample * 1000 for sample in samples)
+    if len(ms) == 1:
+        ms = ms * 2
+    percentiles = statistics.quantiles(ms, n=100, method="inclusive")
+    return {
+        "p50_ms": round(percentiles[49], 3),
+        "p95_ms": round(percentiles[94], 3),
+        "p99_ms": round(percentiles[98], 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+async def drive(
+    requests: int, concurrency: int, send: Callable[[int], Awaitable[httpx.Response]]
+) -> Dict:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    next_request = iter(range(requests))
+
+    async def worker() -> None:
+        for i in next_request:
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency": summarize(latencies),
+    }
+
+
+def stage_breakdown(samples: Dict[str, List[float]], requests: int) -> Dict[str, Dict]:
+    return {
+        name: {
+            "count": len(durations),
+            # mean time a request of the scenario spent in the stage
+            "per_request_ms": round(sum(durations) * 1000 / requests, 3),
+            **summarize(durations),
+        }
+        for name, durations in sorted(samples.items())
+    }
+
+
+def regressions(result: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    found = []
+    for name, scenario in result["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        p95, p95_before = scenario["latency"]["p95_ms"], before["latency"]["p95_ms"]
+        if p95 > p95_before * (1 + max_regression):
+            found.append(f"{name}: p95 {p95_before}ms -> {p95}ms")
+        rps, rps_before = scenario["requests_per_second"], before["requests_per_second"]
+        if rps < rps_before * (1 - max_regression):
+            found.append(f"{name}: {rps_before} -> {rps} requests/s")
+    return found
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    # the app reads its configuration from the environment when it is first used
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MEDIAN"] = str(args.llm_latency)
+    os.environ["FAKE_LLM_LATENCY_SIGMA"] = str(args.llm_latency_sigma)
+    os.environ["FAKE_LLM_SEED"] = "42"
+
+    from coding_assistant.connections.dbx import DbConfig, InstrumentedAsyncPool, PoolStats
+    from coding_assistant.connections.dbx.migrate import migrate
+    from coding_assistant.main import app, injector
+    from coding_assistant.telemetry import StageRecorder, add_observer
+
+    config = injector.get(DbConfig)
+    url = args.url or config.connection_string()
+
+    admin = create_async_engine(url)
+    async with admin.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    await admin.dispose()
+
+    # same pool settings as DbModule, pointed at the scratch schema
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncPool,
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_timeout=config.pool_timeout,
+        connect_args={"server_settings": {"search_path": SCHEMA}},
+    )
+    engine.pool.stats = injector.get(PoolStats)
+    injector.binder.bind(AsyncEngine, to=engine)
+
+    recorder = StageRecorder()
+    add_observer(recorder)
+    scenarios: Dict[str, Dict] = {}
+    try:
+        await migrate(engine)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            assistant_id = (await client.get("/assistants")).json()["assistant"]["id"]
+            base = f"/assistants/{assistant_id}"
+            thread_ids: List[str] = []
+
+            async def create_thread(i: int) -> httpx.Response:
+                # distinct questions: every thread pays for a run, not an answer cache hit
+                response = await client.post(
+                    f"{base}/threads", json={"message": f"question {i}"}
+                )
+                if response.status_code == 200:
+                    thread_ids.append(response.json()["thread"]["id"])
+                return response
+
+            async def send_message(i: int) -> httpx.Response:
+                thread_id = thread_ids[i % len(thread_ids)]
+                return await client.post(
+                    f"{base}/threads/{thread_id}/messages", json={"message": f"follow up {i}"}
+                )
+
+            async def list_messages(i: int) -> httpx.Response:
+                thread_id = thread_ids[i % len(thread_ids)]
+                return await client.get(
+                    f"{base}/threads/{thread_id}/messages", params={"limit": args.page_size}
+                )
+
+            async def list_threads(i: int) -> httpx.Response:
+                return await client.get(f"{base}/threads", params={"limit": args.page_size})
+
+            scenario_requests = {
+                "create_thread": create_thread,
+                "send_message": send_message,
+                "list_messages": list_messages,
+                "list_threads": list_threads,
+            }
+            for name in SCENARIOS:
+                recorder.clear()
+                result = await drive(args.requests, args.concurrency, scenario_requests[name])
+                result["stages"] = stage_breakdown(recorder.samples, args.requests)
+                result["db_pool"] = (await client.get("/monitoring/db-pool")).json()
+                scenarios[name] = result
+    finally:
+        if not args.keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "llm_latency_sigma": args.llm_latency_sigma,
+            "page_size": args.page_size,
+            "db_pool_size": config.pool_size,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="async SQLAlchemy URL, defaults to the DB_* env config")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.2, help="median simulated run seconds"
+    )
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark schema")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(result, json.load(f), args.max_regression)
+        for regression in found:
+            print(f"regression: {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Seeded benchmark for the message store before and after 0002_indexes_and_cascades.
+
+Builds the schema in a scratch `bench_indexes` schema of the configured database, seeds it
+with `--threads * --messages` messages, then times the repository queries on the
+0001 schema and again after migrating to head. Deletes run inside a rolled back transaction.
+
+    python -m benchmarks.db_indexes --threads 20000 --messages 50
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from coding_assistant.connections.dbx.migrate import migrate
+
+SCHEMA = "bench_indexes"
+
+LIST_MESSAGES = """
+SELECT id, assistant_id, thread_id, created_at, role, type, content FROM assistant_message
+WHERE thread_id = :thread_id
+"""
+LIST_THREADS = """
+SELECT id, name, assistant_id, created_at FROM assistant_thread WHERE assistant_id = :assistant_id
+"""
+# delete sequences as issued by the repository before and after the cascades
+DELETE_THREAD = {
+    "before": [
+        "DELETE FROM assistant_message WHERE thread_id = :thread_id",
+        "DELETE FROM assistant_thread WHERE id = :thread_id",
+    ],
+    "after": ["DELETE FROM assistant_thread WHERE id = :thread_id"],
+}
+DELETE_ASSISTANT = {
+    "before": [
+        "DELETE FROM assistant_message WHERE assistant_id = :assistant_id",
+        "DELETE FROM assistant_thread WHERE assistant_id = :assistant_id",
+        "DELETE FROM assistant WHERE id = :assistant_id",
+    ],
+    "after": ["DELETE FROM assistant WHERE id = :assistant_id"],
+}
+
+
+async def seed(conn: AsyncConnection, assistants: int, threads: int, messages: int) -> None:
+    await conn.execute(
+        text(
+            """
+            INSERT INTO assistant (id, name, instructions, model)
+            SELECT 'asst_' || a, 'Assistant ' || a, '', 'gpt-35-turbo'
+            FROM generate_series(1, :assistants) a
+            """
+        ),
+        {"assistants": assistants},
+    )
+    await conn.execute(
+        text(
+            """
+            INSERT INTO assistant_thread (id, name, assistant_id, created_at)
+            SELECT 'thread_' || t, 'New chat', 'asst_' || (t % :assistants + 1),
+                   now() - t * interval '1 minute'
+            FROM generate_series(1, :threads) t
+            """
+        ),
+        {"assistants": assistants, "threads": threads},
+    )
+    await conn.execute(
+        text(
+            """
+            INSERT INTO assistant_message
+                (id, assistant_id, thread_id, created_at, role, type, content)
+            SELECT 'msg_' || t || '_' || m, 'asst_' || (t % :assistants + 1), 'thread_' || t,
+                   now() - t * interval '1 minute' + m * interval '1 second',
+                   CASE WHEN m % 2 = 1 THEN 'user' ELSE 'assistant' END, 'text',
+                   json_build_object('message', repeat('x', 200))
+            FROM generate_series(1, :threads) t, generate_series(1, :messages) m
+            """
+        ),
+        {"assistants": assistants, "threads": threads, "messages": messages},
+    )
+    await conn.execute(text("ANALYZE"))
+
+
+async def timed(
+    engine: AsyncEngine,
+    run: Callable[[AsyncConnection], Awaitable[None]],
+    iterations: int,
+) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(iterations):
+        async with engine.connect() as conn:
+            start = time.perf_counter()
+            await run(conn)
+            samples.append((time.perf_counter() - start) * 1000)
+            await conn.rollback()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+async def measure(
+    engine: AsyncEngine, phase: str, assistants: int, threads: int, iterations: int
+) -> Dict[str, Dict[str, float]]:
+    rnd = random.Random(42)
+
+    def thread_id() -> Dict[str, str]:
+        return {"thread_id": f"thread_{rnd.randint(1, threads)}"}
+
+    def assistant_id() -> Dict[str, str]:
+        return {"assistant_id": f"asst_{rnd.randint(1, assistants)}"}
+
+    def statements(queries: List[str], parameters: Callable[[], Dict[str, str]]):
+        async def run(conn: AsyncConnection) -> None:
+            values = parameters()
+            for query in queries:
+                await conn.execute(text(query), values)
+
+        return run
+
+    return {
+        "list_messages": await timed(
+            engine, statements([LIST_MESSAGES], thread_id), iterations
+        ),
+        "list_threads": await timed(
+            engine, statements([LIST_THREADS], assistant_id), iterations
+        ),
+        "delete_thread": await timed(
+            engine, statements(DELETE_THREAD[phase], thread_id), iterations
+        ),
+        "delete_assistant": await timed(
+            engine, statements(DELETE_ASSISTANT[phase], assistant_id), max(1, iterations // 5)
+        ),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    admin = create_async_engine(args.url)
+    async with admin.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    await admin.dispose()
+
+    engine = create_async_engine(
+        args.url, connect_args={"server_settings": {"search_path": SCHEMA}}
+    )
+    try:
+        await migrate(engine, target="0001_initial_schema")
+        start = time.perf_counter()
+        async with engine.begin() as conn:
+            await seed(conn, args.assistants, args.threads, args.messages)
+        seed_seconds = time.perf_counter() - start
+
+        before = await measure(engine, "before", args.assistants, args.threads, args.iterations)
+        await migrate(engine)
+        async with engine.connect() as conn:
+            await conn.execute(text("ANALYZE"))
+            await conn.commit()
+        after = await measure(engine, "after", args.assistants, args.threads, args.iterations)
+    finally:
+        if not args.keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+    return {
+        "assistants": args.assistants,
+        "threads": args.threads,
+        "messages": args.threads * args.messages,
+        "seed_seconds": round(seed_seconds, 1),
+        "before": before,
+        "after": after,
+        "p50_speedup": {
+            name: round(before[name]["p50_ms"] / max(after[name]["p50_ms"], 1e-3), 1)
+            for name in before
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="async SQLAlchemy URL, defaults to the DB_* env config")
+    parser.add_argument("--assistants", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=20_000)
+    parser.add_argument("--messages", type=int, default=50, help="messages per thread")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded schema")
+    args = parser.parse_args()
+
+    if args.url is None:
+        from injector import Injector
+
+        from coding_assistant.connections import ConfigModule, DbModule
+        from coding_assistant.connections.dbx import DbConfig
+
+        args.url = Injector([ConfigModule(), DbModule()]).get(DbConfig).connection_string()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
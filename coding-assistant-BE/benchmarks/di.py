@@ -0,0 +1,108 @@
+"""Dependency resolution time per request, with and without the process-wide singletons.
+
+Each simulated request goes through InjectorMiddleware and resolves what the batch route
+injects (the service, the job manager, the batch config) plus the Env and the Azure OpenAI
+client. "unscoped" binds Env, the client and the LLMs as they were before they became
+singletons: `.env` is read again and a client with a new connection pool is built per resolution.
+Nothing connects: the engine and the client are only constructed.
+
+    python -m benchmarks.di --requests 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict
+
+from environs import Env
+from fastapi_injector import InjectorMiddleware, RequestScopeOptions
+from injector import CallableProvider, Injector
+from openai import AsyncAzureOpenAI
+
+from coding_assistant.assistant import AssistantModule
+from coding_assistant.assistant.batch import BatchConfig
+from coding_assistant.assistant.jobs import JobManager
+from coding_assistant.assistant.service import IAssistantService
+from coding_assistant.connections import AzureOpenAiModule, ConfigModule, DbModule
+from coding_assistant.lifecycle import LifecycleModule
+from coding_assistant.llms import LlmModule
+from coding_assistant.llms.llm import LLM, LlmBackends
+from coding_assistant.telemetry import TelemetryModule
+
+# placeholders for a checkout without .env, none of them is connected to
+PLACEHOLDERS = {
+    "DB_HOST": "localhost",
+    "DB_USER": "postgres",
+    "DB_PASSWORD": "postgres",
+    "DB_DATABASE": "postgres",
+    "AZURE_OPENAI_API_KEY": "key",
+    "AZURE_OPENAI_ENDPOINT": "https://example.openai.azure.com",
+    "AZURE_OPENAI_API_VERSION": "2024-05-01-preview",
+}
+
+
+def build_injector(singletons: bool) -> Injector:
+    injector = Injector(
+        [
+            AssistantModule(),
+            ConfigModule(),
+            DbModule(),
+            AzureOpenAiModule(),
+            LlmModule(),
+            TelemetryModule(),
+            LifecycleModule(),
+        ]
+    )
+    injector.binder.bind(RequestScopeOptions, to=RequestScopeOptions(enable_cleanup=True))
+    if not singletons:
+        for interface, provide in [
+            (Env, ConfigModule().provide_env),
+            (AsyncAzureOpenAI, AzureOpenAiModule().provide_llm),
+            (LLM, LlmModule().provide_llm),
+            (LlmBackends, LlmModule().provide_llm_backends),
+        ]:
+            injector.binder.bind(interface, to=CallableProvider(provide))
+    return injector
+
+
+async def simulate(singletons: bool, requests: int) -> Dict:
+    injector = build_injector(singletons)
+
+    async def route(scope, receive, send) -> None:
+        injector.get(IAssistantService)
+        injector.get(JobManager)
+        injector.get(BatchConfig)
+        injector.get(Env)
+        injector.get(AsyncAzureOpenAI)
+
+    middleware = InjectorMiddleware(route, injector=injector)
+    # the first request builds the singletons, as the startup does in the app
+    await middleware({"type": "http"}, None, None)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await middleware({"type": "http"}, None, None)
+    seconds = time.perf_counter() - start
+    return {"requests": requests, "us_per_request": round(seconds / requests * 1e6, 1)}
+
+
+async def run(requests: int) -> Dict:
+    for name, value in PLACEHOLDERS.items():
+        os.environ.setdefault(name, value)
+    return {
+        "unscoped": await simulate(False, requests),
+        "singletons": await simulate(True, requests),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
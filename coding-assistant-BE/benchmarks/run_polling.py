@@ -0,0 +1,93 @@
+"""runs.retrieve calls and detection delay per answered message, fixed vs adaptive polling.
+
+Runs of the given durations are polled concurrently against a fake client, once with the
+previous per-request loop (retrieve, then sleep 0.5s) and once through RunPoller with the
+PollingConfig defaults.
+
+    python -m benchmarks.run_polling --durations 0.5 1 2 5 10 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+from coding_assistant.llms.polling import PENDING_STATES, PollingConfig, RunPoller
+
+API_LATENCY = 0.05
+
+
+class FakeRuns:
+    def __init__(self, durations: Dict[str, float]) -> None:
+        self.durations = durations
+        self.started: Dict[str, float] = {}
+        self.retrieve_calls: Dict[str, int] = {}
+
+    def start(self, run_id: str) -> SimpleNamespace:
+        self.started[run_id] = time.monotonic()
+        self.retrieve_calls[run_id] = 0
+        return SimpleNamespace(id=run_id, status="queued", last_error=None)
+
+    async def retrieve(self, thread_id: str, run_id: str, **kwargs) -> SimpleNamespace:
+        await asyncio.sleep(API_LATENCY)
+        self.retrieve_calls[run_id] += 1
+        elapsed = time.monotonic() - self.started[run_id]
+        status = "completed" if elapsed >= self.durations[run_id] else "in_progress"
+        return SimpleNamespace(id=run_id, status=status, last_error=None)
+
+
+async def fixed_interval_wait(runs: FakeRuns, run: SimpleNamespace) -> SimpleNamespace:
+    # the _wait_on_run loop before RunPoller
+    itr = 0
+    while run.status in PENDING_STATES and itr <= 120:
+        itr += 1
+        run = await runs.retrieve(thread_id="thread", run_id=run.id)
+        await asyncio.sleep(0.5)
+    return run
+
+
+async def simulate(config: PollingConfig | None, durations: List[float]) -> List[Dict]:
+    runs = FakeRuns({f"run_{i}": duration for i, duration in enumerate(durations)})
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    poller = RunPoller(client=client, config=config) if config is not None else None
+
+    async def answer(run_id: str) -> Dict:
+        run = runs.start(run_id)
+        if poller is None:
+            await fixed_interval_wait(runs, run)
+        else:
+            await poller.wait("thread", run)
+        finished = runs.started[run_id] + runs.durations[run_id]
+        return {
+            "run_seconds": runs.durations[run_id],
+            "retrieve_calls": runs.retrieve_calls[run_id],
+            "detection_delay_ms": round((time.monotonic() - finished) * 1000),
+        }
+
+    return await asyncio.gather(*(answer(run_id) for run_id in runs.durations))
+
+
+async def run(durations: List[float]) -> Dict:
+    adaptive = PollingConfig()
+    return {
+        "fixed_0.5s": await simulate(None, durations),
+        "adaptive": await simulate(adaptive, durations),
+        "adaptive_config": {
+            "initial_interval": adaptive.initial_interval,
+            "max_interval": adaptive.max_interval,
+            "backoff": adaptive.backoff,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[0.5, 1, 2, 5, 10, 20])
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.durations)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Import time of the app, the first part of a container's cold start, by top-level package.
+
+`import coding_assistant.main` is run in fresh interpreters with `-X importtime`. The fastest
+run is reported with the self time summed per top-level package and the slowest modules.
+With `--budget` the exit code is 1 when the import takes longer than that many seconds.
+
+    python -m benchmarks.startup --runs 5 --budget 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.di import PLACEHOLDERS
+
+
+def profile() -> List[Dict]:
+    env = {**PLACEHOLDERS, **os.environ}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import coding_assistant.main"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)}
+        )
+    return modules
+
+
+def report(modules: List[Dict], top: int) -> Dict:
+    packages: Dict[str, int] = defaultdict(int)
+    for module in modules:
+        packages[module["module"].split(".")[0]] += module["self_us"]
+    slowest = sorted(modules, key=lambda module: module["self_us"], reverse=True)[:top]
+    return {
+        "import_seconds": round(sum(packages.values()) / 1e6, 3),
+        "packages_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+        "slowest_modules_ms": {
+            module["module"]: round(module["self_us"] / 1000, 1) for module in slowest
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget", type=float, default=None, help="Seconds the import may take")
+    args = parser.parse_args()
+
+    runs = [report(profile(), args.top) for _ in range(args.runs)]
+    fastest = min(runs, key=lambda run: run["import_seconds"])
+    print(json.dumps(fastest, indent=2))
+    if args.budget is not None and fastest["import_seconds"] > args.budget:
+        print(
+            f"import takes {fastest['import_seconds']}s, over the {args.budget}s budget",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic.dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from coding_assistant.assistant.cache import CacheStatsResult, TTLCache
+from coding_assistant.assistant.models import AssistantMessageValue
+from coding_assistant.assistant.schemas import AssistantEntity, AssistantMessageType
+from coding_assistant.llms.constants import WRAPPER_PROMPT_VERSION
+from coding_assistant.telemetry import timed
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnswerCacheConfig:
+    enabled: bool = True
+    # "postgres" adds the persistent tier shared between workers,
+    # "memory" keeps answers in process only
+    store: str = "postgres"
+    # seconds an answer is served for, in both tiers
+    ttl: float = 86_400.0
+    memory_max_size: int = 1024
+    max_rows: int = 100_000
+    # the persistent tier is trimmed to `max_rows` once every this many stores
+    prune_every: int = 100
+
+
+@dataclass
+class AnswerCacheStatsResult:
+    memory: CacheStatsResult
+    lookups: int
+    memory_hits: int
+    persistent_hits: int
+    misses: int
+    stores: int
+    hit_rate: float
+
+
+def normalise_prompt(message: str) -> str:
+    # whitespace does not change the question, case may: `Foo` and `foo` are different names
+    return " ".join(message.split())
+
+
+def answer_key(assistant: AssistantEntity, message: str) -> str:
+    key = [assistant.id, assistant.model, WRAPPER_PROMPT_VERSION, normalise_prompt(message)]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+class AnswerCache:
+    """Answers to the first message of a thread: an in-process LRU in front of a Postgres table."""
+
+    def __init__(self, config: AnswerCacheConfig, engine: AsyncEngine | None = None) -> None:
+        self.config = config
+        self.engine = engine if config.store == "postgres" else None
+        self.memory: TTLCache[str, List[AssistantMessageValue]] = TTLCache(
+            max_size=config.memory_max_size, ttl=config.ttl
+        )
+        # counters
+        self.lookups = 0
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.stores = 0
+
+    def applies_to(self, assistant: AssistantEntity) -> bool:
+        return self.config.enabled and assistant.answer_cache_enabled
+
+    @timed("answer_cache.get")
+    async def get(
+        self, assistant: AssistantEntity, message: str
+    ) -> List[AssistantMessageValue] | None:
+        key = answer_key(assistant, message)
+        self.lookups += 1
+
+        answer = self.memory.get(key)
+        if answer is not None:
+            self.memory_hits += 1
+            return answer
+
+        if self.engine is not None:
+            loaded = await self._load(key)
+            if loaded is not None:
+                answer, expires_at = loaded
+                self.persistent_hits += 1
+                self.memory.set(key, answer, ttl=(expires_at - datetime.now()).total_seconds())
+                return answer
+
+        return None
+
+    @timed("answer_cache.set")
+    async def set(
+        self, assistant: AssistantEntity, message: str, answer: List[AssistantMessageValue]
+    ) -> None:
+        key = answer_key(assistant, message)
+        self.memory.set(key, answer)
+        self.stores += 1
+
+        if self.engine is not None:
+            await self._save(key, assistant.id, answer)
+            if self.stores % self.config.prune_every == 0:
+                await self._prune()
+
+    def stats(self) -> AnswerCacheStatsResult:
+        hits = self.memory_hits + self.persistent_hits
+        return AnswerCacheStatsResult(
+            memory=self.memory.stats(),
+            lookups=self.lookups,
+            memory_hits=self.memory_hits,
+            persistent_hits=self.persistent_hits,
+            misses=self.lookups - hits,
+            stores=self.stores,
+            hit_rate=hits / self.lookups if self.lookups else 0.0,
+        )
+
+    # the persistent tier is best effort: its errors are logged and read as misses
+    async def _load(self, key: str) -> tuple[List[AssistantMessageValue], datetime] | None:
+        now = datetime.now()
+        query = """
+            UPDATE assistant_answer_cache SET last_used_at = :now
+            WHERE key = :key AND expires_at > :now
+            RETURNING answer, expires_at
+        """
+        try:
+            async with self.engine.begin() as conn:
+                row = (await conn.execute(text(query), {"key": key, "now": now})).fetchone()
+        except Exception as e:
+            logger.warning("loading a cached answer failed: %s", e)
+            return None
+
+        if row is None:
+            return None
+        answer = [
+            AssistantMessageValue(
+                type=AssistantMessageType(value["type"]), content=value["content"]
+            )
+            for value in row[0]
+        ]
+        return answer, row[1]
+
+    async def _save(
+        self, key: str, assistant_id: str, answer: List[AssistantMessageValue]
+    ) -> None:
+        now = datetime.now()
+        query = """
+            INSERT INTO assistant_answer_cache
+                (key, assistant_id, answer, created_at, last_used_at, expires_at)
+            VALUES (:key, :assistant_id, :answer, :now, :now, :expires_at)
+            ON CONFLICT (key) DO UPDATE
+            SET answer = EXCLUDED.answer,
+                last_used_at = EXCLUDED.last_used_at,
+                expires_at = EXCLUDED.expires_at
+        """
+        parameters = {
+            "key": key,
+            "assistant_id": assistant_id,
+            "answer": json.dumps(
+                [{"type": value.type.value, "content": value.content} for value in answer]
+            ),
+            "now": now,
+            "expires_at": now + timedelta(seconds=self.config.ttl),
+        }
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(text(query), parameters)
+        except Exception as e:
+            logger.warning("saving a cached answer failed: %s", e)
+
+    async def _prune(self) -> None:
+        query = """
+            DELETE FROM assistant_answer_cache
+            WHERE expires_at <= :now OR key IN (
+                SELECT key FROM assistant_answer_cache
+                ORDER BY last_used_at DESC
+                OFFSET :max_rows
+            )
+        """
+        parameters = {"now": datetime.now(), "max_rows": self.config.max_rows}
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(text(query), parameters)
+        except Exception as e:
+            logger.warning("pruning cached answers failed: %s", e)
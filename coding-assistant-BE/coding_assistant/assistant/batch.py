@@ -0,0 +1,45 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from pydantic.dataclasses import dataclass
+
+T = TypeVar("T")
+
+
+@dataclass
+class BatchConfig:
+    max_items: int = 100
+    # requests may ask for less of either, not more
+    concurrency: int = 8
+    item_timeout: float = 120.0
+
+
+async def fan_out(
+    count: int,
+    work: Callable[[int], Awaitable[T]],
+    concurrency: int,
+    timeout: float,
+) -> AsyncIterator[tuple[int, T | Exception]]:
+    """Run `work(0..count-1)`, at most `concurrency` at a time, yielding (index, result)
+    as each finishes.
+
+    An item failing, or running longer than `timeout` seconds once started, yields its exception.
+    Items still running when the iteration is closed are cancelled.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(i: int) -> tuple[int, T | Exception]:
+        async with slots:
+            try:
+                return i, await asyncio.wait_for(work(i), timeout)
+            except Exception as e:
+                return i, e
+
+    tasks = [asyncio.create_task(run(i)) for i in range(count)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
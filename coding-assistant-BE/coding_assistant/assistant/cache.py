@@ -0,0 +1,147 @@
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, List, TypeVar
+
+from pydantic.dataclasses import dataclass
+
+from coding_assistant.assistant.coordination import ASSISTANT_TOPIC, PgChannel
+from coding_assistant.assistant.repository import AssistantRepository
+from coding_assistant.assistant.schemas import AssistantEntity
+from sqlalchemy.ext.asyncio import AsyncSession
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStatsResult:
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class TTLCache(Generic[K, V]):
+    """Bounded in-process cache: entries expire after `ttl` seconds, the least recently used
+    is evicted first."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        # `ttl` overrides the cache-wide one, for entries that already aged elsewhere
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> CacheStatsResult:
+        lookups = self.hits + self.misses
+        return CacheStatsResult(
+            size=len(self._entries),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+        )
+
+
+class AssistantCache(TTLCache[str, AssistantEntity | List[AssistantEntity]]):
+    """Process-wide cache of assistant rows, keyed by assistant id plus one key for the full list.
+
+    With a PgChannel, a change made in one worker invalidates the entries of every worker.
+    """
+
+    ALL_ASSISTANTS_KEY = "__all__"
+
+    def __init__(self, max_size: int, ttl: float, channel: PgChannel | None = None) -> None:
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.channel = channel
+        if channel is not None:
+            channel.subscribe(ASSISTANT_TOPIC, self.invalidate_assistant)
+
+    def invalidate_assistant(self, assistant_id: str) -> None:
+        self.invalidate(assistant_id)
+        self.invalidate(self.ALL_ASSISTANTS_KEY)
+
+    async def changed(self, assistant_id: str) -> None:
+        """Invalidate the assistant here and in the other workers."""
+        self.invalidate_assistant(assistant_id)
+        if self.channel is not None:
+            await self.channel.notify(ASSISTANT_TOPIC, assistant_id)
+
+
+class CachedAssistantRepository(AssistantRepository):
+    """AssistantRepository that serves assistant lookups from AssistantCache."""
+
+    def __init__(self, session: AsyncSession, cache: AssistantCache) -> None:
+        super().__init__(session=session)
+        self.cache = cache
+
+    # READ
+    async def get_assistant(self, assistant_id: str) -> AssistantEntity | None:
+        assistant = self.cache.get(assistant_id)
+        if assistant is None:
+            assistant = await super().get_assistant(assistant_id)
+            if assistant is not None:
+                self.cache.set(assistant_id, assistant)
+        return assistant
+
+    async def list_assistants(self) -> List[AssistantEntity]:
+        assistants = self.cache.get(AssistantCache.ALL_ASSISTANTS_KEY)
+        if assistants is None:
+            assistants = await super().list_assistants()
+            self.cache.set(AssistantCache.ALL_ASSISTANTS_KEY, assistants)
+        return assistants
+
+    # CREATE
+    async def create_assistant(
+        self, assistant: AssistantEntity
+    ) -> AssistantEntity | None:
+        created = await super().create_assistant(assistant)
+        await self.cache.changed(assistant.id)
+        return created
+
+    # DELETE
+    async def delete_assistant(
+        self, assistant_id: str
+    ) -> AssistantEntity | None:
+        deleted = await super().delete_assistant(assistant_id)
+        await self.cache.changed(assistant_id)
+        return deleted
+
+    # UPDATE
+    async def update_assistant(
+        self,
+        assistant_id: str,
+        answer_cache_enabled: bool | None = None,
+        context_max_tokens: int | None = None,
+        context_summarize: bool | None = None,
+    ) -> AssistantEntity | None:
+        updated = await super().update_assistant(
+            assistant_id, answer_cache_enabled, context_max_tokens, context_summarize
+        )
+        await self.cache.changed(assistant_id)
+        return updated
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+from typing import Dict, List
+
+from pydantic.dataclasses import dataclass
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from coding_assistant.assistant.models import (
+    AssistantMessageItem,
+    AssistantMessageValue,
+    ThreadContext,
+)
+from coding_assistant.assistant.pagination import PageCursor, PageOrder
+from coding_assistant.assistant.repository import AssistantRepository, IAssistantRepository
+from coding_assistant.assistant.schemas import (
+    AssistantEntity,
+    AssistantMessageEntity,
+    LlmBackend,
+    ThreadSummaryEntity,
+)
+from coding_assistant.llms.constants import FALLBACK_MESSAGE_PREFIX
+from coding_assistant.llms.llm import LlmBackends
+from coding_assistant.llms.tokens import TokenCounter
+from coding_assistant.telemetry import log_context, timed
+from coding_assistant.telemetry.logs import detach_log_context
+from coding_assistant.telemetry.metrics import CONTEXT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ContextConfig:
+    # messages read for a turn's history, however few tokens they have
+    max_messages: int = 200
+    # a summary is (re)written once this many tokens are left out of the context
+    # and not summarised yet
+    summarize_after_tokens: int = 1000
+    summary_max_tokens: int = 500
+    # tokens of messages folded into the summary by one call
+    summary_input_tokens: int = 6000
+
+
+def _text(entity: AssistantMessageEntity) -> str:
+    return entity.content.get("message", "")
+
+
+def _key(entity: AssistantMessageEntity) -> tuple:
+    return (entity.created_at, entity.id)
+
+
+class ThreadContextBuilder:
+    """Token-budgeted history of a thread for each turn.
+
+    The latest messages are kept up to the assistant's `context_max_tokens`. The ones
+    before them are represented by a running summary, written in the background.
+    """
+
+    def __init__(
+        self,
+        config: ContextConfig,
+        tokens: TokenCounter,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        llms: LlmBackends,
+    ) -> None:
+        self.config = config
+        self.tokens = tokens
+        self.sessionmaker = sessionmaker
+        self.llms = llms
+        self._summaries: Dict[str, asyncio.Task] = {}
+
+    def count(self, messages: List[AssistantMessageItem]) -> None:
+        """Set the token count of the messages about to be saved."""
+        for message in messages:
+            if message.token_count is None:
+                message.token_count = self.tokens.message(message.value.content.get("message", ""))
+
+    @timed("context.build")
+    async def build(
+        self, ar: IAssistantRepository, assistant: AssistantEntity, thread_id: str
+    ) -> ThreadContext:
+        # latest first, one more row than read to know whether the thread goes on
+        entities: List[AssistantMessageEntity] = await ar.list_messages(
+            thread_id, limit=self.config.max_messages + 1, order=PageOrder.Desc
+        )
+        summary: ThreadSummaryEntity | None = await ar.get_thread_summary(thread_id)
+
+        # 0 sends the whole thread, otherwise the summary is part of the budget
+        budget = assistant.context_max_tokens or None
+        if budget is not None and summary is not None:
+            budget = max(budget - summary.token_count, 0)
+
+        history: List[AssistantMessageEntity] = []
+        used = 0
+        left_out: List[AssistantMessageEntity] = []
+        for entity in entities[: self.config.max_messages]:
+            # fallback answers were never produced by the model
+            if entity.id.startswith(FALLBACK_MESSAGE_PREFIX):
+                continue
+            tokens = self._tokens(entity)
+            if left_out or (budget is not None and used + tokens > budget):
+                left_out.append(entity)
+                continue
+            used += tokens
+            history.append(entity)
+        truncated = len(left_out) > 0 or len(entities) > self.config.max_messages
+
+        if truncated and assistant.context_summarize:
+            self._summarize_if_behind(assistant, thread_id, summary, left_out)
+
+        context = ThreadContext(
+            history=[self._item(entity) for entity in reversed(history)],
+            summary=summary.summary if truncated and summary is not None else None,
+            truncated=truncated,
+        )
+        CONTEXT_TOKENS.observe(
+            used + (summary.token_count if context.summary is not None else 0)
+        )
+        return context
+
+    async def close(self) -> None:
+        """Cancel the summaries still being written."""
+        tasks = list(self._summaries.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _summarize_if_behind(
+        self,
+        assistant: AssistantEntity,
+        thread_id: str,
+        summary: ThreadSummaryEntity | None,
+        left_out: List[AssistantMessageEntity],
+    ) -> None:
+        if thread_id in self._summaries or len(left_out) == 0:
+            return
+        # only the left out messages the summary does not cover yet count
+        covered = (summary.until_created_at, summary.until_id) if summary is not None else None
+        behind = [entity for entity in left_out if covered is None or _key(entity) > covered]
+        if sum(self._tokens(entity) for entity in behind) < self.config.summarize_after_tokens:
+            return
+
+        # left_out is latest first: the newest message to fold in is its first one
+        until = behind[0]
+        task = asyncio.create_task(self._summarize(assistant, thread_id, _key(until)))
+        self._summaries[thread_id] = task
+        task.add_done_callback(lambda _: self._summaries.pop(thread_id, None))
+
+    @timed("context.summarize")
+    async def _summarize(self, assistant: AssistantEntity, thread_id: str, until: tuple) -> None:
+        detach_log_context()
+        with log_context(thread_id=thread_id):
+            try:
+                async with self.sessionmaker() as session:
+                    ar = AssistantRepository(session=session)
+                    previous = await ar.get_thread_summary(thread_id)
+                    cursor = (
+                        PageCursor(created_at=previous.until_created_at, id=previous.until_id)
+                        if previous is not None
+                        else None
+                    )
+                    entities = await ar.list_messages(
+                        thread_id, limit=self.config.max_messages, cursor=cursor
+                    )
+
+                    # oldest first, up to `until` and the input budget of one call
+                    messages: List[AssistantMessageEntity] = []
+                    used = 0
+                    for entity in entities:
+                        if _key(entity) > until:
+                            break
+                        tokens = self._tokens(entity)
+                        if messages and used + tokens > self.config.summary_input_tokens:
+                            break
+                        used += tokens
+                        messages.append(entity)
+                    if len(messages) == 0:
+                        return
+
+                    llm = self.llms[LlmBackend(assistant.backend)]
+                    text = await llm.summarize(
+                        assistant=assistant,
+                        summary=previous.summary if previous is not None else None,
+                        messages=[
+                            self._item(entity)
+                            for entity in messages
+                            if not entity.id.startswith(FALLBACK_MESSAGE_PREFIX)
+                        ],
+                        max_tokens=self.config.summary_max_tokens,
+                    )
+                    last = messages[-1]
+                    await ar.save_thread_summary(
+                        ThreadSummaryEntity(
+                            thread_id=thread_id,
+                            summary=text,
+                            token_count=self.tokens.count(text),
+                            until_created_at=last.created_at,
+                            until_id=last.id,
+                        )
+                    )
+                logger.info("summarised the thread", extra={"messages": len(messages)})
+            except Exception as e:
+                logger.warning("summarising the thread failed: %s", e)
+
+    def _tokens(self, entity: AssistantMessageEntity) -> int:
+        # rows saved before tokens were counted
+        if entity.token_count is None:
+            return self.tokens.message(_text(entity))
+        return entity.token_count
+
+    def _item(self, entity: AssistantMessageEntity) -> AssistantMessageItem:
+        return AssistantMessageItem(
+            id=entity.id,
+            role=entity.role,
+            created_at=entity.created_at,
+            value=AssistantMessageValue(type=entity.type, content=entity.content),
+            token_count=entity.token_count,
+        )
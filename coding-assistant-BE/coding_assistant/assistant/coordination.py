@@ -0,0 +1,391 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Set, TypeVar
+
+import asyncpg
+from pydantic.dataclasses import dataclass
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from coding_assistant.telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# first key of the two-key advisory locks held for threads, the second is hashtext(thread_id):
+# threads whose ids collide only share turns across workers
+THREAD_LOCK_NAMESPACE = 24929
+# notification payloads are "<topic>:<key>"
+THREAD_TOPIC = "thread"
+ASSISTANT_TOPIC = "assistant"
+JOB_TOPIC = "job"
+
+
+@dataclass
+class CoordinationConfig:
+    # "postgres" extends thread turns and cache invalidation to every worker on the database,
+    # "local" keeps them within the process
+    backend: str = "postgres"
+    channel: str = "coding_assistant"
+    # seconds between tries of a thread locked by another worker,
+    # in case its release notification is missed
+    lock_retry_interval: float = 1.0
+
+
+@dataclass
+class CoordinationStatsResult:
+    backend: str
+    connected: bool
+    locks_held: int
+    lock_waits: int
+    notifications: int
+
+
+class PgChannel:
+    """The worker's own Postgres connection for coordinating with the other workers.
+
+    It holds a session advisory lock for each thread with a turn running in this worker, so
+    that a turn on the same thread in another worker waits for it, and LISTENs for what the
+    others notify: released threads, changed assistants and finished jobs. Postgres drops the
+    locks of a worker whose connection goes away.
+    """
+
+    def __init__(self, config: CoordinationConfig, engine: AsyncEngine) -> None:
+        self.config = config
+        self.engine = engine
+        self._holder: AsyncConnection | None = None
+        self._connection: asyncpg.Connection | None = None
+        # one statement at a time on the connection
+        self._use = asyncio.Lock()
+        # set when the thread is released elsewhere, for the turn waiting on it here
+        self._released: Dict[str, asyncio.Event] = {}
+        self._held: Set[str] = set()
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        # counters
+        self.lock_waits = 0
+        self.notifications = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.backend == "postgres"
+
+    def subscribe(self, topic: str, callback: Callable[[str], None]) -> None:
+        """Call `callback` with the key of each notification on `topic`, from any worker."""
+        self._subscribers[topic].append(callback)
+
+    async def start(self) -> None:
+        """Connect and LISTEN now rather than on the first turn."""
+        if self.enabled:
+            async with self._use:
+                await self._connect()
+
+    async def close(self) -> None:
+        await self._disconnect()
+        self._held.clear()
+
+    async def lock_thread(self, thread_id: str) -> None:
+        """Wait until no other worker runs a turn on the thread, and hold it."""
+        if not self.enabled:
+            return
+        try:
+            while True:
+                released = self._released[thread_id] = asyncio.Event()
+                try:
+                    if await self._try_lock(thread_id):
+                        self._held.add(thread_id)
+                        return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # without Postgres the turn still runs, held in this worker only
+                    logger.warning(
+                        "locking the thread in Postgres failed: %s",
+                        e,
+                        extra={"thread_id": thread_id},
+                    )
+                    return
+                self.lock_waits += 1
+                try:
+                    await asyncio.wait_for(released.wait(), timeout=self.config.lock_retry_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._released.pop(thread_id, None)
+
+    async def unlock_thread(self, thread_id: str) -> None:
+        """Release the thread and wake the turn waiting on it in another worker."""
+        if thread_id not in self._held:
+            return
+        self._held.discard(thread_id)
+        # shielded: a lock left held would block the thread in every other worker
+        await asyncio.shield(self._unlock(thread_id))
+
+    async def notify(self, topic: str, key: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self._fetchval("SELECT pg_notify($1, $2)", self.config.channel, f"{topic}:{key}")
+        except Exception as e:
+            logger.warning("notifying %s %s failed: %s", topic, key, e)
+
+    def stats(self) -> CoordinationStatsResult:
+        return CoordinationStatsResult(
+            backend=self.config.backend,
+            connected=self._connection is not None and not self._connection.is_closed(),
+            locks_held=len(self._held),
+            lock_waits=self.lock_waits,
+            notifications=self.notifications,
+        )
+
+    async def _try_lock(self, thread_id: str) -> bool:
+        attempt = asyncio.ensure_future(
+            self._fetchval(
+                "SELECT pg_try_advisory_lock($1, hashtext($2))", THREAD_LOCK_NAMESPACE, thread_id
+            )
+        )
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            # the lock may still be taken once the turn is gone, give it back then
+            def release(attempt: asyncio.Future) -> None:
+                if not attempt.cancelled() and attempt.exception() is None and attempt.result():
+                    asyncio.ensure_future(self._unlock(thread_id))
+
+            attempt.add_done_callback(release)
+            raise
+
+    async def _unlock(self, thread_id: str) -> None:
+        try:
+            await self._fetchval(
+                "SELECT pg_advisory_unlock($1, hashtext($2)), pg_notify($3, $4)",
+                THREAD_LOCK_NAMESPACE,
+                thread_id,
+                self.config.channel,
+                f"{THREAD_TOPIC}:{thread_id}",
+            )
+        except Exception as e:
+            # a lost connection released it already
+            logger.warning(
+                "unlocking the thread in Postgres failed: %s", e, extra={"thread_id": thread_id}
+            )
+
+    async def _fetchval(self, query: str, *args: Any) -> Any:
+        async with self._use:
+            if self._connection is None or self._connection.is_closed():
+                await self._connect()
+            return await self._connection.fetchval(query, *args)
+
+    async def _connect(self) -> None:
+        if self._connection is not None and not self._connection.is_closed():
+            return
+        if len(self._held) > 0:
+            logger.warning(
+                "the coordination connection was lost with %d threads locked", len(self._held)
+            )
+            self._held.clear()
+        await self._disconnect()
+        # opened like the engine's connections, then taken out of the pool,
+        # which opens another in its place
+        self._holder = await self.engine.connect()
+        raw = await self._holder.get_raw_connection()
+        self._connection = raw.driver_connection
+        raw.detach()
+        await self._connection.add_listener(self.config.channel, self._on_notification)
+
+    async def _disconnect(self) -> None:
+        holder, self._holder, self._connection = self._holder, None, None
+        if holder is not None:
+            try:
+                await holder.close()
+            except Exception as e:
+                logger.warning("closing the coordination connection failed: %s", e)
+
+    def _on_notification(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        self.notifications += 1
+        topic, _, key = payload.partition(":")
+        if topic == THREAD_TOPIC and key in self._released:
+            self._released[key].set()
+        for callback in self._subscribers[topic]:
+            try:
+                callback(key)
+            except Exception as e:
+                logger.warning("handling the %s notification failed: %s", topic, e)
+
+
+class TurnCancelled(Exception):
+    """The streamed turn a caller joined was cancelled before it finished."""
+
+
+class _SharedTurn:
+    """The latest turn queued on a thread, while it is queued or running: an identical message
+    right behind it shares its outcome and, replayed from the start, its events."""
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        # the events so far, the outcome last: a turn that is not streamed has only that one
+        self.events: List[Any] = []
+        self.outcome: asyncio.Future = asyncio.get_running_loop().create_future()
+        # the outcome may have no joiner to retrieve it
+        self.outcome.add_done_callback(lambda f: f.cancelled() or f.exception())
+        # replaced by a new one each time it is set
+        self._changed = asyncio.Event()
+
+    def add(self, event: Any) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def finish(self) -> None:
+        self.outcome.set_result(self.events[-1])
+        self._notify()
+
+    def fail(self, e: Exception) -> None:
+        self.outcome.set_exception(e)
+        self._notify()
+
+    def cancel(self) -> None:
+        if not self.outcome.done():
+            self.outcome.cancel()
+            self._notify()
+
+    async def replay(self) -> AsyncIterator[Any]:
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.outcome.done():
+                break
+            await changed.wait()
+        if self.outcome.cancelled():
+            raise TurnCancelled()
+        if self.outcome.exception() is not None:
+            raise self.outcome.exception()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class _ThreadTurns:
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        # callers holding or waiting for the lock
+        self.users = 0
+        self.last: _SharedTurn | None = None
+
+
+class ThreadCoordinator:
+    """Runs the turns of a thread one at a time, in arrival order, and coalesces back-to-back
+    identical messages, streamed or not.
+
+    With a PgChannel the turns are also one at a time across workers: once its turn comes in
+    this worker, a turn waits for the thread's advisory lock.
+    """
+
+    def __init__(self, channel: PgChannel | None = None) -> None:
+        self.channel = channel
+        self._threads: Dict[str, _ThreadTurns] = {}
+
+    async def run(self, thread_id: str, message: str, work: Callable[[], Awaitable[T]]) -> T:
+        """Run `work` as a turn of the thread, or join the latest one queued if it has
+        the same message."""
+        joined = self._joinable(thread_id, message)
+        if joined is not None:
+            return await asyncio.shield(joined.outcome)
+
+        turns = self._enter(thread_id)
+        shared = turns.last = _SharedTurn(message)
+        try:
+            async with self._locked(thread_id, turns):
+                try:
+                    shared.add(await work())
+                    shared.finish()
+                except Exception as e:
+                    shared.fail(e)
+        finally:
+            # cancelled while queued or running: joiners are cancelled too
+            shared.cancel()
+            self._forget(thread_id, turns, shared)
+        return shared.outcome.result()
+
+    async def stream(
+        self, thread_id: str, message: str, work: Callable[[], AsyncIterator[T]]
+    ) -> AsyncIterator[T]:
+        """Stream the events of `work` run as a turn of the thread, or those of the latest one
+        queued if it has the same message: the events it sent already are replayed first.
+
+        The last event is the outcome, shared with the callers of `run` joining the turn.
+        Closing the stream that runs the turn cancels it, with TurnCancelled in the streams
+        joining it.
+        """
+        joined = self._joinable(thread_id, message)
+        if joined is not None:
+            async with aclosing(joined.replay()) as events:
+                async for event in events:
+                    yield event
+            return
+
+        turns = self._enter(thread_id)
+        shared = turns.last = _SharedTurn(message)
+        try:
+            async with self._locked(thread_id, turns):
+                try:
+                    async with aclosing(work()) as events:
+                        async for event in events:
+                            shared.add(event)
+                            yield event
+                    shared.finish()
+                except Exception as e:
+                    shared.fail(e)
+                    raise
+        finally:
+            shared.cancel()
+            self._forget(thread_id, turns, shared)
+
+    @asynccontextmanager
+    async def _locked(self, thread_id: str, turns: _ThreadTurns) -> AsyncIterator[None]:
+        # time spent queued behind earlier turns of the thread,
+        # in this worker and then in the others
+        with stage("thread.wait"):
+            await turns.lock.acquire()
+            if self.channel is not None:
+                try:
+                    await self.channel.lock_thread(thread_id)
+                except BaseException:
+                    turns.lock.release()
+                    raise
+        try:
+            yield
+        finally:
+            try:
+                if self.channel is not None:
+                    await self.channel.unlock_thread(thread_id)
+            finally:
+                turns.lock.release()
+
+    def in_flight(self) -> int:
+        return len(self._threads)
+
+    def _joinable(self, thread_id: str, message: str) -> _SharedTurn | None:
+        turns = self._threads.get(thread_id)
+        if turns is not None and turns.last is not None and turns.last.message == message:
+            return turns.last
+        return None
+
+    def _forget(self, thread_id: str, turns: _ThreadTurns, shared: _SharedTurn) -> None:
+        if turns.last is shared:
+            turns.last = None
+        self._leave(thread_id, turns)
+
+    def _enter(self, thread_id: str) -> _ThreadTurns:
+        turns = self._threads.setdefault(thread_id, _ThreadTurns())
+        turns.users += 1
+        return turns
+
+    def _leave(self, thread_id: str, turns: _ThreadTurns) -> None:
+        turns.users -= 1
+        if turns.users == 0:
+            del self._threads[thread_id]
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+from enum import Enum
+from typing import List
+
+from pydantic.dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from coding_assistant.assistant.batch import fan_out
+from coding_assistant.assistant.schemas import LlmBackend
+from coding_assistant.llms.llm import LlmBackends
+from coding_assistant.telemetry import timed
+from coding_assistant.telemetry.logs import detach_log_context
+from coding_assistant.telemetry.metrics import LLM_DELETIONS
+
+logger = logging.getLogger(__name__)
+
+
+class DeletionKind(Enum):
+    Thread = "thread"
+    Assistant = "assistant"
+
+
+@dataclass
+class DeletionConfig:
+    workers: int = 4
+    # rows claimed per round, deleted `workers` at a time
+    batch_size: int = 50
+    # seconds between looks at the queue when it is idle, for rows queued by other workers
+    poll_interval: float = 5.0
+    item_timeout: float = 30.0
+    max_attempts: int = 8
+    # delay before retry n is backoff_initial * 2^(n-1), capped at backoff_max
+    backoff_initial: float = 2.0
+    backoff_max: float = 600.0
+    # a claimed row is offered again after this many seconds if its worker died
+    lease: float = 120.0
+
+
+@dataclass
+class DeletionQueueStatsResult:
+    pending: int
+    retrying: int
+    given_up: int
+    deleted: int
+    failed: int
+
+
+@dataclass
+class _Deletion:
+    id: int
+    backend: str
+    kind: str
+    remote_id: str
+    attempts: int
+
+
+class DeletionQueue:
+    """Deletes threads and assistants on the LLM side from the llm_deletion table.
+
+    Rows are queued in the statement deleting the local ones, so the request never
+    waits on the LLM. Claims use SKIP LOCKED and a lease, several workers can share the table.
+    """
+
+    def __init__(self, config: DeletionConfig, engine: AsyncEngine, llms: LlmBackends) -> None:
+        self.config = config
+        self.engine = engine
+        self.llms = llms
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # counters
+        self.deleted = 0
+        self.failed = 0
+
+    def wake(self) -> None:
+        """Work the queue now, starting the worker if needed."""
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._work_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stats(self) -> DeletionQueueStatsResult:
+        query = """
+        SELECT count(*) FILTER (WHERE next_attempt_at IS NOT NULL),
+               count(*) FILTER (WHERE next_attempt_at IS NOT NULL AND last_error IS NOT NULL),
+               count(*) FILTER (WHERE next_attempt_at IS NULL)
+        FROM llm_deletion
+        """
+        async with self.engine.connect() as connection:
+            pending, retrying, given_up = (await connection.execute(text(query))).one()
+        return DeletionQueueStatsResult(
+            pending=pending,
+            retrying=retrying,
+            given_up=given_up,
+            deleted=self.deleted,
+            failed=self.failed,
+        )
+
+    async def _work_loop(self) -> None:
+        # the loop serves every request, not the one that happened to start it
+        detach_log_context()
+        while True:
+            self._wakeup.clear()
+            try:
+                claimed = await self.work_once()
+            except Exception as e:
+                logger.warning("working the deletion queue failed: %s", e)
+                claimed = 0
+            if claimed < self.config.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.config.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    @timed("deletion.work_once")
+    async def work_once(self) -> int:
+        """Claim a batch of due rows and delete them on the LLM side. Returns the rows claimed."""
+        deletions = await self._claim()
+        if len(deletions) == 0:
+            return 0
+
+        done: List[_Deletion] = []
+        failed: List[tuple[_Deletion, Exception]] = []
+        async for i, result in fan_out(
+            len(deletions),
+            lambda i: self._delete(deletions[i]),
+            self.config.workers,
+            self.config.item_timeout,
+        ):
+            if isinstance(result, Exception):
+                failed.append((deletions[i], result))
+            else:
+                done.append(deletions[i])
+
+        await self._finish(done, failed)
+        return len(deletions)
+
+    async def _claim(self) -> List[_Deletion]:
+        query = """
+        UPDATE llm_deletion
+        SET attempts = attempts + 1,
+            next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => :lease)
+        WHERE id IN (
+            SELECT id FROM llm_deletion
+            WHERE next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, backend, kind, remote_id, attempts
+        """
+        parameters = {"lease": self.config.lease, "limit": self.config.batch_size}
+        async with self.engine.begin() as connection:
+            rows = (await connection.execute(text(query), parameters)).fetchall()
+        return [_Deletion(*row) for row in rows]
+
+    async def _delete(self, deletion: _Deletion) -> None:
+        llm = self.llms[LlmBackend(deletion.backend)]
+        if DeletionKind(deletion.kind) == DeletionKind.Assistant:
+            await llm.delete_assistant(deletion.remote_id)
+        else:
+            await llm.delete_thread(deletion.remote_id)
+
+    async def _finish(
+        self, done: List[_Deletion], failed: List[tuple[_Deletion, Exception]]
+    ) -> None:
+        retries = []
+        for deletion, error in failed:
+            give_up = deletion.attempts >= self.config.max_attempts
+            delay = min(
+                self.config.backoff_initial * 2 ** (deletion.attempts - 1), self.config.backoff_max
+            )
+            retries.append(
+                {"id": deletion.id, "delay": None if give_up else delay, "error": repr(error)}
+            )
+            outcome = "given_up" if give_up else "retried"
+            LLM_DELETIONS.labels(kind=deletion.kind, outcome=outcome).inc()
+            (logger.error if give_up else logger.warning)(
+                "deleting on the LLM side failed: %r",
+                error,
+                extra={
+                    "kind": deletion.kind,
+                    "remote_id": deletion.remote_id,
+                    "attempts": deletion.attempts,
+                },
+            )
+        for deletion in done:
+            LLM_DELETIONS.labels(kind=deletion.kind, outcome="deleted").inc()
+        self.deleted += len(done)
+        self.failed += len(failed)
+
+        async with self.engine.begin() as connection:
+            if len(done) > 0:
+                await connection.execute(
+                    text("DELETE FROM llm_deletion WHERE id = ANY(:ids)"),
+                    {"ids": [deletion.id for deletion in done]},
+                )
+            if len(retries) > 0:
+                # NULL delay: attempts are used up, the row stays without a next attempt
+                await connection.execute(
+                    text(
+                        """
+                        UPDATE llm_deletion
+                        SET next_attempt_at = CURRENT_TIMESTAMP
+                                + make_interval(secs => CAST(:delay AS DOUBLE PRECISION)),
+                            last_error = :error
+                        WHERE id = :id
+                        """
+                    ),
+                    retries,
+                )
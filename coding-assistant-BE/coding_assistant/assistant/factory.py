@@ -0,0 +1,51 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from coding_assistant.assistant.answercache import AnswerCache
+from coding_assistant.assistant.cache import AssistantCache, CachedAssistantRepository
+from coding_assistant.assistant.context import ThreadContextBuilder
+from coding_assistant.assistant.coordination import ThreadCoordinator
+from coding_assistant.assistant.deletion import DeletionQueue
+from coding_assistant.assistant.service import AssistantService, IAssistantService
+from coding_assistant.assistant.schemas import LlmBackend
+from coding_assistant.llms.llm import LlmBackends
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+class AssistantServiceFactory:
+    """Builds AssistantService instances, for requests and for work done outside of a request."""
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        cache: AssistantCache,
+        llms: LlmBackends,
+        coordinator: ThreadCoordinator,
+        answers: AnswerCache,
+        contexts: ThreadContextBuilder,
+        deletions: DeletionQueue,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.cache = cache
+        self.llms = llms
+        self.coordinator = coordinator
+        self.answers = answers
+        self.contexts = contexts
+        self.deletions = deletions
+
+    def build(self, session: AsyncSession) -> IAssistantService:
+        return AssistantService(
+            ar=CachedAssistantRepository(session=session, cache=self.cache),
+            llm=self.llms[LlmBackend.Assistants],
+            backends=self.llms,
+            contexts=self.contexts,
+            coordinator=self.coordinator,
+            answers=self.answers,
+            deletions=self.deletions,
+        )
+
+    @asynccontextmanager
+    async def create(self) -> AsyncIterator[IAssistantService]:
+        """Service on its own session, closed on exit."""
+        async with self.sessionmaker() as session:
+            yield self.build(session)
@@ -0,0 +1,298 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Protocol, Tuple
+
+from pydantic import TypeAdapter
+from pydantic.dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from coding_assistant.assistant.coordination import JOB_TOPIC, PgChannel
+from coding_assistant.assistant.factory import AssistantServiceFactory
+from coding_assistant.assistant.models import (
+    CreateThreadResult,
+    JobResult,
+    JobStatus,
+    SendMessageResult,
+)
+from coding_assistant.assistant.service import IAssistantService
+from coding_assistant.telemetry import log_context
+from coding_assistant.telemetry.logs import detach_log_context
+
+logger = logging.getLogger(__name__)
+
+JobWork = Callable[[IAssistantService], Awaitable[CreateThreadResult | SendMessageResult]]
+
+_RESULT = TypeAdapter(CreateThreadResult | SendMessageResult)
+SHUTDOWN_ERROR = "The server shut down before the job finished"
+
+
+@dataclass
+class JobConfig:
+    # "postgres" lets every worker answer for a job, "memory" only the one that accepted it
+    store: str = "postgres"
+    workers: int = 8
+    queue_size: int = 1000
+    # finished jobs are kept this many seconds for GET .../jobs/{id}
+    retention: float = 600.0
+    max_wait: float = 30.0
+    # seconds between reads of a job being waited for, in case its notification is missed
+    poll_interval: float = 1.0
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class IJobStore(Protocol):
+    async def save(self, job: JobResult, assistant_id: str) -> None:
+        pass
+
+    async def get(self, job_id: str, assistant_id: str) -> JobResult | None:
+        """The job, None unless it was submitted for `assistant_id`."""
+        pass
+
+    async def delete(self, job_id: str) -> None:
+        pass
+
+    async def evict(self, finished_before: datetime) -> None:
+        pass
+
+
+class InMemoryJobStore:
+    def __init__(self) -> None:
+        self._jobs: Dict[str, Tuple[str, JobResult]] = {}
+
+    async def save(self, job: JobResult, assistant_id: str) -> None:
+        # a copy: the worker goes on updating its own
+        self._jobs[job.id] = (assistant_id, dataclasses.replace(job))
+
+    async def get(self, job_id: str, assistant_id: str) -> JobResult | None:
+        owner, job = self._jobs.get(job_id, (None, None))
+        return job if owner == assistant_id else None
+
+    async def delete(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+
+    async def evict(self, finished_before: datetime) -> None:
+        expired = [
+            job_id
+            for job_id, (_, job) in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < finished_before
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class PostgresJobStore:
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+
+    async def save(self, job: JobResult, assistant_id: str) -> None:
+        query = """
+            INSERT INTO assistant_job
+                (id, assistant_id, status, result, error, created_at, finished_at)
+            VALUES (:id, :assistant_id, :status, :result, :error, :created_at, :finished_at)
+            ON CONFLICT (id) DO UPDATE
+            SET status = EXCLUDED.status,
+                result = EXCLUDED.result,
+                error = EXCLUDED.error,
+                finished_at = EXCLUDED.finished_at
+        """
+        parameters = {
+            "id": job.id,
+            "assistant_id": assistant_id,
+            "status": job.status.value,
+            "result": (
+                None
+                if job.result is None
+                else json.dumps(_RESULT.dump_python(job.result, mode="json"))
+            ),
+            "error": job.error,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        }
+        async with self.engine.begin() as conn:
+            await conn.execute(text(query), parameters)
+
+    async def get(self, job_id: str, assistant_id: str) -> JobResult | None:
+        query = """
+            SELECT id, status, created_at, finished_at, result, error FROM assistant_job
+            WHERE id = :id AND assistant_id = :assistant_id
+        """
+        parameters = {"id": job_id, "assistant_id": assistant_id}
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(text(query), parameters)).fetchone()
+
+        if row is None:
+            return None
+        return JobResult(
+            id=row.id,
+            status=JobStatus(row.status),
+            created_at=row.created_at,
+            finished_at=row.finished_at,
+            result=None if row.result is None else _RESULT.validate_python(row.result),
+            error=row.error,
+        )
+
+    async def delete(self, job_id: str) -> None:
+        query = "DELETE FROM assistant_job WHERE id = :id"
+        async with self.engine.begin() as conn:
+            await conn.execute(text(query), {"id": job_id})
+
+    async def evict(self, finished_before: datetime) -> None:
+        query = "DELETE FROM assistant_job WHERE finished_at < :finished_before"
+        async with self.engine.begin() as conn:
+            await conn.execute(text(query), {"finished_before": finished_before})
+
+
+class _Job:
+    def __init__(self, work: JobWork, assistant_id: str) -> None:
+        self.assistant_id = assistant_id
+        self.result = JobResult(
+            id=f"job_{uuid.uuid4().hex}",
+            status=JobStatus.Pending,
+            created_at=datetime.now(),
+        )
+        self.work = work
+
+
+class JobManager:
+    """Runs service calls on a bounded pool of background workers, each on its own DB session.
+
+    A job runs in the worker that accepted it. Its state goes to the store, where any worker
+    reads it, and its end is notified on the channel, to whichever worker is waiting for it.
+    """
+
+    def __init__(
+        self,
+        factory: AssistantServiceFactory,
+        config: JobConfig,
+        store: IJobStore,
+        channel: PgChannel | None = None,
+    ) -> None:
+        self.factory = factory
+        self.config = config
+        self.store = store
+        self.channel = channel
+        # accepted here and not finished yet
+        self._jobs: Dict[str, _Job] = {}
+        # set when the job finishes, for the requests waiting for it here
+        self._waiting: Dict[str, List[asyncio.Event]] = defaultdict(list)
+        self._queue: asyncio.Queue[_Job] | None = None
+        self._workers: List[asyncio.Task] = []
+        if channel is not None:
+            channel.subscribe(JOB_TOPIC, self._wake)
+
+    async def submit(self, work: JobWork, assistant_id: str) -> JobResult:
+        self._ensure_workers()
+        if self._queue.full():
+            raise JobQueueFull()
+        await self.store.evict(datetime.now() - timedelta(seconds=self.config.retention))
+
+        job = _Job(work, assistant_id)
+        await self.store.save(job.result, assistant_id)
+        try:
+            # again: other jobs may have been queued while this one was saved
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            await self.store.delete(job.result.id)
+            raise JobQueueFull()
+        self._jobs[job.result.id] = job
+        return job.result
+
+    async def get(self, job_id: str, assistant_id: str, wait: float = 0) -> JobResult | None:
+        """Job state, None unless it was submitted for `assistant_id`; with `wait`,
+        long-polls up to that many seconds for it to finish."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, self.config.max_wait)
+        finished = asyncio.Event()
+        self._waiting[job_id].append(finished)
+        try:
+            while True:
+                # cleared before the read: a notification after it is not missed
+                finished.clear()
+                job = await self.store.get(job_id, assistant_id)
+                remaining = deadline - loop.time()
+                if job is None or job.finished_at is not None or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(
+                        finished.wait(), timeout=min(remaining, self.config.poll_interval)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiting[job_id].remove(finished)
+            if len(self._waiting[job_id]) == 0:
+                del self._waiting[job_id]
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        # no other worker runs the jobs left here: they would be pending forever
+        for job in list(self._jobs.values()):
+            job.result.status = JobStatus.Failed
+            job.result.error = SHUTDOWN_ERROR
+            await self._finish(job)
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.config.queue_size)
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.config.workers)
+            ]
+
+    async def _worker(self) -> None:
+        # workers outlive the request that started them
+        detach_log_context()
+        while True:
+            job = await self._queue.get()
+            job.result.status = JobStatus.Running
+            try:
+                # the job id stands in for the request id of the job's records
+                with log_context(request_id=job.result.id):
+                    await self._save(job)
+                    async with self.factory.create() as service:
+                        job.result.result = await job.work(service)
+                job.result.status = JobStatus.Completed
+            except Exception as e:
+                logger.warning("job failed: %s", e, extra={"request_id": job.result.id})
+                job.result.status = JobStatus.Failed
+                job.result.error = str(e)
+            finally:
+                self._queue.task_done()
+            # a job cut short by close() is finished there, one that ran is finished here
+            # even if close() comes meanwhile
+            await asyncio.shield(self._finish(job))
+
+    async def _finish(self, job: _Job) -> None:
+        job.result.finished_at = datetime.now()
+        self._jobs.pop(job.result.id, None)
+        await self._save(job)
+        self._wake(job.result.id)
+        if self.channel is not None:
+            await self.channel.notify(JOB_TOPIC, job.result.id)
+
+    async def _save(self, job: _Job) -> None:
+        try:
+            await self.store.save(job.result, job.assistant_id)
+        except Exception as e:
+            logger.warning("saving the job failed: %s", e, extra={"request_id": job.result.id})
+
+    def _wake(self, job_id: str) -> None:
+        for finished in self._waiting.get(job_id, []):
+            finished.set()
+
+
+if TYPE_CHECKING:
+    _: type[IJobStore] = InMemoryJobStore
+    __: type[IJobStore] = PostgresJobStore
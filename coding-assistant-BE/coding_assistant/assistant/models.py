@@ -2,13 +2,16 @@ from datetime import datetime
 from typing import Any, List
 from enum import Enum
 
+from pydantic import Field
 from pydantic.dataclasses import dataclass
 
 from coding_assistant.assistant.schemas import (
+    DEFAULT_CONTEXT_MAX_TOKENS,
     AssistantEntity,
     AssistantThreadEntity,
     Role,
     AssistantMessageType,
+    LlmBackend,
 )
 
 class ModelType(Enum):
@@ -27,6 +30,40 @@ class AssistantMessageItem:
     role: Role
     created_at: datetime
     value: AssistantMessageValue
+    # tokens of the message in a prompt, set when it is saved
+    token_count: int | None = None
+
+
+# For LLM turns
+@dataclass
+class ThreadContext:
+    # latest messages of the thread that fit the assistant's token budget, oldest first
+    history: List[AssistantMessageItem]
+    # stands for the messages left out of `history`, None until they are summarised
+    summary: str | None = None
+    # whether older messages were left out of `history`
+    truncated: bool = False
+
+
+# For streaming
+class StreamEventType(Enum):
+    Delta = "delta"
+    Completed = "completed"
+
+
+@dataclass
+class AssistantMessageDelta:
+    id: str
+    role: Role
+    text: str
+
+
+@dataclass
+class AssistantStreamEvent:
+    type: StreamEventType
+    delta: AssistantMessageDelta | None = None
+    # set on the Completed event: the user message followed by the responses
+    messages: List[AssistantMessageItem] | None = None
 
 
 # For GET requests
@@ -37,11 +74,15 @@ class InitAssistantResult:
 @dataclass
 class ListThreadsResult:
     threads: List[AssistantThreadEntity]
+    # cursor of the next page, None when there are no more rows
+    next_cursor: str | None = None
 
 
 @dataclass
 class ListMessageResult:
     messages: List[AssistantMessageItem]
+    # cursor of the next page, None when there are no more rows
+    next_cursor: str | None = None
 
 
 # For POST requests
@@ -50,6 +91,10 @@ class CreateAssistantParams:
     name: str 
     instructions: str
     model: str
+    backend: LlmBackend = LlmBackend.Assistants
+    # 0 sends the whole thread
+    context_max_tokens: int = DEFAULT_CONTEXT_MAX_TOKENS
+    context_summarize: bool = True
 
 
 @dataclass
@@ -79,6 +124,38 @@ class SendMessageResult:
     messages: List[AssistantMessageItem]
 
 
+@dataclass
+class CreateThreadsBatchParams:
+    # first messages, each answered in a new thread
+    messages: List[str]
+    # lower the server's limits for this batch
+    concurrency: int | None = Field(default=None, gt=0)
+    item_timeout: float | None = Field(default=None, gt=0)
+
+
+class BatchItemStatus(Enum):
+    Completed = "completed"
+    Failed = "failed"
+    TimedOut = "timed_out"
+
+
+@dataclass
+class BatchItemResult:
+    # position of the message in the request
+    index: int
+    status: BatchItemStatus
+    thread: AssistantThreadEntity | None = None
+    messages: List[AssistantMessageItem] | None = None
+    error: str | None = None
+
+
+@dataclass
+class BatchResult:
+    completed: int
+    failed: int
+    timed_out: int
+
+
 # For DELETE requests
 @dataclass
 class DeleteAssistantResult:
@@ -90,7 +167,31 @@ class DeleteThreadResult:
     thread: AssistantThreadEntity
 
 
+@dataclass
+class DeleteThreadsParams:
+    thread_ids: List[str]
+
+
+@dataclass
+class DeleteThreadsResult:
+    # the threads found and deleted, in no particular order
+    threads: List[AssistantThreadEntity]
+
+
 # For PATCH requests
+@dataclass
+class UpdateAssistantParams:
+    # fields left out are not changed
+    answer_cache_enabled: bool | None = None
+    context_max_tokens: int | None = None
+    context_summarize: bool | None = None
+
+
+@dataclass
+class UpdateAssistantResult:
+    assistant: AssistantEntity
+
+
 @dataclass
 class UpdateThreadParams:
     name: str
@@ -99,3 +200,21 @@ class UpdateThreadParams:
 @dataclass
 class UpdateThreadResult:
     thread: AssistantThreadEntity
+
+
+# For jobs
+class JobStatus(Enum):
+    Pending = "pending"
+    Running = "running"
+    Completed = "completed"
+    Failed = "failed"
+
+
+@dataclass
+class JobResult:
+    id: str
+    status: JobStatus
+    created_at: datetime
+    finished_at: datetime | None = None
+    result: CreateThreadResult | SendMessageResult | None = None
+    error: str | None = None
@@ -1,24 +1,201 @@
 from typing import Dict
-from openai import AzureOpenAI
-from coding_assistant.assistant.repository import (
-    AssistantRepository,
-    IAssistantRepository,
+from environs import Env
+from coding_assistant.assistant.answercache import AnswerCache, AnswerCacheConfig
+from coding_assistant.assistant.batch import BatchConfig
+from coding_assistant.assistant.cache import AssistantCache, CachedAssistantRepository
+from coding_assistant.assistant.context import ContextConfig, ThreadContextBuilder
+from coding_assistant.assistant.coordination import (
+    CoordinationConfig,
+    PgChannel,
+    ThreadCoordinator,
 )
-from coding_assistant.assistant.service import AssistantService, IAssistantService
-from coding_assistant.llms.llm import LLM
-from injector import Module, provider
-from sqlalchemy.orm import Session
+from coding_assistant.assistant.deletion import DeletionConfig, DeletionQueue
+from coding_assistant.assistant.factory import AssistantServiceFactory
+from coding_assistant.assistant.jobs import (
+    IJobStore,
+    InMemoryJobStore,
+    JobConfig,
+    JobManager,
+    PostgresJobStore,
+)
+from coding_assistant.assistant.repository import IAssistantRepository
+from coding_assistant.assistant.service import IAssistantService
+from coding_assistant.assistant.transfer import HistoryTransfer, TransferConfig
+from coding_assistant.llms.llm import LlmBackends
+from coding_assistant.llms.tokens import TokenCounter
+from injector import Module, provider, singleton
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
 
 class AssistantModule(Module):
     @provider
     def provide_assistant_service(
-        self, ar: IAssistantRepository, llm: LLM
+        self, session: AsyncSession, factory: AssistantServiceFactory
     ) -> IAssistantService:
-        return AssistantService(ar=ar, llm=llm)
+        return factory.build(session)
+
+    @singleton
+    @provider
+    def provide_assistant_service_factory(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        cache: AssistantCache,
+        llms: LlmBackends,
+        coordinator: ThreadCoordinator,
+        answers: AnswerCache,
+        contexts: ThreadContextBuilder,
+        deletions: DeletionQueue,
+    ) -> AssistantServiceFactory:
+        return AssistantServiceFactory(
+            sessionmaker=sessionmaker,
+            cache=cache,
+            llms=llms,
+            coordinator=coordinator,
+            answers=answers,
+            contexts=contexts,
+            deletions=deletions,
+        )
+
+    @provider
+    def provide_coordination_config(self, env: Env) -> CoordinationConfig:
+        return CoordinationConfig(
+            backend=env.str("COORDINATION_BACKEND", default="postgres"),
+            lock_retry_interval=env.float("COORDINATION_LOCK_RETRY_INTERVAL", default=1),
+        )
+
+    @singleton
+    @provider
+    def provide_pg_channel(self, config: CoordinationConfig, engine: AsyncEngine) -> PgChannel:
+        return PgChannel(config=config, engine=engine)
+
+    @singleton
+    @provider
+    def provide_thread_coordinator(self, channel: PgChannel) -> ThreadCoordinator:
+        return ThreadCoordinator(channel=channel if channel.enabled else None)
+
+    @singleton
+    @provider
+    def provide_assistant_cache(self, env: Env, channel: PgChannel) -> AssistantCache:
+        return AssistantCache(
+            max_size=env.int("ASSISTANT_CACHE_MAX_SIZE", default=1024),
+            ttl=env.float("ASSISTANT_CACHE_TTL", default=300),
+            channel=channel if channel.enabled else None,
+        )
+
+    @provider
+    def provide_answer_cache_config(self, env: Env) -> AnswerCacheConfig:
+        return AnswerCacheConfig(
+            enabled=env.bool("ANSWER_CACHE_ENABLED", default=True),
+            store=env.str("ANSWER_CACHE_STORE", default="postgres"),
+            ttl=env.float("ANSWER_CACHE_TTL", default=86_400),
+            memory_max_size=env.int("ANSWER_CACHE_MEMORY_MAX_SIZE", default=1024),
+            max_rows=env.int("ANSWER_CACHE_MAX_ROWS", default=100_000),
+        )
+
+    @singleton
+    @provider
+    def provide_answer_cache(
+        self, config: AnswerCacheConfig, engine: AsyncEngine
+    ) -> AnswerCache:
+        return AnswerCache(config=config, engine=engine)
+
+    @provider
+    def provide_transfer_config(self, env: Env) -> TransferConfig:
+        return TransferConfig(
+            export_batch_size=env.int("HISTORY_EXPORT_BATCH_SIZE", default=1000),
+            import_batch_size=env.int("HISTORY_IMPORT_BATCH_SIZE", default=5000),
+        )
+
+    @singleton
+    @provider
+    def provide_history_transfer(
+        self, config: TransferConfig, engine: AsyncEngine, cache: AssistantCache
+    ) -> HistoryTransfer:
+        return HistoryTransfer(config=config, engine=engine, cache=cache)
+
+    @provider
+    def provide_batch_config(self, env: Env) -> BatchConfig:
+        return BatchConfig(
+            max_items=env.int("BATCH_MAX_ITEMS", default=100),
+            concurrency=env.int("BATCH_CONCURRENCY", default=8),
+            item_timeout=env.float("BATCH_ITEM_TIMEOUT", default=120),
+        )
+
+    @provider
+    def provide_context_config(self, env: Env) -> ContextConfig:
+        return ContextConfig(
+            max_messages=env.int("CONTEXT_MAX_MESSAGES", default=200),
+            summarize_after_tokens=env.int("CONTEXT_SUMMARIZE_AFTER_TOKENS", default=1000),
+            summary_max_tokens=env.int("CONTEXT_SUMMARY_MAX_TOKENS", default=500),
+        )
+
+    # one instance, so that a thread is summarised by one task at a time
+    @singleton
+    @provider
+    def provide_thread_context_builder(
+        self,
+        config: ContextConfig,
+        tokens: TokenCounter,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        llms: LlmBackends,
+    ) -> ThreadContextBuilder:
+        return ThreadContextBuilder(
+            config=config, tokens=tokens, sessionmaker=sessionmaker, llms=llms
+        )
+
+    @provider
+    def provide_deletion_config(self, env: Env) -> DeletionConfig:
+        return DeletionConfig(
+            workers=env.int("DELETION_WORKERS", default=4),
+            batch_size=env.int("DELETION_BATCH_SIZE", default=50),
+            poll_interval=env.float("DELETION_POLL_INTERVAL", default=5),
+            max_attempts=env.int("DELETION_MAX_ATTEMPTS", default=8),
+            backoff_initial=env.float("DELETION_BACKOFF_INITIAL", default=2),
+            backoff_max=env.float("DELETION_BACKOFF_MAX", default=600),
+        )
+
+    @singleton
+    @provider
+    def provide_deletion_queue(
+        self, config: DeletionConfig, engine: AsyncEngine, llms: LlmBackends
+    ) -> DeletionQueue:
+        return DeletionQueue(config=config, engine=engine, llms=llms)
 
     @provider
     def provide_assistant_repository(
-        self, session: Session
+        self, session: AsyncSession, cache: AssistantCache
     ) -> IAssistantRepository:
-        return AssistantRepository(session=session)
+        return CachedAssistantRepository(session=session, cache=cache)
+
+    @provider
+    def provide_job_config(self, env: Env) -> JobConfig:
+        return JobConfig(
+            store=env.str("JOB_STORE", default="postgres"),
+            workers=env.int("JOB_WORKERS", default=8),
+            queue_size=env.int("JOB_QUEUE_SIZE", default=1000),
+            retention=env.float("JOB_RETENTION", default=600),
+            poll_interval=env.float("JOB_POLL_INTERVAL", default=1),
+        )
+
+    @singleton
+    @provider
+    def provide_job_store(self, config: JobConfig, engine: AsyncEngine) -> IJobStore:
+        if config.store == "postgres":
+            return PostgresJobStore(engine=engine)
+        return InMemoryJobStore()
+
+    @singleton
+    @provider
+    def provide_job_manager(
+        self,
+        factory: AssistantServiceFactory,
+        config: JobConfig,
+        store: IJobStore,
+        channel: PgChannel,
+    ) -> JobManager:
+        return JobManager(
+            factory=factory,
+            config=config,
+            store=store,
+            channel=channel if channel.enabled else None,
+        )
@@ -0,0 +1,51 @@
+import base64
+import json
+from datetime import datetime
+from enum import Enum
+
+from pydantic.dataclasses import dataclass
+
+MAX_PAGE_SIZE = 500
+
+
+class PageOrder(Enum):
+    # oldest first
+    Asc = "asc"
+    # latest first
+    Desc = "desc"
+
+
+@dataclass
+class PageCursor:
+    """Keyset position: the (created_at, id) of the last row of the previous page."""
+
+    created_at: datetime
+    id: str
+
+    def encode(self) -> str:
+        raw = json.dumps([self.created_at.isoformat(), self.id])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @classmethod
+    def decode(cls, value: str) -> "PageCursor":
+        try:
+            created_at, id = json.loads(base64.urlsafe_b64decode(value.encode()))
+            return cls(created_at=datetime.fromisoformat(created_at), id=id)
+        except Exception as e:
+            raise ValueError(f"Invalid cursor: {value}") from e
+
+
+def keyset_clause(cursor: PageCursor | None, order: PageOrder) -> tuple[str, dict]:
+    """SQL condition and parameters selecting the rows after `cursor` in `order`."""
+    if cursor is None:
+        return "TRUE", {}
+    operator = ">" if order == PageOrder.Asc else "<"
+    return (
+        f"(created_at, id) {operator} (:cursor_created_at, :cursor_id)",
+        {"cursor_created_at": cursor.created_at, "cursor_id": cursor.id},
+    )
+
+
+def order_clause(order: PageOrder) -> str:
+    direction = "ASC" if order == PageOrder.Asc else "DESC"
+    return f"ORDER BY created_at {direction}, id {direction}"
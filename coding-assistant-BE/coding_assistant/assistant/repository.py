@@ -1,17 +1,90 @@
 import json
-from typing import TYPE_CHECKING, List, Protocol
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncContextManager, AsyncIterator, List, Protocol
 
 from coding_assistant.assistant.models import AssistantMessageItem
+from coding_assistant.assistant.pagination import (
+    PageCursor,
+    PageOrder,
+    keyset_clause,
+    order_clause,
+)
 from coding_assistant.assistant.schemas import (
     AssistantEntity,
     AssistantMessageEntity,
     AssistantThreadEntity,
+    LlmBackend,
+    ThreadSummaryEntity,
 )
-from sqlalchemy.orm import Session
+from coding_assistant.telemetry import timed
+from sqlalchemy.engine import Result
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import text
 
+logger = logging.getLogger(__name__)
+
+CREATE_THREAD_QUERY = """
+    INSERT INTO assistant_thread (id, name, assistant_id, created_at)
+    VALUES (:id, :name, :assistant_id, :created_at)
+"""
+ASSISTANT_FIELDS = (
+    "id, name, created_at, instructions, model, answer_cache_enabled, backend, "
+    "context_max_tokens, context_summarize"
+)
+MESSAGE_COLUMNS = [
+    "id",
+    "assistant_id",
+    "thread_id",
+    "created_at",
+    "role",
+    "type",
+    "content",
+    "token_count",
+]
+ADD_MESSAGE_QUERY = f"""
+    INSERT INTO assistant_message ({", ".join(MESSAGE_COLUMNS)})
+    VALUES ({", ".join(f":{column}" for column in MESSAGE_COLUMNS)})
+"""
+
+# rows for the deletion queue, see coding_assistant.assistant.deletion
+QUEUE_DELETIONS_QUERY = "INSERT INTO llm_deletion (backend, kind, remote_id)"
+QUEUE_DELETED_THREADS_QUERY = f"""
+    {QUEUE_DELETIONS_QUERY}
+    SELECT a.backend, 'thread', d.id FROM deleted d JOIN assistant a ON a.id = d.assistant_id
+    ON CONFLICT (kind, remote_id) DO NOTHING
+"""
+
+
+
+def _message_row(assistant_id: str, thread_id: str, message: AssistantMessageItem) -> dict:
+    return {
+        "id": message.id,
+        "assistant_id": assistant_id,
+        "thread_id": thread_id,
+        "created_at": message.created_at,
+        "role": message.role.value,
+        "type": message.value.type.value,
+        "content": json.dumps(message.value.content),
+        "token_count": message.token_count,
+    }
+
+
+def _messages_values(rows: List[dict]) -> tuple[str, dict]:
+    # one multi-row VALUES list, its parameters suffixed with the row number
+    values = []
+    parameters = {}
+    for i, row in enumerate(rows):
+        values.append("(" + ", ".join(f":{column}_{i}" for column in MESSAGE_COLUMNS) + ")")
+        parameters.update({f"{column}_{i}": row[column] for column in MESSAGE_COLUMNS})
+    return ", ".join(values), parameters
+
 
 class IAssistantRepository(Protocol):
+    def unit_of_work(self) -> AsyncContextManager[None]:
+        pass
+
+
     # READ
     async def get_assistant(self, assistant_id: str) -> AssistantEntity | None:
         pass
@@ -20,12 +93,20 @@ class IAssistantRepository(Protocol):
         pass
 
     async def list_threads(
-        self, assistant_id: str
+        self,
+        assistant_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
     ) -> List[AssistantThreadEntity]:
         pass
 
     async def list_messages(
-        self, thread_id: str
+        self,
+        thread_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
     ) -> List[AssistantMessageEntity]:
         pass
 
@@ -36,7 +117,9 @@ class IAssistantRepository(Protocol):
         pass
 
     async def create_thread(
-        self, thread: AssistantThreadEntity
+        self,
+        thread: AssistantThreadEntity,
+        messages: List[AssistantMessageItem] | None = None,
     ) -> AssistantThreadEntity | None:
         pass
 
@@ -48,6 +131,13 @@ class IAssistantRepository(Protocol):
     ) -> List[AssistantMessageEntity]:
         pass
 
+    async def create_threads(
+        self,
+        assistant_id: str,
+        threads: List[tuple[AssistantThreadEntity, List[AssistantMessageItem]]],
+    ) -> None:
+        pass
+
     # DELETE
     async def delete_assistant(
         self, assistant_id: str
@@ -59,71 +149,170 @@ class IAssistantRepository(Protocol):
     ) -> AssistantThreadEntity | None:
         pass
 
+    async def delete_threads(
+        self, assistant_id: str, thread_ids: List[str]
+    ) -> List[AssistantThreadEntity]:
+        pass
+
+    async def queue_llm_deletions(
+        self, backend: LlmBackend, kind: str, remote_ids: List[str]
+    ) -> None:
+        pass
+
+    async def get_thread_summary(self, thread_id: str) -> ThreadSummaryEntity | None:
+        pass
+
     # UPDATE
+    async def update_assistant(
+        self,
+        assistant_id: str,
+        answer_cache_enabled: bool | None = None,
+        context_max_tokens: int | None = None,
+        context_summarize: bool | None = None,
+    ) -> AssistantEntity | None:
+        pass
+
     async def update_thread(
         self, thread_id: str, name: str
     ) -> AssistantThreadEntity | None:
         pass
 
+    async def save_thread_summary(
+        self, summary: ThreadSummaryEntity
+    ) -> ThreadSummaryEntity | None:
+        pass
+
 
 class AssistantRepository:
-    def __init__(self, session: Session) -> None:
+    """Queries on the assistant tables, each one sent as a single statement.
+
+    Outside `unit_of_work` a statement runs on its own in autocommit, without
+    BEGIN / COMMIT round trips, and the connection goes back to the pool right after.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
         self.session = session
+        self._in_unit_of_work = False
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[None]:
+        """Run the statements made inside in one transaction, committed on exit."""
+        if self._in_unit_of_work:
+            yield
+            return
+        self._in_unit_of_work = True
+        try:
+            async with self.session.begin():
+                yield
+        finally:
+            self._in_unit_of_work = False
+
+    async def _execute(self, query: str, parameters: dict | List[dict] | None = None) -> Result:
+        if self._in_unit_of_work or self.session.in_transaction():
+            return await self.session.execute(text(query), parameters)
+        # a single statement is atomic on its own
+        await self.session.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+        try:
+            return await self.session.execute(text(query), parameters)
+        finally:
+            # nothing is sent in autocommit, the connection is released
+            await self.session.commit()
 
     # READ
+    @timed("db.get_assistant")
     async def get_assistant(self, assistant_id: str) -> AssistantEntity | None:
-        query = "SELECT id, name, created_at, instructions, model FROM assistant WHERE id = :assistant_id"
+        query = f"SELECT {ASSISTANT_FIELDS} FROM assistant WHERE id = :assistant_id"
         parameters = {"assistant_id": assistant_id}
 
-        row = self.session.execute(text(query), parameters).fetchone()
-        self.session.commit()
+        row = (await self._execute(query, parameters)).fetchone()
 
         return AssistantEntity(*row) if row is not None else None
 
+    @timed("db.list_assistants")
     async def list_assistants(self) -> List[AssistantEntity]:
-        query = "SELECT id, name, created_at, instructions, model FROM assistant"
+        query = f"SELECT {ASSISTANT_FIELDS} FROM assistant"
 
-        rows = self.session.execute(text(query)).fetchall()
-        self.session.commit()
+        rows = (await self._execute(query)).fetchall()
 
         return [AssistantEntity(*row) for row in rows]
 
+    @timed("db.list_threads")
     async def list_threads(
-        self, assistant_id: str
+        self,
+        assistant_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
     ) -> List[AssistantThreadEntity]:
-        query = "SELECT id, name, assistant_id, created_at FROM assistant_thread WHERE assistant_id = :assistant_id"
-        parameters = {"assistant_id": assistant_id}
+        keyset, keyset_parameters = keyset_clause(cursor, order)
+        query = f"""
+        SELECT id, name, assistant_id, created_at FROM assistant_thread
+        WHERE assistant_id = :assistant_id AND {keyset}
+        {order_clause(order)}
+        """
+        parameters = {"assistant_id": assistant_id, **keyset_parameters}
+        if limit is not None:
+            query += "LIMIT :limit"
+            parameters["limit"] = limit
 
-        rows = self.session.execute(text(query), parameters).fetchall()
-        self.session.commit()
+        rows = (await self._execute(query, parameters)).fetchall()
 
         return [AssistantThreadEntity(*row) for row in rows]
 
+    @timed("db.list_messages")
     async def list_messages(
-        self, thread_id: str
+        self,
+        thread_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
     ) -> List[AssistantMessageEntity]:
-        query = """
-        SELECT id, assistant_id, thread_id, created_at, role, type, content FROM assistant_message
-        WHERE thread_id = :thread_id
+        keyset, keyset_parameters = keyset_clause(cursor, order)
+        query = f"""
+        SELECT {", ".join(MESSAGE_COLUMNS)} FROM assistant_message
+        WHERE thread_id = :thread_id AND {keyset}
+        {order_clause(order)}
         """
         parameters = {
             "thread_id": thread_id,
+            **keyset_parameters,
         }
+        if limit is not None:
+            query += "LIMIT :limit"
+            parameters["limit"] = limit
 
-        rows = self.session.execute(text(query), parameters).fetchall()
-        self.session.commit()
+        rows = (await self._execute(query, parameters)).fetchall()
 
         return [AssistantMessageEntity(*row) for row in rows]
 
+    @timed("db.get_thread_summary")
+    async def get_thread_summary(self, thread_id: str) -> ThreadSummaryEntity | None:
+        query = """
+        SELECT thread_id, summary, token_count, until_created_at, until_id
+        FROM assistant_thread_summary
+        WHERE thread_id = :thread_id
+        """
+        parameters = {"thread_id": thread_id}
+
+        row = (await self._execute(query, parameters)).fetchone()
+
+        return ThreadSummaryEntity(*row) if row is not None else None
+
     # CREATE
+    @timed("db.create_assistant")
     async def create_assistant(
         self, assistant: AssistantEntity
     ) -> AssistantEntity | None:
-        print("creating assistant in db")
-        query = """
-        INSERT INTO assistant (id, name, created_at, instructions, model)
-        VALUES (:id, :name, :created_at, :instructions, :model)
-        RETURNING id, name, created_at, instructions, model
+        query = f"""
+        INSERT INTO assistant (
+            id, name, created_at, instructions, model, backend,
+            context_max_tokens, context_summarize
+        )
+        VALUES (
+            :id, :name, :created_at, :instructions, :model, :backend,
+            :context_max_tokens, :context_summarize
+        )
+        RETURNING {ASSISTANT_FIELDS}
         """
         parameters = {
             "id": assistant.id,
@@ -131,125 +320,216 @@ class AssistantRepository:
             "created_at": assistant.created_at,
             "instructions": assistant.instructions,
             "model": assistant.model,
+            "backend": LlmBackend(assistant.backend).value,
+            "context_max_tokens": assistant.context_max_tokens,
+            "context_summarize": assistant.context_summarize,
         }
 
-        row = self.session.execute(text(query), parameters).fetchone()
-        self.session.commit()
-        print('assistant created in db')
+        row = (await self._execute(query, parameters)).fetchone()
+        logger.info("assistant saved", extra={"assistant_id": assistant.id})
         return AssistantEntity(*row) if row is not None else None
 
+    @timed("db.create_thread")
     async def create_thread(
-        self, thread: AssistantThreadEntity
+        self,
+        thread: AssistantThreadEntity,
+        messages: List[AssistantMessageItem] | None = None,
     ) -> AssistantThreadEntity | None:
-        query = """
-        INSERT INTO assistant_thread (id, name, assistant_id, created_at)
-        VALUES (:id, :name, :assistant_id, :created_at)
-        RETURNING id, name, assistant_id, created_at
-        """
+        query = CREATE_THREAD_QUERY + "RETURNING id, name, assistant_id, created_at"
         parameters = {
             "id": thread.id,
             "name": thread.name,
             "assistant_id": thread.assistant_id,
             "created_at": thread.created_at,
         }
-
-        row = self.session.execute(text(query), parameters).fetchone()
-        self.session.commit()
+        # the thread and its first messages in one statement
+        if messages:
+            values, message_parameters = _messages_values(
+                [_message_row(thread.assistant_id, thread.id, message) for message in messages]
+            )
+            query = f"""
+            WITH thread AS ({query}),
+            messages AS (
+                INSERT INTO assistant_message ({", ".join(MESSAGE_COLUMNS)})
+                VALUES {values}
+            )
+            SELECT * FROM thread
+            """
+            parameters.update(message_parameters)
+
+        row = (await self._execute(query, parameters)).fetchone()
 
         return AssistantThreadEntity(*row) if row is not None else None
 
+    @timed("db.add_messages")
     async def add_messages(
         self,
         assistant_id: str,
         thread_id: str,
         messages: List[AssistantMessageItem],
     ) -> List[AssistantMessageEntity]:
-        query = """
-            INSERT INTO assistant_message (id, assistant_id, thread_id, created_at, role, type, content)
-            VALUES (:id, :assistant_id, :thread_id, :created_at, :role, :type, :content)
-        """
-        values = [
+        if len(messages) == 0:
+            return
+        values, parameters = _messages_values(
+            [_message_row(assistant_id, thread_id, message) for message in messages]
+        )
+        query = f"INSERT INTO assistant_message ({', '.join(MESSAGE_COLUMNS)}) VALUES {values}"
+
+        await self._execute(query, parameters)
+
+        return
+
+    @timed("db.create_threads")
+    async def create_threads(
+        self,
+        assistant_id: str,
+        threads: List[tuple[AssistantThreadEntity, List[AssistantMessageItem]]],
+    ) -> None:
+        # one transaction and one executemany per table, however many threads
+        thread_values = [
             {
-                "id": message.id,
-                "assistant_id": assistant_id,
-                "thread_id": thread_id,
-                "created_at": message.created_at,
-                "role": message.role.value,
-                "type": message.value.type.value,
-                "content": json.dumps(message.value.content),
+                "id": thread.id,
+                "name": thread.name,
+                "assistant_id": thread.assistant_id,
+                "created_at": thread.created_at,
             }
+            for thread, _ in threads
+        ]
+        message_values = [
+            _message_row(assistant_id, thread.id, message)
+            for thread, messages in threads
             for message in messages
         ]
+        if len(thread_values) == 0:
+            return
 
-        with self.session.begin():
-            self.session.execute(text(query), values)
-        self.session.commit()
-
-        return
+        async with self.unit_of_work():
+            await self._execute(CREATE_THREAD_QUERY, thread_values)
+            if len(message_values) > 0:
+                await self._execute(ADD_MESSAGE_QUERY, message_values)
 
     # DELETE
+    @timed("db.delete_assistant")
     async def delete_assistant(
         self, assistant_id: str
     ) -> AssistantEntity | None:
-        ### DELETE MESSAGES ###
-        query = """
-            DELETE FROM assistant_message WHERE assistant_id = :assistant_id
+        # threads and messages are removed by ON DELETE CASCADE,
+        # the LLM side ones by the deletion queue
+        query = f"""
+            WITH deleted AS (
+                DELETE FROM assistant WHERE id = :assistant_id
+                RETURNING {ASSISTANT_FIELDS}
+            ),
+            queued AS (
+                {QUEUE_DELETIONS_QUERY}
+                SELECT d.backend, 'thread', t.id
+                FROM deleted d JOIN assistant_thread t ON t.assistant_id = d.id
+                UNION ALL
+                SELECT backend, 'assistant', id FROM deleted
+                ON CONFLICT (kind, remote_id) DO NOTHING
+            )
+            SELECT * FROM deleted
         """
         parameters = {
             "assistant_id": assistant_id,
         }
-        self.session.execute(text(query), parameters)
+        row = (await self._execute(query, parameters)).fetchone()
 
-        ### DELETE THREADS ###
-        query = """
-            DELETE FROM assistant_thread WHERE assistant_id = :assistant_id
+        return AssistantEntity(*row) if row is not None else None
+
+    @timed("db.delete_thread")
+    async def delete_thread(
+        self, thread_id: str
+    ) -> AssistantThreadEntity | None:
+        # messages are removed by ON DELETE CASCADE, the LLM side thread by the deletion queue
+        query = f"""
+            WITH deleted AS (
+                DELETE FROM assistant_thread WHERE id = :thread_id
+                RETURNING id, name, assistant_id, created_at
+            ),
+            queued AS ({QUEUE_DELETED_THREADS_QUERY})
+            SELECT * FROM deleted
         """
         parameters = {
-            "assistant_id": assistant_id,
+            "thread_id": thread_id,
         }
-        self.session.execute(text(query), parameters)
 
-        ### DELETE ASSISTANT ###
-        query = """
-            DELETE FROM assistant WHERE id = :assistant_id
-            RETURNING id, name, created_at, instructions, model
+        row = (await self._execute(query, parameters)).fetchone()
+
+        return AssistantThreadEntity(*row) if row is not None else None
+
+    @timed("db.delete_threads")
+    async def delete_threads(
+        self, assistant_id: str, thread_ids: List[str]
+    ) -> List[AssistantThreadEntity]:
+        # ids of other assistants' threads are left alone
+        query = f"""
+            WITH deleted AS (
+                DELETE FROM assistant_thread
+                WHERE assistant_id = :assistant_id AND id = ANY(:thread_ids)
+                RETURNING id, name, assistant_id, created_at
+            ),
+            queued AS ({QUEUE_DELETED_THREADS_QUERY})
+            SELECT * FROM deleted
         """
         parameters = {
             "assistant_id": assistant_id,
+            "thread_ids": thread_ids,
         }
-        row = self.session.execute(text(query), parameters).fetchone()
-        self.session.commit()
 
-        return AssistantEntity(*row) if row is not None else None
+        rows = (await self._execute(query, parameters)).fetchall()
 
-    async def delete_thread(
-        self, thread_id: str
-    ) -> AssistantThreadEntity | None:
-        ### DELETE MESSAGES ###
-        query = """
-            DELETE FROM assistant_message WHERE thread_id = :thread_id
+        return [AssistantThreadEntity(*row) for row in rows]
+
+    @timed("db.queue_llm_deletions")
+    async def queue_llm_deletions(
+        self, backend: LlmBackend, kind: str, remote_ids: List[str]
+    ) -> None:
+        if len(remote_ids) == 0:
+            return
+        query = f"""
+            {QUEUE_DELETIONS_QUERY}
+            SELECT :backend, :kind, remote_id FROM unnest(CAST(:remote_ids AS TEXT[])) AS remote_id
+            ON CONFLICT (kind, remote_id) DO NOTHING
         """
         parameters = {
-            "thread_id": thread_id,
+            "backend": LlmBackend(backend).value,
+            "kind": kind,
+            "remote_ids": remote_ids,
         }
-        self.session.execute(text(query), parameters)
 
-        ### DELETE THREAD ###
-        query = """
-            DELETE FROM assistant_thread WHERE id = :thread_id
-            RETURNING id, name, assistant_id, created_at
+        await self._execute(query, parameters)
+
+    # UPDATE
+    @timed("db.update_assistant")
+    async def update_assistant(
+        self,
+        assistant_id: str,
+        answer_cache_enabled: bool | None = None,
+        context_max_tokens: int | None = None,
+        context_summarize: bool | None = None,
+    ) -> AssistantEntity | None:
+        # None leaves the column as it is
+        query = f"""
+            UPDATE assistant
+            SET answer_cache_enabled = COALESCE(:answer_cache_enabled, answer_cache_enabled),
+                context_max_tokens = COALESCE(:context_max_tokens, context_max_tokens),
+                context_summarize = COALESCE(:context_summarize, context_summarize)
+            WHERE id = :assistant_id
+            RETURNING {ASSISTANT_FIELDS}
         """
         parameters = {
-            "thread_id": thread_id,
+            "assistant_id": assistant_id,
+            "answer_cache_enabled": answer_cache_enabled,
+            "context_max_tokens": context_max_tokens,
+            "context_summarize": context_summarize,
         }
 
-        row = self.session.execute(text(query), parameters).fetchone()
-        self.session.commit()
-
-        return AssistantThreadEntity(*row) if row is not None else None
+        row = (await self._execute(query, parameters)).fetchone()
 
-    # UPDATE
+        return AssistantEntity(*row) if row is not None else None
 
+    @timed("db.update_thread")
     async def update_thread(
         self, thread_id: str, name: str
     ) -> AssistantThreadEntity | None:
@@ -264,11 +544,41 @@ class AssistantRepository:
             "name": name,
         }
 
-        row = self.session.execute(text(query), parameters).fetchone()
-        self.session.commit()
+        row = (await self._execute(query, parameters)).fetchone()
 
         return AssistantThreadEntity(*row) if row is not None else None
 
+    @timed("db.save_thread_summary")
+    async def save_thread_summary(
+        self, summary: ThreadSummaryEntity
+    ) -> ThreadSummaryEntity | None:
+        # a summary never replaces one that covers more of the thread
+        query = """
+            INSERT INTO assistant_thread_summary
+                (thread_id, summary, token_count, until_created_at, until_id)
+            VALUES (:thread_id, :summary, :token_count, :until_created_at, :until_id)
+            ON CONFLICT (thread_id) DO UPDATE
+            SET summary = EXCLUDED.summary,
+                token_count = EXCLUDED.token_count,
+                until_created_at = EXCLUDED.until_created_at,
+                until_id = EXCLUDED.until_id,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE (assistant_thread_summary.until_created_at, assistant_thread_summary.until_id)
+                < (EXCLUDED.until_created_at, EXCLUDED.until_id)
+            RETURNING thread_id, summary, token_count, until_created_at, until_id
+        """
+        parameters = {
+            "thread_id": summary.thread_id,
+            "summary": summary.summary,
+            "token_count": summary.token_count,
+            "until_created_at": summary.until_created_at,
+            "until_id": summary.until_id,
+        }
+
+        row = (await self._execute(query, parameters)).fetchone()
+
+        return ThreadSummaryEntity(*row) if row is not None else None
+
 
 if TYPE_CHECKING:
     _: type[IAssistantRepository] = AssistantRepository
@@ -4,6 +4,16 @@ from enum import Enum
 from typing import Any
 
 
+# tokens of thread history sent with a turn, per assistant
+DEFAULT_CONTEXT_MAX_TOKENS = 3000
+
+
+class LlmBackend(Enum):
+    # Assistants API threads and runs, history kept by Azure OpenAI
+    Assistants = "assistants"
+    # Chat Completions, history sent from assistant_message with each turn
+    Chat = "chat"
+
 
 @dataclass
 class AssistantEntity:
@@ -12,6 +22,12 @@ class AssistantEntity:
     created_at: datetime
     instructions: str
     model: str
+    answer_cache_enabled: bool = True
+    backend: LlmBackend = LlmBackend.Assistants
+    # tokens of thread history sent with a turn, 0 for the whole thread
+    context_max_tokens: int = DEFAULT_CONTEXT_MAX_TOKENS
+    # whether the messages beyond the budget are summarised
+    context_summarize: bool = True
 
 
 @dataclass
@@ -40,3 +56,14 @@ class AssistantMessageEntity:
     role: Role
     type: AssistantMessageType
     content: dict[str, Any]
+    token_count: int | None = None
+
+
+@dataclass
+class ThreadSummaryEntity:
+    thread_id: str
+    summary: str
+    token_count: int
+    # the last message covered, by (created_at, id)
+    until_created_at: datetime
+    until_id: str
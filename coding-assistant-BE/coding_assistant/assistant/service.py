@@ -1,42 +1,88 @@
-from typing import TYPE_CHECKING, Dict, List, Protocol
+import asyncio
+import logging
+import uuid
+from contextlib import aclosing
+from datetime import datetime, timedelta
+from functools import partial
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Protocol, Set
 
 from coding_assistant.assistant.models import (
     InitAssistantResult,
+    BatchItemResult,
+    BatchItemStatus,
+    BatchResult,
+    AssistantMessageDelta,
     AssistantMessageItem,
     AssistantMessageValue,
+    AssistantStreamEvent,
     CreateAssistantParams,
     CreateAssistantResult,
     CreateThreadParams,
     CreateThreadResult,
+    CreateThreadsBatchParams,
     DeleteAssistantResult,
     DeleteThreadResult,
+    DeleteThreadsParams,
+    DeleteThreadsResult,
     ListMessageResult,
     ListThreadsResult,
     SendMessageParams,
     SendMessageResult,
+    StreamEventType,
+    ThreadContext,
+    UpdateAssistantParams,
+    UpdateAssistantResult,
     UpdateThreadParams,
     UpdateThreadResult,
 )
+from coding_assistant.assistant.answercache import AnswerCache
+from coding_assistant.assistant.batch import fan_out
+from coding_assistant.assistant.context import ThreadContextBuilder
+from coding_assistant.assistant.coordination import ThreadCoordinator
+from coding_assistant.assistant.deletion import DeletionKind, DeletionQueue
+from coding_assistant.assistant.pagination import PageCursor, PageOrder
 from coding_assistant.assistant.repository import IAssistantRepository
 from coding_assistant.assistant.models import ModelType
-from coding_assistant.assistant.constants import DEFAULT_ASSISTANT_NAME, ASSISTANT_INSTRUCTIONS
+from coding_assistant.assistant.constants import (
+    DEFAULT_ASSISTANT_NAME,
+    DEFAULT_THREAD_NAME,
+    ASSISTANT_INSTRUCTIONS,
+)
 from coding_assistant.assistant.schemas import (
     AssistantEntity,
     AssistantMessageEntity,
+    AssistantMessageType,
     AssistantThreadEntity,
+    LlmBackend,
+    Role,
 )
 from coding_assistant.llms import LLM
-from openai import AzureOpenAI
+from coding_assistant.llms.constants import FALLBACK_MESSAGE_PREFIX
+from coding_assistant.telemetry import timed
+
+logger = logging.getLogger(__name__)
 
 class IAssistantService(Protocol):
 
     async def init_assistant(self) -> InitAssistantResult:
         pass
     
-    async def list_threads(self, assistant_id: str) -> ListThreadsResult:
+    async def list_threads(
+        self,
+        assistant_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
+    ) -> ListThreadsResult:
         pass
 
-    async def list_messages(self, thread_id: str) -> ListMessageResult:
+    async def list_messages(
+        self,
+        thread_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
+    ) -> ListMessageResult:
         pass
     
     
@@ -53,12 +99,45 @@ class IAssistantService(Protocol):
     ) -> SendMessageResult:
         pass
 
+    def create_thread_stream(
+        self, assistant_id: str, params: CreateThreadParams
+    ) -> AsyncIterator[AssistantStreamEvent | CreateThreadResult]:
+        pass
+
+    def post_thread_message_stream(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        params: SendMessageParams,
+    ) -> AsyncIterator[AssistantStreamEvent | SendMessageResult]:
+        pass
+
+    def create_threads_batch(
+        self,
+        assistant_id: str,
+        params: CreateThreadsBatchParams,
+        concurrency: int,
+        item_timeout: float,
+    ) -> AsyncIterator[BatchItemResult | BatchResult]:
+        pass
+
 
     async def delete_thread(
         self, assistant_id: str, thread_id: str
     ) -> DeleteThreadResult:
         pass
 
+    async def delete_threads(
+        self, assistant_id: str, params: DeleteThreadsParams
+    ) -> DeleteThreadsResult:
+        pass
+
+
+    async def update_assistant(
+        self, assistant_id: str, params: UpdateAssistantParams
+    ) -> UpdateAssistantResult:
+        pass
+
 
     async def update_thread(
         self, thread_id: str, params: UpdateThreadParams
@@ -67,9 +146,26 @@ class IAssistantService(Protocol):
 
 
 class AssistantService:
-    def __init__(self, ar: IAssistantRepository, llm: LLM) -> None:
+    def __init__(
+        self,
+        ar: IAssistantRepository,
+        llm: LLM,
+        coordinator: ThreadCoordinator | None = None,
+        answers: AnswerCache | None = None,
+        backends: Dict[LlmBackend, LLM] | None = None,
+        contexts: ThreadContextBuilder | None = None,
+        deletions: DeletionQueue | None = None,
+    ) -> None:
         self.ar = ar
+        # `llm` answers the Assistants backend, `backends` may add or replace the others
         self.llm = llm
+        self.backends = {LlmBackend.Assistants: llm, **(backends or {})}
+        self.coordinator = coordinator or ThreadCoordinator()
+        self.answers = answers
+        # without it turns are sent no context and tokens are not counted
+        self.contexts = contexts
+        # without it LLM side deletions wait in the queue for another worker
+        self.deletions = deletions
 
     async def init_assistant(self) -> InitAssistantResult:
         assistants: List[
@@ -82,7 +178,10 @@ class AssistantService:
                 name=DEFAULT_ASSISTANT_NAME, 
                 instructions=ASSISTANT_INSTRUCTIONS)
             newAssistant = await self.create_assistant(params)
-            print(InitAssistantResult(assistant=newAssistant.assistant))
+            logger.info(
+                "created the default assistant",
+                extra={"assistant_id": newAssistant.assistant.id},
+            )
             return InitAssistantResult(assistant=newAssistant.assistant)
         
         # (TODO): add more validation
@@ -90,40 +189,100 @@ class AssistantService:
         return InitAssistantResult(assistant=firstAssistant)
     
 
-    async def list_threads(self, assistant_id: str) -> ListThreadsResult:
+    async def list_threads(
+        self,
+        assistant_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
+    ) -> ListThreadsResult:
+        # fetch one extra row to know whether there is a next page
         threads: List[AssistantThreadEntity] = await self.ar.list_threads(
-            assistant_id
+            assistant_id,
+            limit=limit + 1 if limit is not None else None,
+            cursor=cursor,
+            order=order,
         )
-        return ListThreadsResult(threads=threads)
+        threads, next_cursor = self._page(threads, limit)
 
-    async def list_messages(self, thread_id: str) -> ListMessageResult:
+        return ListThreadsResult(threads=threads, next_cursor=next_cursor)
+
+    async def list_messages(
+        self,
+        thread_id: str,
+        limit: int | None = None,
+        cursor: PageCursor | None = None,
+        order: PageOrder = PageOrder.Asc,
+    ) -> ListMessageResult:
+        # fetch one extra row to know whether there is a next page
         entities: List[AssistantMessageEntity] = await self.ar.list_messages(
-            thread_id
+            thread_id,
+            limit=limit + 1 if limit is not None else None,
+            cursor=cursor,
+            order=order,
         )
-        messages = [
-            AssistantMessageItem(
-                id=entity.id,
-                role=entity.role,
-                created_at=entity.created_at,
-                value=AssistantMessageValue(
-                    type=entity.type, content=entity.content
-                ),
-            )
-            for entity in entities
-        ]
+        entities, next_cursor = self._page(entities, limit)
+
+        messages = [self._message_item(entity) for entity in entities]
 
-        return ListMessageResult(messages=messages)
+        return ListMessageResult(messages=messages, next_cursor=next_cursor)
+
+    def _message_item(self, entity: AssistantMessageEntity) -> AssistantMessageItem:
+        return AssistantMessageItem(
+            id=entity.id,
+            role=entity.role,
+            created_at=entity.created_at,
+            value=AssistantMessageValue(type=entity.type, content=entity.content),
+            token_count=entity.token_count,
+        )
+
+    def _llm(self, backend: LlmBackend | str) -> LLM:
+        return self.backends[LlmBackend(backend)]
+
+    async def _context(
+        self, assistant: AssistantEntity, thread_id: str
+    ) -> ThreadContext | None:
+        if self.contexts is None:
+            return None
+        return await self.contexts.build(self.ar, assistant, thread_id)
+
+    async def _save_messages(
+        self, assistant_id: str, thread_id: str, messages: List[AssistantMessageItem]
+    ) -> None:
+        if self.contexts is not None:
+            self.contexts.count(messages)
+        await self.ar.add_messages(
+            assistant_id=assistant_id, thread_id=thread_id, messages=messages
+        )
+
+    async def _save_thread(
+        self, thread: AssistantThreadEntity, messages: List[AssistantMessageItem]
+    ) -> AssistantThreadEntity | None:
+        # the thread and its first messages are written together or not at all
+        if self.contexts is not None:
+            self.contexts.count(messages)
+        return await self.ar.create_thread(thread, messages)
+
+    def _page(self, rows: list, limit: int | None) -> tuple[list, str | None]:
+        if limit is None or len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, PageCursor(created_at=last.created_at, id=last.id).encode()
 
     async def create_assistant(
         self, params: CreateAssistantParams
     ) -> CreateAssistantResult:
 
         # create assistant on the LLM side
-        llm_assistant: AssistantEntity = await self.llm.create_assistant(
+        llm_assistant: AssistantEntity = await self._llm(params.backend).create_assistant(
             name=params.name,
             instructions=params.instructions,
             model=params.model,
         )
+        llm_assistant.backend = params.backend
+        llm_assistant.context_max_tokens = params.context_max_tokens
+        llm_assistant.context_summarize = params.context_summarize
 
         # add assistant info to db
         assistant: AssistantEntity | None = await self.ar.create_assistant(
@@ -132,44 +291,26 @@ class AssistantService:
 
         return CreateAssistantResult(assistant=assistant)
 
+    @timed("turn.create_thread")
     async def create_thread(
         self, assistant_id: str, params: CreateThreadParams
     ) -> CreateThreadResult:
-        # default chat/thread name
-        default_name = "New chat"
-
         # get current assistant info
         assistant: AssistantEntity | None = await self.ar.get_assistant(
             assistant_id
         )
 
-        # create thread on LLM side
-        llm_thread: AssistantThreadEntity = await self.llm.create_thread(
-            assistant_id=assistant.id, default_name=default_name
-        )
-
-        # send message and get the result from LLM
-        user_message_and_responses: List[
-            AssistantMessageItem
-        ] = await self.llm.process_user_message(
-            assistant=assistant,
-            thread_id=llm_thread.id,
-            message=params.message,
+        # create thread on LLM side and get the answer to its first message
+        llm_thread, user_message_and_responses = await self._first_turn(
+            self._llm(assistant.backend), assistant, params.message
         )
 
         # extract LLM responses
         responses = user_message_and_responses[1:]
 
-        # save thread in the DB
-        thread_entity: AssistantThreadEntity | None = (
-            await self.ar.create_thread(llm_thread)
-        )
-
-        # save messages to the DB
-        await self.ar.add_messages(
-            assistant_id=assistant.id,
-            thread_id=thread_entity.id,
-            messages=user_message_and_responses,
+        # save thread and messages in the DB
+        thread_entity: AssistantThreadEntity | None = await self._save_thread(
+            llm_thread, user_message_and_responses
         )
 
         return (
@@ -181,63 +322,410 @@ class AssistantService:
             else None
         )
 
+    async def create_threads_batch(
+        self,
+        assistant_id: str,
+        params: CreateThreadsBatchParams,
+        concurrency: int,
+        item_timeout: float,
+    ) -> AsyncIterator[BatchItemResult | BatchResult]:
+        # get current assistant info
+        assistant: AssistantEntity | None = await self.ar.get_assistant(
+            assistant_id
+        )
+        llm = self._llm(assistant.backend)
+
+        # items run concurrently and must not use the session: threads and messages
+        # of the completed ones are saved together at the end
+        started: Dict[int, AssistantThreadEntity] = {}
+        finished: Set[int] = set()
+        completed: List[tuple[AssistantThreadEntity, List[AssistantMessageItem]]] = []
+        failed: List[AssistantThreadEntity] = []
+        counts = {status: 0 for status in BatchItemStatus}
+
+        async def answer(i: int) -> List[AssistantMessageItem]:
+            _, user_message_and_responses = await self._first_turn(
+                llm,
+                assistant,
+                params.messages[i],
+                on_thread=partial(started.__setitem__, i),
+            )
+            return user_message_and_responses
+
+        items = fan_out(len(params.messages), answer, concurrency, item_timeout)
+        try:
+            async with aclosing(items):
+                async for i, result in items:
+                    finished.add(i)
+                    if isinstance(result, Exception):
+                        status = (
+                            BatchItemStatus.TimedOut
+                            if isinstance(result, asyncio.TimeoutError)
+                            else BatchItemStatus.Failed
+                        )
+                        logger.warning("batch item %s %s: %r", i, status.value, result)
+                        if i in started:
+                            failed.append(started[i])
+                        item = BatchItemResult(index=i, status=status, error=repr(result))
+                    else:
+                        status = BatchItemStatus.Completed
+                        if self.contexts is not None:
+                            self.contexts.count(result)
+                        completed.append((started[i], result))
+                        item = BatchItemResult(
+                            index=i, status=status, thread=started[i], messages=result[1:]
+                        )
+                    counts[status] += 1
+                    yield item
+        finally:
+            # also when the stream is closed early, e.g. the client went away: the items still
+            # running are cancelled by then, and their threads go with the failed ones
+            failed.extend(thread for i, thread in started.items() if i not in finished)
+            await asyncio.shield(self._finish_batch(assistant, completed, failed))
+
+        yield BatchResult(
+            completed=counts[BatchItemStatus.Completed],
+            failed=counts[BatchItemStatus.Failed],
+            timed_out=counts[BatchItemStatus.TimedOut],
+        )
+
+    async def _discard_threads(
+        self, assistant: AssistantEntity, threads: List[AssistantThreadEntity]
+    ) -> None:
+        # threads left without an answer are removed from the LLM side
+        await self.ar.queue_llm_deletions(
+            assistant.backend, DeletionKind.Thread.value, [thread.id for thread in threads]
+        )
+        self._wake_deletions()
+
+    async def _finish_batch(
+        self,
+        assistant: AssistantEntity,
+        completed: List[tuple[AssistantThreadEntity, List[AssistantMessageItem]]],
+        failed: List[AssistantThreadEntity],
+    ) -> None:
+        await self._discard_threads(assistant, failed)
+
+        # save threads and messages to the DB
+        await self.ar.create_threads(assistant.id, completed)
+
+    async def _first_turn(
+        self,
+        llm: LLM,
+        assistant: AssistantEntity,
+        message: str,
+        on_thread: Callable[[AssistantThreadEntity], None] | None = None,
+    ) -> tuple[AssistantThreadEntity, List[AssistantMessageItem]]:
+        """Create a thread on the LLM side and answer its first message, from the answer cache
+        when possible.
+
+        `on_thread` is called with the thread once it exists, before a run that may fail or
+        be cancelled.
+        """
+        llm_thread, seed = await self._start_first_turn(llm, assistant, message, on_thread)
+        if seed is not None:
+            return llm_thread, seed
+
+        # send message and get the result from LLM
+        user_message_and_responses: List[
+            AssistantMessageItem
+        ] = await llm.process_user_message(
+            assistant=assistant,
+            thread_id=llm_thread.id,
+            message=message,
+        )
+        await self._cache_answer(assistant, message, user_message_and_responses)
+        return llm_thread, user_message_and_responses
+
+    async def _first_turn_stream(
+        self,
+        llm: LLM,
+        assistant: AssistantEntity,
+        message: str,
+        on_thread: Callable[[AssistantThreadEntity], None] | None = None,
+    ) -> AsyncIterator[AssistantStreamEvent]:
+        """_first_turn with the answer as deltas, then a Completed event with the exchange."""
+        llm_thread, seed = await self._start_first_turn(llm, assistant, message, on_thread)
+        if seed is not None:
+            # a cached answer is sent as one delta per message
+            for response in seed[1:]:
+                yield AssistantStreamEvent(
+                    type=StreamEventType.Delta,
+                    delta=AssistantMessageDelta(
+                        id=response.id,
+                        role=response.role,
+                        text=response.value.content["message"],
+                    ),
+                )
+            yield AssistantStreamEvent(type=StreamEventType.Completed, messages=seed)
+            return
+
+        # forward LLM deltas until the run is completed
+        async with aclosing(
+            llm.stream_user_message(assistant=assistant, thread_id=llm_thread.id, message=message)
+        ) as events:
+            async for event in events:
+                if event.type == StreamEventType.Completed:
+                    await self._cache_answer(assistant, message, event.messages)
+                yield event
+
+    async def _start_first_turn(
+        self,
+        llm: LLM,
+        assistant: AssistantEntity,
+        message: str,
+        on_thread: Callable[[AssistantThreadEntity], None] | None,
+    ) -> tuple[AssistantThreadEntity, List[AssistantMessageItem] | None]:
+        # a cached answer skips the run, the exchange still seeds the new thread
+        answer = await self._cached_answer(assistant, message)
+        seed = self._cached_exchange(message, answer) if answer is not None else None
+        llm_thread: AssistantThreadEntity = await llm.create_thread(
+            assistant_id=assistant.id, default_name=DEFAULT_THREAD_NAME, messages=seed
+        )
+        if on_thread is not None:
+            on_thread(llm_thread)
+        return llm_thread, seed
+
+    # Only the first message of a thread is answered from the cache: later answers depend on
+    # the thread history.
+    async def _cached_answer(
+        self, assistant: AssistantEntity, message: str
+    ) -> List[AssistantMessageValue] | None:
+        if self.answers is None or not self.answers.applies_to(assistant):
+            return None
+        return await self.answers.get(assistant, message)
+
+    async def _cache_answer(
+        self,
+        assistant: AssistantEntity,
+        message: str,
+        user_message_and_responses: List[AssistantMessageItem],
+    ) -> None:
+        responses = user_message_and_responses[1:]
+        if (
+            self.answers is None
+            or not self.answers.applies_to(assistant)
+            or len(responses) == 0
+            or any(response.id.startswith(FALLBACK_MESSAGE_PREFIX) for response in responses)
+        ):
+            return
+        await self.answers.set(assistant, message, [response.value for response in responses])
+
+    def _cached_exchange(
+        self, message: str, answer: List[AssistantMessageValue]
+    ) -> List[AssistantMessageItem]:
+        # created_at steps keep the question before its answers when listed by (created_at, id)
+        now = datetime.now()
+        user_message = AssistantMessageItem(
+            id=f"cached_{uuid.uuid4()}",
+            role=Role.User,
+            created_at=now,
+            value=AssistantMessageValue(
+                type=AssistantMessageType.Text, content={"message": message}
+            ),
+        )
+        responses = [
+            AssistantMessageItem(
+                id=f"cached_{uuid.uuid4()}",
+                role=Role.Assistant,
+                created_at=now + timedelta(microseconds=i + 1),
+                value=value,
+            )
+            for i, value in enumerate(answer)
+        ]
+        return [user_message] + responses
+
+    @timed("turn.post_thread_message")
     async def post_thread_message(
         self,
         assistant_id: str,
         thread_id: str,
         params: SendMessageParams,
+    ) -> SendMessageResult:
+        # queue behind the thread's active turn instead of cancelling its run, the same
+        # message sent right after the previous one, still queued or running, is answered once
+        return await self.coordinator.run(
+            thread_id,
+            params.message,
+            lambda: self._post_thread_message(assistant_id, thread_id, params),
+        )
+
+    async def _post_thread_message(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        params: SendMessageParams,
     ) -> SendMessageResult:
         # get current assistant info
         assistant: AssistantEntity | None = await self.ar.get_assistant(
             assistant_id
         )
 
+        llm = self._llm(assistant.backend)
+        context = await self._context(assistant, thread_id)
+
         # send message and get the result from LLM
         user_message_and_responses: List[
             AssistantMessageItem
-        ] = await self.llm.process_user_message(
+        ] = await llm.process_user_message(
             assistant=assistant,
             thread_id=thread_id,
             message=params.message,
+            context=context,
         )
 
         # extract LLM responses
         responses = user_message_and_responses[1:]
 
         # save messages to the DB
-        await self.ar.add_messages(
-            assistant_id=assistant.id,
-            thread_id=thread_id,
-            messages=user_message_and_responses,
-        )
+        await self._save_messages(assistant.id, thread_id, user_message_and_responses)
 
         return SendMessageResult(thread_id=thread_id, messages=responses)
 
-    async def delete_assistant(self, assistant_id: str) -> AssistantEntity:      
-        # delete from LLM
-        await self.llm.delete_assistant(assistant_id)
+    async def create_thread_stream(
+        self, assistant_id: str, params: CreateThreadParams
+    ) -> AsyncIterator[AssistantStreamEvent | CreateThreadResult]:
+        # get current assistant info
+        assistant: AssistantEntity | None = await self.ar.get_assistant(
+            assistant_id
+        )
+
+        llm = self._llm(assistant.backend)
+        started: List[AssistantThreadEntity] = []
+        thread_entity: AssistantThreadEntity | None = None
+
+        try:
+            # create thread on LLM side and forward the deltas of its first answer
+            user_message_and_responses: List[AssistantMessageItem] = []
+            async with aclosing(
+                self._first_turn_stream(llm, assistant, params.message, on_thread=started.append)
+            ) as events:
+                async for event in events:
+                    if event.type == StreamEventType.Completed:
+                        user_message_and_responses = event.messages
+                    else:
+                        yield event
+
+            # extract LLM responses
+            responses = user_message_and_responses[1:]
+
+            # save thread and messages in the DB
+            thread_entity = await self._save_thread(started[0], user_message_and_responses)
+        finally:
+            # the stream closed early or failed: the LLM side thread is not kept without its row
+            if len(started) > 0 and thread_entity is None:
+                await asyncio.shield(self._discard_threads(assistant, started))
+
+        yield CreateThreadResult(thread=thread_entity, messages=responses)
+
+    def post_thread_message_stream(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        params: SendMessageParams,
+    ) -> AsyncIterator[AssistantStreamEvent | SendMessageResult]:
+        # a turn like post_thread_message, coalesced the same way: the same message sent right
+        # after the previous one gets its deltas replayed and then the rest as they come, and a
+        # non-streamed turn it joins only sends its result
+        return self.coordinator.stream(
+            thread_id,
+            params.message,
+            lambda: self._post_thread_message_stream(assistant_id, thread_id, params),
+        )
 
-        # Delete from DB
+    async def _post_thread_message_stream(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        params: SendMessageParams,
+    ) -> AsyncIterator[AssistantStreamEvent | SendMessageResult]:
+        # get current assistant info
+        assistant: AssistantEntity | None = await self.ar.get_assistant(
+            assistant_id
+        )
+
+        llm = self._llm(assistant.backend)
+        context = await self._context(assistant, thread_id)
+
+        # forward LLM deltas until the run is completed; closed with this stream, so that
+        # the run is cancelled rather than left answering into nothing
+        user_message_and_responses: List[AssistantMessageItem] = []
+        async with aclosing(
+            llm.stream_user_message(
+                assistant=assistant,
+                thread_id=thread_id,
+                message=params.message,
+                context=context,
+            )
+        ) as events:
+            async for event in events:
+                if event.type == StreamEventType.Completed:
+                    user_message_and_responses = event.messages
+                else:
+                    yield event
+
+        # extract LLM responses
+        responses = user_message_and_responses[1:]
+
+        # save messages to the DB
+        await self._save_messages(assistant.id, thread_id, user_message_and_responses)
+
+        yield SendMessageResult(thread_id=thread_id, messages=responses)
+
+    # Deletes are local: the LLM side ones are queued in the same statement and done in the
+    # background.
+    async def delete_assistant(self, assistant_id: str) -> DeleteAssistantResult:
+        # Delete from DB, with the assistant's threads
         deleted_assistant: AssistantEntity | None = (
             await self.ar.delete_assistant(assistant_id)
         )
+        self._wake_deletions()
 
         return DeleteAssistantResult(assistant=deleted_assistant)
 
     async def delete_thread(
         self, assistant_id: str, thread_id: str
-    ) -> AssistantThreadEntity:
-
-        # delete from LLM
-        await self.llm.delete_thread(thread_id)
-
+    ) -> DeleteThreadResult:
         # Delete from DB
         deleted_thread: AssistantThreadEntity = await self.ar.delete_thread(
             thread_id
         )
+        self._wake_deletions()
 
         return DeleteThreadResult(thread=deleted_thread)
 
+    async def delete_threads(
+        self, assistant_id: str, params: DeleteThreadsParams
+    ) -> DeleteThreadsResult:
+        # Delete from DB in one statement
+        deleted_threads: List[AssistantThreadEntity] = await self.ar.delete_threads(
+            assistant_id, params.thread_ids
+        )
+        self._wake_deletions()
+
+        return DeleteThreadsResult(threads=deleted_threads)
+
+    def _wake_deletions(self) -> None:
+        if self.deletions is not None:
+            self.deletions.wake()
+
+    async def update_assistant(
+        self, assistant_id: str, params: UpdateAssistantParams
+    ) -> UpdateAssistantResult:
+        # update the answer cache switch and context policy in DB
+        assistant: AssistantEntity | None = await self.ar.update_assistant(
+            assistant_id,
+            answer_cache_enabled=params.answer_cache_enabled,
+            context_max_tokens=params.context_max_tokens,
+            context_summarize=params.context_summarize,
+        )
+
+        return (
+            UpdateAssistantResult(assistant=assistant)
+            if assistant is not None
+            else None
+        )
+
     async def update_thread(
         self, thread_id: str, params: UpdateThreadParams
     ) -> AssistantThreadEntity:
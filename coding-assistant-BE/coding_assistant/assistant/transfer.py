@@ -0,0 +1,269 @@
+import json
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+from pydantic.dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from coding_assistant.assistant.cache import AssistantCache
+from coding_assistant.telemetry import timed
+
+logger = logging.getLogger(__name__)
+
+# Each NDJSON line is one row with its table in "kind": the assistants come first,
+# then their threads, then the messages, so an export can be imported as it is read.
+ASSISTANT_COLUMNS = [
+    "id",
+    "name",
+    "created_at",
+    "instructions",
+    "model",
+    "answer_cache_enabled",
+    "backend",
+    "context_max_tokens",
+    "context_summarize",
+]
+THREAD_COLUMNS = ["id", "name", "assistant_id", "created_at"]
+MESSAGE_COLUMNS = [
+    "id",
+    "assistant_id",
+    "thread_id",
+    "created_at",
+    "role",
+    "type",
+    "content",
+    "token_count",
+]
+TABLES = {
+    "assistant": ("assistant", ASSISTANT_COLUMNS),
+    "thread": ("assistant_thread", THREAD_COLUMNS),
+    "message": ("assistant_message", MESSAGE_COLUMNS),
+}
+# an imported row needs its parent, already there or imported with it
+PARENTS = {
+    "thread": "EXISTS (SELECT 1 FROM assistant p WHERE p.id = s.assistant_id)",
+    "message": "EXISTS (SELECT 1 FROM assistant_thread p WHERE p.id = s.thread_id)",
+}
+
+
+@dataclass
+class TransferConfig:
+    # rows fetched from the server-side cursor, and sent, at a time
+    export_batch_size: int = 1000
+    # rows sent with one COPY
+    import_batch_size: int = 5000
+
+
+@dataclass
+class ImportResult:
+    # per kind, rows read and rows inserted; the others already existed or had no parent
+    read: Dict[str, int]
+    inserted: Dict[str, int]
+
+
+class HistoryImportError(Exception):
+    pass
+
+
+# json_build_object trims trailing zeros from the fraction of a second, to_char keeps all six
+EXPORTED_TIMESTAMP = "to_char(created_at, 'YYYY-MM-DD\"T\"HH24:MI:SS.US')"
+FRACTION = re.compile(r"\.(\d+)")
+
+
+def _json_row(kind: str, columns: List[str]) -> str:
+    # Postgres writes the line, rows are never turned into entities
+    fields = ", ".join(
+        f"'{column}', {EXPORTED_TIMESTAMP if column == 'created_at' else column}"
+        for column in columns
+    )
+    return f"json_build_object('kind', '{kind}', {fields})::text"
+
+
+def _timestamp(value: str) -> datetime:
+    # fromisoformat only takes 3 or 6 digits of fraction before Python 3.11,
+    # and exports written before the timestamps were padded have 1 to 6
+    return datetime.fromisoformat(
+        FRACTION.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), value, count=1)
+    )
+
+
+def _columns(kind: str, row: Dict[str, Any]) -> Tuple[str, ...]:
+    # the columns the line has: those it leaves out take their defaults, exports written before
+    # a column was added have no value for it
+    return tuple(column for column in TABLES[kind][1] if column in row)
+
+
+def _record(row: Dict[str, Any], columns: Sequence[str]) -> tuple:
+    # COPY takes typed values: timestamps as datetime, JSON as its text
+    values = []
+    for column in columns:
+        value = row[column]
+        if column == "created_at" and value is not None:
+            value = _timestamp(value)
+        elif column == "content" and value is not None:
+            value = json.dumps(value)
+        values.append(value)
+    return tuple(values)
+
+
+class HistoryTransfer:
+    """Thread history as NDJSON: exported with server-side cursors, imported with COPY."""
+
+    def __init__(
+        self,
+        config: TransferConfig,
+        engine: AsyncEngine,
+        cache: AssistantCache | None = None,
+    ) -> None:
+        self.config = config
+        self.engine = engine
+        self.cache = cache
+
+    async def export(
+        self, assistant_id: str | None = None, thread_id: str | None = None
+    ) -> AsyncIterator[str]:
+        """NDJSON of a thread, of an assistant with its threads, or of everything, a batch of
+        lines at a time."""
+        if thread_id is not None:
+            queries = [
+                (
+                    "assistant",
+                    "id = (SELECT assistant_id FROM assistant_thread WHERE id = :thread_id)",
+                    "",
+                ),
+                ("thread", "id = :thread_id", ""),
+                ("message", "thread_id = :thread_id", "ORDER BY created_at, id"),
+            ]
+        elif assistant_id is not None:
+            queries = [
+                ("assistant", "id = :assistant_id", ""),
+                ("thread", "assistant_id = :assistant_id", ""),
+                (
+                    "message",
+                    "thread_id IN"
+                    " (SELECT id FROM assistant_thread WHERE assistant_id = :assistant_id)",
+                    "",
+                ),
+            ]
+        else:
+            queries = [("assistant", "TRUE", ""), ("thread", "TRUE", ""), ("message", "TRUE", "")]
+        parameters = {"assistant_id": assistant_id, "thread_id": thread_id}
+
+        rows = 0
+        # one snapshot for the three tables, read through cursors in the same transaction
+        async with self.engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="REPEATABLE READ")
+            async with connection.begin():
+                for kind, where, order in queries:
+                    table, columns = TABLES[kind]
+                    query = f"SELECT {_json_row(kind, columns)} FROM {table} WHERE {where} {order}"
+                    result = await connection.stream(text(query), parameters)
+                    async for batch in result.partitions(self.config.export_batch_size):
+                        rows += len(batch)
+                        yield "".join(line + "\n" for (line,) in batch)
+        logger.info(
+            "history exported",
+            extra={"assistant_id": assistant_id, "thread_id": thread_id, "rows": rows},
+        )
+
+    @timed("history.import")
+    async def import_(self, lines: AsyncIterator[bytes]) -> ImportResult:
+        """Load NDJSON as written by `export`, all of it or nothing.
+
+        Rows are copied into temporary tables a batch at a time and inserted from there,
+        leaving out the ones whose id is already taken. A row missing a column without a
+        default is rejected.
+        """
+        read = {kind: 0 for kind in TABLES}
+        inserted = {kind: 0 for kind in TABLES}
+        # per kind and set of columns present, copied together
+        batches: Dict[Tuple[str, Tuple[str, ...]], List[tuple]] = defaultdict(list)
+        assistant_ids: List[str] = []
+
+        async with self.engine.begin() as connection:
+            for kind, (table, _) in TABLES.items():
+                await connection.execute(
+                    text(
+                        f"CREATE TEMPORARY TABLE import_{kind}"
+                        f" (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+                    )
+                )
+            copy = await self._copier(connection)
+
+            number = 0
+            async for line in _lines(lines):
+                number += 1
+                if line.strip() == "":
+                    continue
+                try:
+                    row = json.loads(line)
+                    kind = row["kind"]
+                    if kind not in TABLES:
+                        raise ValueError(f"unknown kind {kind!r}")
+                    columns = _columns(kind, row)
+                    batch = batches[(kind, columns)]
+                    batch.append(_record(row, columns))
+                except (ValueError, KeyError, TypeError) as e:
+                    raise HistoryImportError(f"line {number}: {e}")
+                read[kind] += 1
+                if len(batch) >= self.config.import_batch_size:
+                    await copy(kind, columns, batch)
+                    batch.clear()
+
+            for kind, (table, columns) in TABLES.items():
+                for (batch_kind, present), batch in batches.items():
+                    if batch_kind == kind:
+                        await copy(kind, present, batch)
+                names = ", ".join(columns)
+                query = f"""
+                INSERT INTO {table} ({names})
+                SELECT {names} FROM import_{kind} s
+                WHERE {PARENTS.get(kind, "TRUE")}
+                ON CONFLICT (id) DO NOTHING
+                {"RETURNING id" if kind == "assistant" else ""}
+                """
+                result = await connection.execute(text(query))
+                if kind == "assistant":
+                    assistant_ids = [assistant_id for (assistant_id,) in result.fetchall()]
+                    inserted[kind] = len(assistant_ids)
+                else:
+                    inserted[kind] = result.rowcount
+
+        if self.cache is not None:
+            # in the other workers too, whose assistant lists are missing these
+            for assistant_id in assistant_ids:
+                await self.cache.changed(assistant_id)
+        logger.info("history imported", extra={"read": read, "inserted": inserted})
+        return ImportResult(read=read, inserted=inserted)
+
+    async def _copier(self, connection: AsyncConnection):
+        # COPY is only reachable on the asyncpg connection under the SQLAlchemy one
+        raw = (await connection.get_raw_connection()).driver_connection
+
+        async def copy(kind: str, columns: Sequence[str], records: List[tuple]) -> None:
+            if len(records) == 0:
+                return
+            try:
+                await raw.copy_records_to_table(
+                    f"import_{kind}", records=records, columns=list(columns)
+                )
+            except Exception as e:
+                raise HistoryImportError(f"{kind} rows: {e}")
+
+        return copy
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # request body chunks split on newlines, a line at a time
+    rest = b""
+    async for chunk in chunks:
+        rest += chunk
+        *lines, rest = rest.split(b"\n")
+        for line in lines:
+            yield line.decode()
+    if rest:
+        yield rest.decode()
@@ -1,6 +1,6 @@
 from environs import Env
-from injector import Module, provider
-from openai import AzureOpenAI
+from injector import Module, provider, singleton
+from openai import AsyncAzureOpenAI
 from pydantic import  SecretStr
 from pydantic.dataclasses import dataclass
 
@@ -20,9 +20,17 @@ class AzureOpenAiModule(Module):
             api_version=env.str("AZURE_OPENAI_API_VERSION"),
         )
 
+    # one client, so that its connection pool and TLS sessions are shared by every request
+    @singleton
     @provider
-    def provide_llm(self, conf: AzureOpenAiConfig) -> AzureOpenAI:
+    def provide_llm(self, conf: AzureOpenAiConfig) -> AsyncAzureOpenAI:
         azure_endpoint = conf.azure_endpoint.get_secret_value()
         api_key = conf.api_key.get_secret_value()
         api_version = conf.api_version.get_secret_value()
-        return AzureOpenAI(azure_endpoint=azure_endpoint, api_key=api_key, api_version=api_version)
+        # retried by the RateLimiter, which honours Retry-After across every call of the process
+        return AsyncAzureOpenAI(
+            azure_endpoint=azure_endpoint,
+            api_key=api_key,
+            api_version=api_version,
+            max_retries=0,
+        )
@@ -1,7 +1,9 @@
 from environs import Env
-from injector import Module, provider
+from injector import Module, provider, singleton
 
 class ConfigModule(Module):
+    # .env is read once per process
+    @singleton
     @provider
     def provide_env(self) -> Env:
         env = Env()
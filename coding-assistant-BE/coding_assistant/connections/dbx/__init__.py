@@ -1,9 +1,15 @@
 from environs import Env
 from fastapi_injector import request_scope
-from injector import Module, provider
+from injector import Module, provider, singleton
 from pydantic.dataclasses import dataclass
-from sqlalchemy import Engine, create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from .pool import DbPoolStatsResult, InstrumentedAsyncPool, PoolStats  # noqa: F401
 
 
 @dataclass
@@ -13,9 +19,17 @@ class DbConfig:
     user: str
     password: str
     database: str
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: int = 30
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
 
     def connection_string(self) -> str:
-        return f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
+        return (
+            f"postgresql+asyncpg://{self.user}:{self.password}"
+            f"@{self.host}:{self.port}/{self.database}"
+        )
 
 
 class DbModule(Module):
@@ -27,17 +41,45 @@ class DbModule(Module):
             user=env.str("DB_USER"),
             password=env.str("DB_PASSWORD"),
             database=env.str("DB_DATABASE"),
+            pool_size=env.int("DB_POOL_SIZE", default=10),
+            max_overflow=env.int("DB_MAX_OVERFLOW", default=10),
+            pool_timeout=env.int("DB_POOL_TIMEOUT", default=30),
+            pool_recycle=env.int("DB_POOL_RECYCLE", default=1800),
+            pool_pre_ping=env.bool("DB_POOL_PRE_PING", default=True),
         )
 
+    @singleton
+    @provider
+    def provide_pool_stats(self) -> PoolStats:
+        return PoolStats()
+
+    @singleton
     @provider
-    def provide_engine(self, conf: DbConfig) -> Engine:
-        return create_engine(conf.connection_string())
+    def provide_engine(self, conf: DbConfig, stats: PoolStats) -> AsyncEngine:
+        engine = create_async_engine(
+            conf.connection_string(),
+            poolclass=InstrumentedAsyncPool,
+            pool_size=conf.pool_size,
+            max_overflow=conf.max_overflow,
+            pool_timeout=conf.pool_timeout,
+            pool_recycle=conf.pool_recycle,
+            pool_pre_ping=conf.pool_pre_ping,
+        )
+        engine.pool.stats = stats
+        return engine
 
+    @singleton
     @provider
-    def provide_sessionmaker(self, engine: Engine) -> sessionmaker[Session]:
-        return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def provide_sessionmaker(
+        self, engine: AsyncEngine
+    ) -> async_sessionmaker[AsyncSession]:
+        return async_sessionmaker(
+            bind=engine, autoflush=False, expire_on_commit=False
+        )
 
     @provider
     @request_scope
-    def provide_session(self, Session: sessionmaker[Session]) -> Session:
+    def provide_session(
+        self, Session: async_sessionmaker[AsyncSession]
+    ) -> AsyncSession:
         return Session()
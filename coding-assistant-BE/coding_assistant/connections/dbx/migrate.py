@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+# arbitrary key so that concurrently starting replicas apply migrations one at a time
+MIGRATIONS_LOCK_KEY = 7_150_420_001
+
+
+def list_migrations() -> List[Path]:
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+
+async def migrate(engine: AsyncEngine, target: str | None = None) -> List[str]:
+    """Apply pending migrations in order, up to and including `target`. Returns applied versions."""
+    applied: List[str] = []
+
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+
+        # taken first: replicas starting together would otherwise race on creating the table
+        await driver.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_KEY)
+        try:
+            await driver.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version TEXT PRIMARY KEY,
+                    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            done = {
+                row["version"]
+                for row in await driver.fetch("SELECT version FROM schema_migrations")
+            }
+            for path in list_migrations():
+                version = path.stem
+                if version not in done:
+                    # each file runs in its own transaction, multi-statement files included
+                    async with driver.transaction():
+                        await driver.execute(path.read_text())
+                        await driver.execute(
+                            "INSERT INTO schema_migrations (version) VALUES ($1)", version
+                        )
+                    logger.info("migration applied", extra={"version": version})
+                    applied.append(version)
+                if version == target:
+                    break
+        finally:
+            await driver.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
+
+    return applied
+
+
+async def pending_migrations(engine: AsyncEngine) -> List[str]:
+    """Versions not applied yet, every one of them before the first migration."""
+    async with engine.connect() as conn:
+        created = await conn.scalar(text("SELECT to_regclass('schema_migrations') IS NOT NULL"))
+        done = (
+            set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+            if created
+            else set()
+        )
+    return [path.stem for path in list_migrations() if path.stem not in done]
+
+
+async def _main() -> None:
+    from injector import Injector
+
+    from coding_assistant.connections import ConfigModule, DbModule
+    from coding_assistant.telemetry import LogConfig, TelemetryModule, setup_logging
+
+    injector = Injector([ConfigModule(), DbModule(), TelemetryModule()])
+    listener = setup_logging(injector.get(LogConfig))
+    engine = injector.get(AsyncEngine)
+    try:
+        await migrate(engine)
+    finally:
+        await engine.dispose()
+        listener.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,22 @@
+-- Rows that point to a missing parent would make the foreign keys below fail
+DELETE FROM assistant_message m
+WHERE NOT EXISTS (SELECT 1 FROM assistant_thread t WHERE t.id = m.thread_id);
+
+DELETE FROM assistant_thread t
+WHERE NOT EXISTS (SELECT 1 FROM assistant a WHERE a.id = t.assistant_id);
+
+-- Deleting an assistant removes its threads, deleting a thread removes its messages
+ALTER TABLE assistant_thread
+    ADD CONSTRAINT assistant_thread_assistant_id_fkey
+    FOREIGN KEY (assistant_id) REFERENCES assistant (id) ON DELETE CASCADE;
+
+ALTER TABLE assistant_message
+    ADD CONSTRAINT assistant_message_thread_id_fkey
+    FOREIGN KEY (thread_id) REFERENCES assistant_thread (id) ON DELETE CASCADE;
+
+-- Serve list_threads / list_messages (and the cascades above) from an index in (created_at, id) order
+CREATE INDEX IF NOT EXISTS assistant_thread_assistant_id_created_at_idx
+    ON assistant_thread (assistant_id, created_at, id);
+
+CREATE INDEX IF NOT EXISTS assistant_message_thread_id_created_at_idx
+    ON assistant_message (thread_id, created_at, id);
@@ -0,0 +1,8 @@
+-- Last known run per thread, shared by workers using RUN_STATE_STORE=postgres.
+-- No foreign key: the run state is written before a new thread is saved.
+CREATE TABLE IF NOT EXISTS assistant_run_state (
+    thread_id TEXT PRIMARY KEY,
+    run_id TEXT,
+    status TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
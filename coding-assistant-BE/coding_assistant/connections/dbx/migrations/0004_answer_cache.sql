@@ -0,0 +1,20 @@
+-- Per-assistant switch for the answer cache
+ALTER TABLE assistant ADD COLUMN IF NOT EXISTS answer_cache_enabled BOOLEAN NOT NULL DEFAULT TRUE;
+
+-- Persistent tier of the answer cache, keyed on the normalised prompt, assistant, model and wrapper prompt version.
+-- Cached answers go away with their assistant.
+CREATE TABLE IF NOT EXISTS assistant_answer_cache (
+    key TEXT PRIMARY KEY,
+    assistant_id TEXT NOT NULL REFERENCES assistant (id) ON DELETE CASCADE,
+    answer JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS assistant_answer_cache_assistant_id_idx
+    ON assistant_answer_cache (assistant_id);
+
+-- Size eviction drops the least recently used rows first
+CREATE INDEX IF NOT EXISTS assistant_answer_cache_last_used_at_idx
+    ON assistant_answer_cache (last_used_at);
@@ -0,0 +1,2 @@
+-- LLM backend answering an assistant's threads: 'assistants' (Assistants API) or 'chat' (Chat Completions)
+ALTER TABLE assistant ADD COLUMN IF NOT EXISTS backend TEXT NOT NULL DEFAULT 'assistants';
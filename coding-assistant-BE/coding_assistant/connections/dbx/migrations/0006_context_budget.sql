@@ -0,0 +1,17 @@
+-- Per-assistant context policy: tokens of thread history sent with a turn (0 for all of it)
+-- and whether the messages beyond that are summarised
+ALTER TABLE assistant ADD COLUMN IF NOT EXISTS context_max_tokens INTEGER NOT NULL DEFAULT 3000;
+ALTER TABLE assistant ADD COLUMN IF NOT EXISTS context_summarize BOOLEAN NOT NULL DEFAULT TRUE;
+
+-- Tokens of each message in a prompt, NULL for the rows saved before it was counted
+ALTER TABLE assistant_message ADD COLUMN IF NOT EXISTS token_count INTEGER;
+
+-- Running summary of the messages of a thread up to (until_created_at, until_id)
+CREATE TABLE IF NOT EXISTS assistant_thread_summary (
+    thread_id TEXT PRIMARY KEY REFERENCES assistant_thread (id) ON DELETE CASCADE,
+    summary TEXT NOT NULL,
+    token_count INTEGER NOT NULL,
+    until_created_at TIMESTAMP NOT NULL,
+    until_id TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
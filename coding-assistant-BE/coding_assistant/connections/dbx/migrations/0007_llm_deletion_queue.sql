@@ -0,0 +1,17 @@
+-- Threads and assistants deleted locally and still to be deleted on the LLM side.
+-- Rows are queued by the statement deleting the local ones and removed once the remote delete succeeds.
+-- next_attempt_at is NULL once max attempts are used up: the row is kept for inspection.
+CREATE TABLE IF NOT EXISTS llm_deletion (
+    id BIGSERIAL PRIMARY KEY,
+    backend TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    remote_id TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (kind, remote_id)
+);
+
+CREATE INDEX IF NOT EXISTS llm_deletion_next_attempt_at_idx
+    ON llm_deletion (next_attempt_at) WHERE next_attempt_at IS NOT NULL;
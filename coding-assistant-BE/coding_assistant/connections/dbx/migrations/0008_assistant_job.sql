@@ -0,0 +1,16 @@
+-- Background jobs, read by any worker with JOB_STORE=postgres; run by the worker that accepted them.
+-- result holds the CreateThreadResult or SendMessageResult of a completed job.
+-- No foreign key: a job may be submitted for an assistant that does not exist, and then fails.
+CREATE TABLE IF NOT EXISTS assistant_job (
+    id TEXT PRIMARY KEY,
+    assistant_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result JSONB,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Finished jobs are deleted once past their retention
+CREATE INDEX IF NOT EXISTS assistant_job_finished_at_idx
+    ON assistant_job (finished_at) WHERE finished_at IS NOT NULL;
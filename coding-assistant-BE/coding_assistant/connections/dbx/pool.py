@@ -0,0 +1,70 @@
+import time
+from threading import Lock
+
+from pydantic.dataclasses import dataclass
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@dataclass
+class DbPoolStatsResult:
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    wait_seconds_total: float
+    wait_seconds_max: float
+    wait_seconds_avg: float
+
+
+class PoolStats:
+    """Process-wide counters for connection checkouts and the time spent waiting for them."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self, wait_seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def snapshot(self, engine: AsyncEngine) -> DbPoolStatsResult:
+        pool = engine.pool
+        with self._lock:
+            return DbPoolStatsResult(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                checkouts=self.checkouts,
+                wait_seconds_total=self.wait_seconds_total,
+                wait_seconds_max=self.wait_seconds_max,
+                wait_seconds_avg=(
+                    self.wait_seconds_total / self.checkouts if self.checkouts else 0.0
+                ),
+            )
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that reports checkout wait time (including new connects)
+    to PoolStats."""
+
+    stats: PoolStats | None = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.stats is not None:
+                self.stats.record_checkout(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
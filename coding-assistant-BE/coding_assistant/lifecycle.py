@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import math
+import time
+from contextlib import AsyncExitStack
+from logging.handlers import QueueListener
+from typing import Awaitable, Callable, Dict, List
+
+from environs import Env
+from injector import Injector, Module, provider
+from openai import AsyncAzureOpenAI
+from pydantic.dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from coding_assistant.assistant.context import ThreadContextBuilder
+from coding_assistant.assistant.coordination import PgChannel
+from coding_assistant.assistant.deletion import DeletionQueue
+from coding_assistant.assistant.factory import AssistantServiceFactory
+from coding_assistant.assistant.jobs import JobManager
+from coding_assistant.connections.dbx import DbConfig
+from coding_assistant.connections.dbx.migrate import migrate, pending_migrations
+from coding_assistant.llms.llm import LlmBackends
+from coding_assistant.llms.polling import RunPoller
+from coding_assistant.llms.ratelimit import RateLimiter
+from coding_assistant.llms.tokens import TokenCounter
+from coding_assistant.telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+# arbitrary key so that workers starting together create one default assistant between them
+DEFAULT_ASSISTANT_LOCK_KEY = 7_150_420_002
+
+
+@dataclass
+class StartupConfig:
+    # apply pending schema migrations before anything queries the DB, one replica at a time
+    migrate: bool = True
+    # seconds the migrations may take, they aren't bound by step_timeout
+    migration_timeout: float = 300.0
+    # connections opened in the DB pool before the first request, at most DB_POOL_SIZE
+    db_connections: int = 4
+    # keep-alive connections opened to Azure OpenAI
+    http_connections: int = 2
+    # seconds a warm-up step may take: a failing step is logged and startup goes on
+    step_timeout: float = 10.0
+    # seconds each /readyz check may take
+    probe_timeout: float = 2.0
+    # seconds a successful Azure OpenAI check is reused for, so that probes don't each call it
+    llm_probe_interval: float = 30.0
+
+
+@dataclass
+class ReadinessResult:
+    ready: bool
+    # whether startup is done and shutdown hasn't begun
+    started: bool
+    # "ok", "skipped" or why the check failed
+    db: str
+    llm: str
+    # "ok", "behind" while migrations are pending, or "failed"
+    schema: str
+
+
+class LifecycleModule(Module):
+    @provider
+    def provide_startup_config(self, env: Env) -> StartupConfig:
+        return StartupConfig(
+            db_connections=env.int("STARTUP_DB_CONNECTIONS", default=4),
+            http_connections=env.int("STARTUP_HTTP_CONNECTIONS", default=2),
+            step_timeout=env.float("STARTUP_STEP_TIMEOUT", default=10),
+            migrate=env.bool("STARTUP_MIGRATE", default=True),
+            migration_timeout=env.float("STARTUP_MIGRATION_TIMEOUT", default=300),
+            probe_timeout=env.float("READINESS_PROBE_TIMEOUT", default=2),
+            llm_probe_interval=env.float("READINESS_LLM_PROBE_INTERVAL", default=30),
+        )
+
+
+class AppLifecycle:
+    """Process-wide resources: created and warmed up at startup, closed in reverse order
+    at shutdown."""
+
+    def __init__(self, injector: Injector, log_listener: QueueListener | None = None) -> None:
+        self.injector = injector
+        self.log_listener = log_listener
+        self._closers: List[Callable[[], Awaitable[None]]] = []
+        # seconds per warm-up step, None for the ones that failed
+        self.steps: Dict[str, float | None] = {}
+        self.config = StartupConfig()
+        self.started = False
+        self._engine: AsyncEngine | None = None
+        self._client: AsyncAzureOpenAI | None = None
+        self._llm_checked_at = -math.inf
+        self._schema_current = False
+
+    async def start(self) -> None:
+        env = self.injector.get(Env)
+        config = self.config = self.injector.get(StartupConfig)
+        fake = env.str("LLM_BACKEND", default="azure") == "fake"
+
+        engine = self._engine = self.injector.get(AsyncEngine)
+        self._closers.append(engine.dispose)
+        if config.migrate:
+            await self._step(
+                "migrations", self._migrate(engine), config, timeout=config.migration_timeout
+            )
+        connections = min(config.db_connections, self.injector.get(DbConfig).pool_size)
+        await self._step("db_pool", self._warm_db_pool(engine, connections), config)
+
+        # LISTENing before the first turn, closed after the workers that run turns
+        channel = self.injector.get(PgChannel)
+        self._closers.append(channel.close)
+        await self._step("coordination", channel.start(), config)
+        # closed after the LLMs and the poller, which queue their calls on it
+        self._closers.append(self.injector.get(RateLimiter).close)
+
+        if not fake:
+            client = self._client = self.injector.get(AsyncAzureOpenAI)
+            self._closers.append(client.close)
+            # newer clients import their resources, and the types of these, on first use
+            client.beta.threads.runs
+            client.chat.completions
+            self._closers.append(self.injector.get(RunPoller).close)
+            await self._step("http_pool", self._warm_http_pool(client, config), config)
+
+        # loads the encoding, downloading it on first use
+        self.injector.get(TokenCounter)
+        self.injector.get(LlmBackends)
+        factory = self.injector.get(AssistantServiceFactory)
+        self._closers.append(self.injector.get(ThreadContextBuilder).close)
+        self._closers.append(self.injector.get(JobManager).close)
+        deletions = self.injector.get(DeletionQueue)
+        self._closers.append(deletions.close)
+
+        await self._step("default_assistant", self._ensure_default_assistant(factory), config)
+        # deletions left over by a previous process
+        deletions.wake()
+        self.started = True
+        logger.info("started", extra={"steps": self.steps})
+
+    async def stop(self) -> None:
+        # /readyz fails from now on, so that no new traffic is routed here
+        self.started = False
+        for close in reversed(self._closers):
+            try:
+                await close()
+            except Exception as e:
+                logger.warning("closing %s failed: %s", getattr(close, "__qualname__", close), e)
+        self._closers = []
+        logger.info("stopped")
+        if self.log_listener is not None:
+            self.log_listener.stop()
+
+    async def readiness(self) -> ReadinessResult:
+        """Whether this replica can take traffic: started, with a DB connection, the schema
+        up to date and Azure OpenAI reachable."""
+        if not self.started:
+            return ReadinessResult(
+                ready=False, started=False, db="skipped", llm="skipped", schema="skipped"
+            )
+        db, llm, schema = await asyncio.gather(
+            self._check(self._check_db()),
+            self._check(self._check_llm()),
+            self._check(self._check_schema()),
+        )
+        return ReadinessResult(
+            ready=db != "failed" and llm != "failed" and schema == "ok",
+            started=True,
+            db=db,
+            llm=llm,
+            schema=schema,
+        )
+
+    async def _check(self, work: Awaitable[str]) -> str:
+        try:
+            return await asyncio.wait_for(work, timeout=self.config.probe_timeout)
+        except Exception as e:
+            logger.warning("readiness check failed: %r", e)
+            return "failed"
+
+    async def _check_db(self) -> str:
+        # a connection from the pool, so an exhausted pool fails the check too
+        async with self._engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        return "ok"
+
+    async def _check_llm(self) -> str:
+        if self._client is None:
+            return "skipped"
+        if time.monotonic() - self._llm_checked_at < self.config.llm_probe_interval:
+            return "ok"
+        await self._client.models.list(timeout=self.config.probe_timeout)
+        self._llm_checked_at = time.monotonic()
+        return "ok"
+
+    async def _check_schema(self) -> str:
+        # once current, the schema stays so for the life of the process
+        if self._schema_current:
+            return "ok"
+        pending = await pending_migrations(self._engine)
+        if pending:
+            logger.warning("schema migrations pending", extra={"versions": pending})
+            return "behind"
+        self._schema_current = True
+        return "ok"
+
+    async def _step(
+        self,
+        name: str,
+        work: Awaitable[None],
+        config: StartupConfig,
+        timeout: float | None = None,
+    ) -> None:
+        start = time.perf_counter()
+        try:
+            with stage(f"startup.{name}"):
+                await asyncio.wait_for(work, timeout=timeout or config.step_timeout)
+            self.steps[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            self.steps[name] = None
+            logger.warning("startup step %s failed: %r", name, e)
+
+    async def _migrate(self, engine: AsyncEngine) -> None:
+        applied = await migrate(engine)
+        if applied:
+            logger.info("applied schema migrations", extra={"versions": applied})
+
+    async def _warm_db_pool(self, engine: AsyncEngine, connections: int) -> None:
+        # held together, so that each is a new pooled connection
+        async with AsyncExitStack() as stack:
+            opened = await asyncio.gather(
+                *(stack.enter_async_context(engine.connect()) for _ in range(connections))
+            )
+            await asyncio.gather(*(connection.execute(text("SELECT 1")) for connection in opened))
+
+    async def _warm_http_pool(self, client: AsyncAzureOpenAI, config: StartupConfig) -> None:
+        # concurrent requests open that many connections, kept alive by the client afterwards
+        await asyncio.gather(
+            *(
+                client.models.list(timeout=config.step_timeout)
+                for _ in range(config.http_connections)
+            )
+        )
+
+    async def _ensure_default_assistant(self, factory: AssistantServiceFactory) -> None:
+        # shielded: an assistant being created on Azure OpenAI is saved too, past the step timeout
+        await asyncio.shield(self._create_default_assistant(factory))
+
+    async def _create_default_assistant(self, factory: AssistantServiceFactory) -> None:
+        # one worker at a time, the others find the assistant it created
+        async with self._engine.connect() as connection:
+            lock = {"key": DEFAULT_ASSISTANT_LOCK_KEY}
+            await connection.execute(text("SELECT pg_advisory_lock(:key)"), lock)
+            try:
+                async with factory.create() as service:
+                    await service.init_assistant()
+            finally:
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), lock)
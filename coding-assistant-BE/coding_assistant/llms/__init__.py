@@ -1,3 +1,5 @@
-from .llm import LLM
+from .llm import LLM, LlmBackends
 from .azureopenaillm import AzureOpenAILLM  
+from .chatcompletionsllm import ChatCompletionsLLM
+from .fakellm import FakeLLM
 from .module import LlmModule
\ No newline at end of file
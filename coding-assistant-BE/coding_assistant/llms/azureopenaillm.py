@@ -1,13 +1,17 @@
+import asyncio
 import json
-import time
-import uuid
+import logging
 from environs import Env
 from datetime import datetime
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, AsyncIterator, List
 
 from coding_assistant.assistant.models import (
+    AssistantMessageDelta,
     AssistantMessageItem,
     AssistantMessageValue,
+    AssistantStreamEvent,
+    StreamEventType,
+    ThreadContext,
 )
 from coding_assistant.assistant.schemas import (
     AssistantEntity,
@@ -15,35 +19,79 @@ from coding_assistant.assistant.schemas import (
     Role,
     AssistantMessageType,
 )
-from coding_assistant.llms.llm import LLM
-from openai import AzureOpenAI
+from coding_assistant.llms.llm import (
+    LLM,
+    fallback_responses,
+    summary_prompt,
+    turn_instructions,
+)
+from openai import AsyncAzureOpenAI, NotFoundError
 from coding_assistant.connections.azureopenaix import AzureOpenAiConfig
-from openai.types.beta.threads import Run 
-from .constants import WRAPPER_PROMPT
+from coding_assistant.telemetry import stage, timed
+from coding_assistant.telemetry.metrics import RUN_TIMEOUTS, RUNS
+from .polling import PENDING_STATES, PollingConfig, RunPoller
+from .ratelimit import Priority, RateLimitConfig, RateLimiter, estimate_tokens
+from .runstate import (
+    NO_RUN,
+    InMemoryRunStateStore,
+    IRunStateStore,
+    RunState,
+    RunStateConfig,
+)
+
+if TYPE_CHECKING:
+    # the run types are the slowest part of importing openai, and only annotate here
+    from openai.types.beta.threads import Run
+
+logger = logging.getLogger(__name__)
+
 
 class AzureOpenAILLM(LLM):
-    def __init__(self, client: AzureOpenAI):
+    def __init__(
+        self,
+        client: AsyncAzureOpenAI,
+        poller: RunPoller | None = None,
+        run_states: IRunStateStore | None = None,
+        limiter: RateLimiter | None = None,
+    ):
         
         self.client = client
+        # every call goes through the limiter, shared with the poller and the other LLMs
+        # of the process
+        self.limiter = limiter or RateLimiter(RateLimitConfig())
+        self.poller = poller or RunPoller(
+            client=client, config=PollingConfig(), limiter=self.limiter
+        )
+        self.run_states = run_states or InMemoryRunStateStore(config=RunStateConfig())
         
         # set default values
         self.API_TIMEOUT = 10
         self.RUN = {
             "TERMINAL_STATES": ["expired", "completed", "failed", "cancelled"],
-            "PENDING_STATES": ["queued", "in_progress", "cancelling"],
+            "PENDING_STATES": PENDING_STATES,
             "ACTION_STATES": ["requires_action"],
+            "TERMINAL_EVENTS": [
+                "thread.run.expired",
+                "thread.run.completed",
+                "thread.run.failed",
+                "thread.run.cancelled",
+            ],
         }
 
     
 
+    @timed("llm.create_assistant")
     async def create_assistant(
         self, name: str, instructions: str, model: str
     ) -> AssistantEntity:
-        openai_assistant = self.client.beta.assistants.create(
-            name=name,
-            instructions=instructions,
-            tools=[],
-            model=model,
+        openai_assistant = await self.limiter.call(
+            Priority.Turn,
+            lambda: self.client.beta.assistants.create(
+                name=name,
+                instructions=instructions,
+                tools=[],
+                model=model,
+            ),
         )
         assistant = AssistantEntity(
             id=openai_assistant.id,
@@ -54,41 +102,70 @@ class AzureOpenAILLM(LLM):
         )
         return assistant
 
+    @timed("llm.delete_assistant")
     async def delete_assistant(self, assistant_id: str):
+        # failures are raised for the deletion queue to retry, an assistant already gone is deleted
         try:
-            self.client.beta.assistants.delete(
-                assistant_id=assistant_id, timeout=self.API_TIMEOUT
+            await self.limiter.call(
+                Priority.Background,
+                lambda: self.client.beta.assistants.delete(
+                    assistant_id=assistant_id, timeout=self.API_TIMEOUT
+                ),
             )
-        except Exception as e:
-            print(f"[{self.__class__.__name__}: delete_assistant]: {e}")
+        except NotFoundError:
+            pass
         return
 
+    @timed("llm.create_thread")
     async def create_thread(
-        self, assistant_id: str, default_name: str
+        self,
+        assistant_id: str,
+        default_name: str,
+        messages: List[AssistantMessageItem] | None = None,
     ) -> AssistantThreadEntity:
-        openai_thread = self.client.beta.threads.create(
-            timeout=self.API_TIMEOUT
-        )
+        # `messages` seed the thread history without starting a run
+        with stage("openai.threads.create"):
+            openai_thread = await self.limiter.call(
+                Priority.Turn,
+                lambda: self.client.beta.threads.create(
+                    messages=[
+                        {
+                            "role": message.role.value,
+                            "content": message.value.content["message"],
+                        }
+                        for message in messages or []
+                    ],
+                    timeout=self.API_TIMEOUT,
+                ),
+            )
         thread = AssistantThreadEntity(
             id=openai_thread.id,
             name=default_name,
             assistant_id=assistant_id,
             created_at=datetime.fromtimestamp(openai_thread.created_at),
         )
+        await self.run_states.set(thread.id, None, NO_RUN)
         return thread
 
+    @timed("llm.delete_thread")
     async def delete_thread(self, thread_id: str):
         try:
-            self.client.beta.threads.delete(thread_id, timeout=self.API_TIMEOUT)
-        except Exception as e:
-            print(f"[{self.__class__.__name__}: delete_thread]: {e}")
+            await self.limiter.call(
+                Priority.Background,
+                lambda: self.client.beta.threads.delete(thread_id, timeout=self.API_TIMEOUT),
+            )
+        except NotFoundError:
+            pass
+        await self.run_states.forget(thread_id)
         return
 
+    @timed("llm.process_user_message")
     async def process_user_message(
         self,
         assistant: AssistantEntity,
         thread_id: str,
         message: str,
+        context: ThreadContext | None = None,
     ) -> List[AssistantMessageItem]:
         user_message: AssistantMessageItem = await self._send_message(
             thread_id, message
@@ -96,63 +173,197 @@ class AzureOpenAILLM(LLM):
         responses: List[AssistantMessageItem] | None = await self._get_response(
             assistant_id=assistant.id,
             thread_id=thread_id,
+            context=context,
+            tokens=self._run_tokens(assistant.instructions, message, context),
         )
         # if there is something wrong with the thread. TODO !!!IMPORTANT!!!: remove thread from assistants
         if responses is None:
-            responses: List[AssistantMessageItem] = [
-                AssistantMessageItem(
-                    id=f"internal_{str(uuid.uuid4())}",
-                    role=Role.Assistant,
-                    created_at=datetime.now(),
-                    value=AssistantMessageValue(
-                        type=AssistantMessageType.Text,
-                        content={
-                            "message": "There is something wrong with this particular chat. Please, start a new chat."
-                        },
-                    ),
-                )
-            ]
+            responses = fallback_responses()
 
         user_message_and_responses = [user_message] + responses
         return user_message_and_responses
 
+    async def stream_user_message(
+        self,
+        assistant: AssistantEntity,
+        thread_id: str,
+        message: str,
+        context: ThreadContext | None = None,
+    ) -> AsyncIterator[AssistantStreamEvent]:
+        user_message: AssistantMessageItem = await self._send_message(
+            thread_id, message
+        )
 
-    async def _send_message(
-        self, thread_id: str, message: str
-    ) -> AssistantMessageItem:
-        runs = self.client.beta.threads.runs.list(
-            thread_id, timeout=self.API_TIMEOUT
+        responses: List[AssistantMessageItem] = []
+        run_id = None
+        run_status = None
+
+        with stage("openai.runs.create"):
+            stream = await self.limiter.call(
+                Priority.Turn,
+                lambda: self.client.beta.threads.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=assistant.id,
+                    stream=True,
+                    timeout=self.API_TIMEOUT,
+                    **self._run_options(context),
+                ),
+                tokens=self._run_tokens(assistant.instructions, message, context),
+            )
+        try:
+            async with stream:
+                async for event in stream:
+                    if event.event == "thread.message.delta":
+                        for content in event.data.delta.content or []:
+                            text = getattr(content, "text", None)
+                            if text is not None and text.value:
+                                yield AssistantStreamEvent(
+                                    type=StreamEventType.Delta,
+                                    delta=AssistantMessageDelta(
+                                        id=event.data.id,
+                                        role=Role.Assistant,
+                                        text=text.value,
+                                    ),
+                                )
+                    elif event.event == "thread.message.completed":
+                        responses.extend(self._to_message_items(event.data))
+                    elif event.event == "thread.run.created":
+                        run_id = event.data.id
+                        await self.run_states.set(thread_id, run_id, event.data.status)
+                    elif event.event in self.RUN["TERMINAL_EVENTS"]:
+                        run_status = event.data.status
+                        RUNS.labels(status=run_status).inc()
+                        await self.run_states.set(thread_id, event.data.id, run_status)
+        finally:
+            # closed before a terminal event, e.g. the client went away: closing the stream
+            # leaves the run going on Azure, with an answer nobody saves
+            if run_id is not None and run_status is None:
+                await asyncio.shield(self._cancel_streamed_run(thread_id, run_id))
+
+        logger.info(
+            "streamed run finished", extra={"thread_id": thread_id, "status": run_status}
         )
-        if len(runs.data) > 0:
-            run = runs.data[0]
-            if run.status not in self.RUN["TERMINAL_STATES"]:
-                print(
-                    f"[{self.__class__.__name__} _send_message] Existing run: {run.id}, status: {run.status}"
+        if run_status != "completed" or len(responses) == 0:
+            responses = fallback_responses()
+
+        yield AssistantStreamEvent(
+            type=StreamEventType.Completed,
+            messages=[user_message] + responses,
+        )
+
+    async def _cancel_streamed_run(self, thread_id: str, run_id: str) -> None:
+        logger.info(
+            "cancelling the unfinished streamed run",
+            extra={"thread_id": thread_id, "run_id": run_id},
+        )
+        try:
+            with stage("openai.runs.cancel"):
+                await self.limiter.call(
+                    Priority.Turn,
+                    lambda: self.client.beta.threads.runs.cancel(
+                        thread_id=thread_id, run_id=run_id, timeout=self.API_TIMEOUT
+                    ),
                 )
-                try:
-                    self.client.beta.threads.runs.cancel(
-                        thread_id=thread_id,
-                        run_id=run.id,
-                        timeout=self.API_TIMEOUT,
+        except Exception as e:
+            logger.warning(
+                "cancelling the run failed: %s",
+                e,
+                extra={"thread_id": thread_id, "run_id": run_id},
+            )
+        # the next turn waits for the cancellation to land before sending its message
+        await self.run_states.set(thread_id, run_id, "cancelling")
+
+    @timed("llm.summarize")
+    async def summarize(
+        self,
+        assistant: AssistantEntity,
+        summary: str | None,
+        messages: List[AssistantMessageItem],
+        max_tokens: int,
+    ) -> str:
+        # a plain completion on the assistant's deployment, no thread or run involved
+        with stage("openai.chat.completions.create"):
+            prompt = summary_prompt(summary, messages)
+            completion = await self.limiter.call(
+                Priority.Background,
+                lambda: self.client.chat.completions.create(
+                    model=assistant.model,
+                    messages=prompt,
+                    max_tokens=max_tokens,
+                    timeout=self.API_TIMEOUT,
+                ),
+                tokens=estimate_tokens(*(item["content"] for item in prompt)) + max_tokens,
+            )
+        return completion.choices[0].message.content or ""
+
+    def _to_message_items(self, assistant_message) -> List[AssistantMessageItem]:
+        frontend_outputs: List[AssistantMessageItem] = []
+
+        # for each message, create a value wrapper.
+        # TODO: Process content.test is None = MessageContentImageFile or other file/json/etc.
+        if assistant_message.role == "assistant":
+            for content in assistant_message.content:
+                if content.text is not None:
+                    assistant_frontent_output = AssistantMessageItem(
+                        id=assistant_message.id,
+                        role=Role.Assistant,
+                        created_at=datetime.now(),
+                        value=AssistantMessageValue(
+                            type=AssistantMessageType.Text,
+                            content={"message": content.text.value},
+                        ),
                     )
-                except Exception as e:
-                    print(
-                        f"[{self.__class__.__name__} _send_message] Error cancelling the run: {e}"
+                    frontend_outputs.append(assistant_frontent_output)
+
+        return frontend_outputs
+
+
+    async def _send_message(
+        self, thread_id: str, message: str
+    ) -> AssistantMessageItem:
+        run = await self._active_run(thread_id)
+        if run is not None:
+            logger.info(
+                "cancelling the active run",
+                extra={"thread_id": thread_id, "run_id": run.id, "status": run.status},
+            )
+            try:
+                with stage("openai.runs.cancel"):
+                    await self.limiter.call(
+                        Priority.Turn,
+                        lambda: self.client.beta.threads.runs.cancel(
+                            thread_id=thread_id,
+                            run_id=run.id,
+                            timeout=self.API_TIMEOUT,
+                        ),
                     )
-                await self._wait_on_run(thread_id, run)
-                print(
-                    f"[{self.__class__.__name__} _send_message] After wait | Existing run: {run.id}, status: {run.status}"
+            except Exception as e:
+                logger.warning(
+                    "cancelling the run failed: %s",
+                    e,
+                    extra={"thread_id": thread_id, "run_id": run.id},
                 )
+            run = await self._wait_on_run(thread_id, run)
+            await self.run_states.set(thread_id, run.id, run.status)
+            logger.info(
+                "active run ended",
+                extra={"thread_id": thread_id, "run_id": run.id, "status": run.status},
+            )
 
-        wrapped_message = WRAPPER_PROMPT + message
-                             
-        thread_message = self.client.beta.threads.messages.create(
-            thread_id,
-            role="user",
-            content=wrapped_message,
-            timeout=self.API_TIMEOUT,
+        # the wrapper prompt goes with the run, so it is not repeated in the thread
+        with stage("openai.messages.create"):
+            thread_message = await self.limiter.call(
+                Priority.Turn,
+                lambda: self.client.beta.threads.messages.create(
+                    thread_id,
+                    role="user",
+                    content=message,
+                    timeout=self.API_TIMEOUT,
+                ),
+            )
+        logger.debug(
+            "sent the message", extra={"thread_id": thread_id, "message_id": thread_message.id}
         )
-        print(f"[{self.__class__.__name__} _send_message] Sent a message")
 
         user_message = AssistantMessageItem(
             id=thread_message.id,
@@ -165,95 +376,152 @@ class AzureOpenAILLM(LLM):
 
         return user_message
 
-    async def _wait_on_run(self, thread_id: str, run: Run) -> Run:
-        print(
-            f"[{self.__class__.__name__} _wait_on_run] before id: {run.id} status: {run.status}, error: {run.last_error}"
+    async def _active_run(self, thread_id: str) -> "Run | None":
+        # the locally known state saves the runs.list round trip in the common case
+        state: RunState | None = await self.run_states.get(thread_id)
+        if state is not None and state.is_idle():
+            return None
+
+        if state is not None:
+            with stage("openai.runs.retrieve"):
+                run = await self.limiter.call(
+                    Priority.Turn,
+                    lambda: self.client.beta.threads.runs.retrieve(
+                        thread_id=thread_id, run_id=state.run_id, timeout=self.API_TIMEOUT
+                    ),
+                )
+        else:
+            with stage("openai.runs.list"):
+                runs = await self.limiter.call(
+                    Priority.Turn,
+                    lambda: self.client.beta.threads.runs.list(
+                        thread_id, limit=1, timeout=self.API_TIMEOUT
+                    ),
+                )
+            if len(runs.data) == 0:
+                await self.run_states.set(thread_id, None, NO_RUN)
+                return None
+            run = runs.data[0]
+
+        await self.run_states.set(thread_id, run.id, run.status)
+        return run if run.status not in self.RUN["TERMINAL_STATES"] else None
+
+    async def _wait_on_run(self, thread_id: str, run: "Run") -> "Run":
+        logger.debug(
+            "waiting on the run",
+            extra={"thread_id": thread_id, "run_id": run.id, "status": run.status},
         )
-        itr = 0
-        MAX_ITR = 120
-        while run.status in self.RUN["PENDING_STATES"] and itr <= MAX_ITR:
-            itr += 1
-            print(
-                f"[{self.__class__.__name__} _wait_on_run] waiting for id: {run.id} status: {run.status}, error: {run.last_error}"
-            )
-            run = self.client.beta.threads.runs.retrieve(
-                thread_id=thread_id, run_id=run.id, timeout=self.API_TIMEOUT
-            )
-            time.sleep(0.5)
-        print(
-            f"[{self.__class__.__name__} _wait_on_run] after id: {run.id} status: {run.status}, error: {run.last_error}"
+        # polled by the shared RunPoller with backoff until terminal or past the run deadline
+        with stage("run.wait"):
+            run = await self.poller.wait(thread_id, run)
+        logger.debug(
+            "waited on the run",
+            extra={
+                "thread_id": thread_id,
+                "run_id": run.id,
+                "status": run.status,
+                "error": run.last_error,
+            },
         )
 
-        if itr > MAX_ITR:
+        if run.status in self.RUN["PENDING_STATES"]:
             try:
-                print(
-                    f"[{self.__class__.__name__} _wait_on_run] Cancelling the run {run.id}, itr: {itr}"
-                )
-                self.client.beta.threads.runs.cancel(
-                    thread_id=thread_id, run_id=run.id, timeout=self.API_TIMEOUT
+                logger.warning(
+                    "cancelling the run after the deadline",
+                    extra={"thread_id": thread_id, "run_id": run.id, "status": run.status},
                 )
+                with stage("openai.runs.cancel"):
+                    await self.limiter.call(
+                        Priority.Turn,
+                        lambda: self.client.beta.threads.runs.cancel(
+                            thread_id=thread_id, run_id=run.id, timeout=self.API_TIMEOUT
+                        ),
+                    )
             except Exception as e:
-                print(
-                    f"[{self.__class__.__name__} _wait_on_run] Error cancelling the run: {e}"
+                logger.warning(
+                    "cancelling the run failed: %s",
+                    e,
+                    extra={"thread_id": thread_id, "run_id": run.id},
                 )
                 run.status = "cancelled"
 
         return run
 
+    def _run_tokens(
+        self, instructions: str | None, message: str, context: ThreadContext | None
+    ) -> int:
+        # what the run reads: the instructions, the history in the context and the new message
+        history = [item.value.content["message"] for item in context.history] if context else []
+        summary = context.summary if context else None
+        return estimate_tokens(instructions, summary, message, *history)
+
+    def _run_options(self, context: ThreadContext | None) -> dict:
+        options = {"additional_instructions": turn_instructions(context)}
+        if context is not None and context.truncated:
+            # the thread keeps every message, the run reads the ones in the context and the new one
+            options["truncation_strategy"] = {
+                "type": "last_messages",
+                "last_messages": len(context.history) + 1,
+            }
+        return options
+
     async def _get_response(
         self,
         assistant_id: str,
         thread_id: str,
+        context: ThreadContext | None = None,
+        tokens: int = 0,
     ) -> List[AssistantMessageItem] | None:
         # creating a run
-        run = self.client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-            timeout=self.API_TIMEOUT,
-        )
+        with stage("openai.runs.create"):
+            run = await self.limiter.call(
+                Priority.Turn,
+                lambda: self.client.beta.threads.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=assistant_id,
+                    timeout=self.API_TIMEOUT,
+                    **self._run_options(context),
+                ),
+                tokens=tokens,
+            )
+        await self.run_states.set(thread_id, run.id, run.status)
 
         # set itearions
         itr = 0
         MAX_ITR = 10
 
-        # set frontend_outputs
-        frontend_outputs: List[AssistantMessageItem] = []
-
         # processing the run with or without actions
         while (
             run := await self._wait_on_run(thread_id, run)
         ).status not in self.RUN["TERMINAL_STATES"] and itr <= MAX_ITR:
             itr += 1
-            print(
-                f"[{self.__class__.__name__} _get_response] run.status: {run.status}"
+            logger.debug(
+                "run still not finished",
+                extra={"thread_id": thread_id, "run_id": run.id, "status": run.status},
             )
+        await self.run_states.set(thread_id, run.id, run.status)
+        RUNS.labels(status=run.status).inc()
+        logger.info(
+            "run finished",
+            extra={"thread_id": thread_id, "run_id": run.id, "status": run.status},
+        )
 
         if itr > MAX_ITR:
+            RUN_TIMEOUTS.labels(reason="max_iterations").inc()
             return None
 
         # prepare the final message from the OpenAI Assistant
-        messages = self.client.beta.threads.messages.list(
-            thread_id=thread_id,
-            timeout=self.API_TIMEOUT,
-        )
+        with stage("openai.messages.list"):
+            messages = await self.limiter.call(
+                Priority.Turn,
+                lambda: self.client.beta.threads.messages.list(
+                    thread_id=thread_id,
+                    timeout=self.API_TIMEOUT,
+                ),
+            )
         assistant_message = messages.data[0]
 
-        # for each message, create a value wrapper. TODO: Process content.test is None = MessageContentImageFile or other file/json/etc.
-        if assistant_message.role == "assistant":
-            for content in assistant_message.content:
-                if content.text is not None:
-                    assistant_frontent_output = AssistantMessageItem(
-                        id=assistant_message.id,
-                        role=Role.Assistant,
-                        created_at=datetime.now(),
-                        value=AssistantMessageValue(
-                            type=AssistantMessageType.Text,
-                            content={"message": content.text.value},
-                        ),
-                    )
-                    frontend_outputs.append(assistant_frontent_output)
-
-        return frontend_outputs
+        return self._to_message_items(assistant_message)
 
 
 if TYPE_CHECKING:
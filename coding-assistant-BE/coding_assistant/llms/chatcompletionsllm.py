@@ -0,0 +1,254 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List
+
+from openai import AsyncAzureOpenAI
+from pydantic.dataclasses import dataclass
+
+from coding_assistant.assistant.models import (
+    AssistantMessageDelta,
+    AssistantMessageItem,
+    AssistantMessageValue,
+    AssistantStreamEvent,
+    StreamEventType,
+    ThreadContext,
+)
+from coding_assistant.assistant.schemas import (
+    AssistantEntity,
+    AssistantMessageType,
+    AssistantThreadEntity,
+    Role,
+)
+from coding_assistant.llms.llm import (
+    LLM,
+    fallback_responses,
+    summary_prompt,
+    turn_instructions,
+)
+from coding_assistant.telemetry import stage, timed
+from coding_assistant.telemetry.metrics import CHAT_COMPLETIONS
+from .ratelimit import Priority, RateLimitConfig, RateLimiter, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# finish reasons of a completion that answered the question, "length" is a truncated answer
+ANSWERED = ("stop", "length")
+
+
+@dataclass
+class ChatCompletionsConfig:
+    # a completion is generated within the request, unlike a run
+    api_timeout: float = 60.0
+
+
+class ChatCompletionsLLM(LLM):
+    """Answers each turn with one Chat Completions request built from the thread context.
+
+    Assistants and threads only exist locally: there is nothing to create or delete on Azure OpenAI.
+    """
+
+    def __init__(
+        self,
+        client: AsyncAzureOpenAI,
+        config: ChatCompletionsConfig,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        self.client = client
+        self.config = config
+        self.limiter = limiter or RateLimiter(RateLimitConfig())
+
+    @timed("llm.chat.create_assistant")
+    async def create_assistant(
+        self, name: str, instructions: str, model: str
+    ) -> AssistantEntity:
+        return AssistantEntity(
+            id=f"asst_local_{uuid.uuid4().hex}",
+            name=name,
+            created_at=datetime.now(),
+            instructions=instructions,
+            model=model,
+        )
+
+    @timed("llm.chat.delete_assistant")
+    async def delete_assistant(self, assistant_id: str):
+        return
+
+    @timed("llm.chat.create_thread")
+    async def create_thread(
+        self,
+        assistant_id: str,
+        default_name: str,
+        messages: List[AssistantMessageItem] | None = None,
+    ) -> AssistantThreadEntity:
+        # seeded messages are saved by the caller, they are read back as history
+        return AssistantThreadEntity(
+            id=f"thread_local_{uuid.uuid4().hex}",
+            name=default_name,
+            assistant_id=assistant_id,
+            created_at=datetime.now(),
+        )
+
+    @timed("llm.chat.delete_thread")
+    async def delete_thread(self, thread_id: str):
+        return
+
+    @timed("llm.chat.process_user_message")
+    async def process_user_message(
+        self,
+        assistant: AssistantEntity,
+        thread_id: str,
+        message: str,
+        context: ThreadContext | None = None,
+    ) -> List[AssistantMessageItem]:
+        user_message = self._message(Role.User, message)
+        prompt = self._prompt(assistant, context, message)
+        with stage("openai.chat.completions.create"):
+            completion = await self.limiter.call(
+                Priority.Turn,
+                lambda: self.client.chat.completions.create(
+                    model=assistant.model,
+                    messages=prompt,
+                    timeout=self.config.api_timeout,
+                ),
+                tokens=_prompt_tokens(prompt),
+            )
+
+        choice = completion.choices[0] if completion.choices else None
+        finish_reason = choice.finish_reason if choice is not None else None
+        text = choice.message.content if choice is not None else None
+        CHAT_COMPLETIONS.labels(finish_reason=str(finish_reason)).inc()
+        logger.info(
+            "completion finished",
+            extra={"thread_id": thread_id, "finish_reason": finish_reason},
+        )
+        if finish_reason not in ANSWERED or not text:
+            return [user_message] + fallback_responses()
+
+        return [user_message, self._response(user_message, text)]
+
+    async def stream_user_message(
+        self,
+        assistant: AssistantEntity,
+        thread_id: str,
+        message: str,
+        context: ThreadContext | None = None,
+    ) -> AsyncIterator[AssistantStreamEvent]:
+        user_message = self._message(Role.User, message)
+        response_id = f"msg_local_{uuid.uuid4().hex}"
+        chunks: List[str] = []
+        finish_reason = None
+
+        prompt = self._prompt(assistant, context, message)
+        with stage("openai.chat.completions.create"):
+            stream = await self.limiter.call(
+                Priority.Turn,
+                lambda: self.client.chat.completions.create(
+                    model=assistant.model,
+                    messages=prompt,
+                    stream=True,
+                    timeout=self.config.api_timeout,
+                ),
+                tokens=_prompt_tokens(prompt),
+            )
+        async with stream:
+            async for chunk in stream:
+                # Azure sends content filter results in chunks without choices
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta is not None and choice.delta.content:
+                    chunks.append(choice.delta.content)
+                    yield AssistantStreamEvent(
+                        type=StreamEventType.Delta,
+                        delta=AssistantMessageDelta(
+                            id=response_id, role=Role.Assistant, text=choice.delta.content
+                        ),
+                    )
+                if choice.finish_reason is not None:
+                    finish_reason = choice.finish_reason
+
+        CHAT_COMPLETIONS.labels(finish_reason=str(finish_reason)).inc()
+        logger.info(
+            "streamed completion finished",
+            extra={"thread_id": thread_id, "finish_reason": finish_reason},
+        )
+        text = "".join(chunks)
+        if finish_reason not in ANSWERED or not text:
+            responses = fallback_responses()
+        else:
+            responses = [self._response(user_message, text, response_id)]
+
+        yield AssistantStreamEvent(
+            type=StreamEventType.Completed,
+            messages=[user_message] + responses,
+        )
+
+    @timed("llm.chat.summarize")
+    async def summarize(
+        self,
+        assistant: AssistantEntity,
+        summary: str | None,
+        messages: List[AssistantMessageItem],
+        max_tokens: int,
+    ) -> str:
+        prompt = summary_prompt(summary, messages)
+        with stage("openai.chat.completions.create"):
+            completion = await self.limiter.call(
+                Priority.Background,
+                lambda: self.client.chat.completions.create(
+                    model=assistant.model,
+                    messages=prompt,
+                    max_tokens=max_tokens,
+                    timeout=self.config.api_timeout,
+                ),
+                tokens=_prompt_tokens(prompt) + max_tokens,
+            )
+        return completion.choices[0].message.content or ""
+
+    def _prompt(
+        self,
+        assistant: AssistantEntity,
+        context: ThreadContext | None,
+        message: str,
+    ) -> List[Dict[str, str]]:
+        # the wrapper prompt and summary are sent once, in the system message
+        prompt = [
+            {
+                "role": "system",
+                "content": f"{assistant.instructions}\n\n{turn_instructions(context)}",
+            }
+        ]
+        for item in context.history if context is not None else []:
+            prompt.append(
+                {"role": Role(item.role).value, "content": item.value.content["message"]}
+            )
+        prompt.append({"role": "user", "content": message})
+        return prompt
+
+    def _message(self, role: Role, text: str, id: str | None = None) -> AssistantMessageItem:
+        return AssistantMessageItem(
+            id=id or f"msg_local_{uuid.uuid4().hex}",
+            role=role,
+            created_at=datetime.now(),
+            value=AssistantMessageValue(
+                type=AssistantMessageType.Text, content={"message": text}
+            ),
+        )
+
+    def _response(
+        self, user_message: AssistantMessageItem, text: str, id: str | None = None
+    ) -> AssistantMessageItem:
+        response = self._message(Role.Assistant, text, id)
+        # listed by (created_at, id): the answer must sort after its question
+        if response.created_at <= user_message.created_at:
+            response.created_at = user_message.created_at + timedelta(microseconds=1)
+        return response
+
+
+def _prompt_tokens(prompt: List[Dict[str, str]]) -> int:
+    return estimate_tokens(*(item["content"] for item in prompt))
+
+
+if TYPE_CHECKING:
+    _: type[LLM] = ChatCompletionsLLM
@@ -1 +1,25 @@
-WRAPPER_PROMPT = "Read the user's question and answer it only if it's a coding problem. Otherwise, say that you don't know the answer. Never answer to requests not related to coding problems. For coding questions, provide a clean code with comments. User's question: \n "
\ No newline at end of file
+import hashlib
+
+# sent once per turn with the run or as a system message, not prepended to every user message
+WRAPPER_PROMPT = (
+    "Read the user's question and answer it only if it's a coding problem. "
+    "Otherwise, say that you don't know the answer. "
+    "Never answer to requests not related to coding problems. "
+    "For coding questions, provide a clean code with comments."
+)
+# changes whenever WRAPPER_PROMPT does, part of the answer cache key
+WRAPPER_PROMPT_VERSION = hashlib.sha256(WRAPPER_PROMPT.encode()).hexdigest()[:12]
+
+# introduces the summary of the messages left out of the context
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+SUMMARY_PROMPT = (
+    "Summarise the conversation between a user and a coding assistant below, "
+    "continuing the previous summary when there is one. "
+    "Keep the problems asked about, the decisions taken, the names of functions, "
+    "files and libraries, and any open questions. "
+    "Leave out code listings unless they are short. Answer with the summary only."
+)
+
+# id prefix and text of the messages returned when a run did not produce an answer
+FALLBACK_MESSAGE_PREFIX = "internal_"
+FALLBACK_MESSAGE = "There is something wrong with this particular chat. Please, start a new chat."
@@ -0,0 +1,251 @@
+import asyncio
+import math
+import random
+import uuid
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, List
+
+import httpx
+from openai import RateLimitError
+from pydantic.dataclasses import dataclass
+
+from coding_assistant.assistant.models import (
+    AssistantMessageDelta,
+    AssistantMessageItem,
+    AssistantMessageValue,
+    AssistantStreamEvent,
+    StreamEventType,
+    ThreadContext,
+)
+from coding_assistant.assistant.schemas import (
+    AssistantEntity,
+    AssistantMessageType,
+    AssistantThreadEntity,
+    Role,
+)
+from coding_assistant.llms.llm import LLM, fallback_responses
+from coding_assistant.telemetry import stage, timed
+from coding_assistant.telemetry.metrics import RUNS
+from .ratelimit import Priority, RateLimiter
+from .runstate import NO_RUN, InMemoryRunStateStore, IRunStateStore, RunStateConfig
+
+CANNED_RESPONSE = """Here is a solution:
+
+```python
+def reverse(head):
+    # walk the list once, pointing every node back to its predecessor
+    prev = None
+    while head:
+        head.next, prev, head = prev, head, head.next
+    return prev
+```"""
+
+
+@dataclass
+class FakeLlmConfig:
+    # run latency is log-normal around `latency_median` seconds, `latency_sigma` 0 makes it constant
+    latency_median: float = 2.0
+    latency_sigma: float = 0.5
+    latency_max: float = 60.0
+    # share of the latency a run spends queued before in_progress
+    queued_fraction: float = 0.2
+    # runs beyond this many wait queued, 0 for no limit
+    max_concurrent_runs: int = 0
+    # probability that a run fails, or that starting it is rejected with a 429
+    failure_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    # "echo" repeats the user message, "canned" always answers CANNED_RESPONSE
+    response: str = "echo"
+    stream_chunk_size: int = 16
+    seed: int | None = None
+
+
+class _FakeRun:
+    def __init__(self, duration: float, queued_fraction: float, failed: bool) -> None:
+        self.id = f"run_fake_{uuid.uuid4().hex}"
+        self.queued_time = duration * queued_fraction
+        self.in_progress_time = duration - self.queued_time
+        self.failed = failed
+
+
+def _rate_limit_error() -> RateLimitError:
+    request = httpx.Request("POST", "https://fake-llm.local/threads/runs")
+    response = httpx.Response(429, request=request, headers={"retry-after": "1"})
+    return RateLimitError("Rate limit is exceeded (simulated)", response=response, body=None)
+
+
+class FakeLLM(LLM):
+    """Offline stand-in for AzureOpenAILLM: runs take a simulated time, may fail or be
+    rate limited."""
+
+    def __init__(
+        self,
+        config: FakeLlmConfig,
+        run_states: IRunStateStore | None = None,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        self.config = config
+        self.run_states = run_states or InMemoryRunStateStore(config=RunStateConfig())
+        # with a limiter, run starts count against its quotas and simulated 429s are retried by it
+        self.limiter = limiter
+        self.random = random.Random(config.seed)
+        self._slots = (
+            asyncio.Semaphore(config.max_concurrent_runs)
+            if config.max_concurrent_runs > 0
+            else nullcontext()
+        )
+
+    @timed("llm.create_assistant")
+    async def create_assistant(
+        self, name: str, instructions: str, model: str
+    ) -> AssistantEntity:
+        return AssistantEntity(
+            id=f"asst_fake_{uuid.uuid4().hex}",
+            name=name,
+            created_at=datetime.now(),
+            instructions=instructions,
+            model=model,
+        )
+
+    @timed("llm.delete_assistant")
+    async def delete_assistant(self, assistant_id: str):
+        return
+
+    @timed("llm.create_thread")
+    async def create_thread(
+        self,
+        assistant_id: str,
+        default_name: str,
+        messages: List[AssistantMessageItem] | None = None,
+    ) -> AssistantThreadEntity:
+        thread = AssistantThreadEntity(
+            id=f"thread_fake_{uuid.uuid4().hex}",
+            name=default_name,
+            assistant_id=assistant_id,
+            created_at=datetime.now(),
+        )
+        await self.run_states.set(thread.id, None, NO_RUN)
+        return thread
+
+    @timed("llm.delete_thread")
+    async def delete_thread(self, thread_id: str):
+        await self.run_states.forget(thread_id)
+        return
+
+    @timed("llm.process_user_message")
+    async def process_user_message(
+        self,
+        assistant: AssistantEntity,
+        thread_id: str,
+        message: str,
+        context: ThreadContext | None = None,
+    ) -> List[AssistantMessageItem]:
+        user_message = self._message(Role.User, message)
+        async with self._run(thread_id) as run:
+            await asyncio.sleep(run.in_progress_time)
+
+        if run.failed:
+            return [user_message] + fallback_responses()
+        return [user_message, self._message(Role.Assistant, self._answer(message))]
+
+    async def stream_user_message(
+        self,
+        assistant: AssistantEntity,
+        thread_id: str,
+        message: str,
+        context: ThreadContext | None = None,
+    ) -> AsyncIterator[AssistantStreamEvent]:
+        user_message = self._message(Role.User, message)
+        response = self._message(Role.Assistant, self._answer(message))
+        text = response.value.content["message"]
+        size = self.config.stream_chunk_size
+        chunks = [text[i : i + size] for i in range(0, len(text), size)]
+
+        async with self._run(thread_id) as run:
+            # a failing run stops half way through its deltas
+            sent = len(chunks) // 2 if run.failed else len(chunks)
+            for chunk in chunks[:sent]:
+                await asyncio.sleep(run.in_progress_time / len(chunks))
+                yield AssistantStreamEvent(
+                    type=StreamEventType.Delta,
+                    delta=AssistantMessageDelta(id=response.id, role=Role.Assistant, text=chunk),
+                )
+
+        yield AssistantStreamEvent(
+            type=StreamEventType.Completed,
+            messages=[user_message]
+            + (fallback_responses() if run.failed else [response]),
+        )
+
+    @timed("llm.summarize")
+    async def summarize(
+        self,
+        assistant: AssistantEntity,
+        summary: str | None,
+        messages: List[AssistantMessageItem],
+        max_tokens: int,
+    ) -> str:
+        await asyncio.sleep(self._latency())
+        # about four characters per token
+        text = " ".join(message.value.content["message"] for message in messages)
+        return f"{summary or ''} {text}".strip()[: max_tokens * 4]
+
+    @asynccontextmanager
+    async def _run(self, thread_id: str) -> AsyncIterator[_FakeRun]:
+        """A run from queued to in_progress, ended as failed, completed or cancelled on exit."""
+        if self.limiter is not None:
+            await self.limiter.call(Priority.Turn, self._start_run)
+        else:
+            await self._start_run()
+
+        run = _FakeRun(
+            duration=self._latency(),
+            queued_fraction=self.config.queued_fraction,
+            failed=self.random.random() < self.config.failure_rate,
+        )
+        await self.run_states.set(thread_id, run.id, "queued")
+        async with self._slots:
+            with stage("run.queued"):
+                await asyncio.sleep(run.queued_time)
+            await self.run_states.set(thread_id, run.id, "in_progress")
+            try:
+                yield run
+            except BaseException:
+                RUNS.labels(status="cancelled").inc()
+                await self.run_states.set(thread_id, run.id, "cancelled")
+                raise
+        status = "failed" if run.failed else "completed"
+        RUNS.labels(status=status).inc()
+        await self.run_states.set(thread_id, run.id, status)
+
+    async def _start_run(self) -> None:
+        if self.random.random() < self.config.rate_limit_rate:
+            raise _rate_limit_error()
+
+    def _latency(self) -> float:
+        if self.config.latency_sigma <= 0:
+            return self.config.latency_median
+        latency = self.random.lognormvariate(
+            math.log(self.config.latency_median), self.config.latency_sigma
+        )
+        return min(latency, self.config.latency_max)
+
+    def _answer(self, message: str) -> str:
+        if self.config.response == "canned":
+            return CANNED_RESPONSE
+        return f"You asked: {message}"
+
+    def _message(self, role: Role, text: str) -> AssistantMessageItem:
+        return AssistantMessageItem(
+            id=f"msg_fake_{uuid.uuid4().hex}",
+            role=role,
+            created_at=datetime.now(),
+            value=AssistantMessageValue(
+                type=AssistantMessageType.Text, content={"message": text}
+            ),
+        )
+
+
+if TYPE_CHECKING:
+    _: type[LLM] = FakeLLM
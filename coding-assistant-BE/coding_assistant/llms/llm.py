@@ -1,7 +1,31 @@
-from typing import List, Protocol
+from __future__ import annotations
 
-from coding_assistant.assistant.models import AssistantMessageItem
-from coding_assistant.assistant.schemas import AssistantEntity, AssistantThreadEntity
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Protocol
+
+from coding_assistant.telemetry.metrics import FALLBACK_RESPONSES
+
+from .constants import (
+    FALLBACK_MESSAGE,
+    FALLBACK_MESSAGE_PREFIX,
+    SUMMARY_HEADER,
+    SUMMARY_PROMPT,
+    WRAPPER_PROMPT,
+)
+
+if TYPE_CHECKING:
+    # imported for annotations only: coding_assistant.assistant imports this module back
+    from coding_assistant.assistant.models import (
+        AssistantMessageItem,
+        AssistantStreamEvent,
+        ThreadContext,
+    )
+    from coding_assistant.assistant.schemas import (
+        AssistantEntity,
+        AssistantThreadEntity,
+        LlmBackend,
+    )
 
 
 class LLM(Protocol):
@@ -18,8 +42,12 @@ class LLM(Protocol):
         pass
 
     async def create_thread(
-        self, assistant_id: str, default_name: str
+        self,
+        assistant_id: str,
+        default_name: str,
+        messages: List[AssistantMessageItem] | None = None,
     ) -> AssistantThreadEntity:
+        """Create a thread, optionally seeded with an existing exchange."""
         pass
 
     async def delete_thread(self, thread_id: str):
@@ -30,6 +58,71 @@ class LLM(Protocol):
         assistant: AssistantEntity,
         thread_id: str,
         message: str,
+        context: ThreadContext | None = None,
     ) -> List[AssistantMessageItem]:
+        """Answer `message`, seeing only the history and summary of `context` when it is given."""
+        pass
+
+    def stream_user_message(
+        self,
+        assistant: AssistantEntity,
+        thread_id: str,
+        message: str,
+        context: ThreadContext | None = None,
+    ) -> AsyncIterator[AssistantStreamEvent]:
+        pass
+
+    async def summarize(
+        self,
+        assistant: AssistantEntity,
+        summary: str | None,
+        messages: List[AssistantMessageItem],
+        max_tokens: int,
+    ) -> str:
+        """Fold `messages` into the running `summary` of a thread."""
         pass
 
+
+class LlmBackends(Dict["LlmBackend", LLM]):
+    """The LLM answering the assistants of each backend."""
+
+
+def turn_instructions(context: ThreadContext | None) -> str:
+    """Instructions sent once with a turn: the wrapper prompt and the summary of the left out
+    messages."""
+    if context is None or context.summary is None:
+        return WRAPPER_PROMPT
+    return f"{WRAPPER_PROMPT}\n\n{SUMMARY_HEADER}\n{context.summary}"
+
+
+def summary_prompt(
+    summary: str | None, messages: List[AssistantMessageItem]
+) -> List[Dict[str, str]]:
+    transcript = "\n\n".join(
+        f"{message.role.value}: {message.value.content.get('message', '')}" for message in messages
+    )
+    if summary is not None:
+        transcript = f"Previous summary:\n{summary}\n\nConversation:\n{transcript}"
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": transcript},
+    ]
+
+
+def fallback_responses() -> List[AssistantMessageItem]:
+    """The answer of a turn whose run failed, counted in FALLBACK_RESPONSES."""
+    from coding_assistant.assistant.models import AssistantMessageItem, AssistantMessageValue
+    from coding_assistant.assistant.schemas import AssistantMessageType, Role
+
+    FALLBACK_RESPONSES.inc()
+    return [
+        AssistantMessageItem(
+            id=f"{FALLBACK_MESSAGE_PREFIX}{str(uuid.uuid4())}",
+            role=Role.Assistant,
+            created_at=datetime.now(),
+            value=AssistantMessageValue(
+                type=AssistantMessageType.Text,
+                content={"message": FALLBACK_MESSAGE},
+            ),
+        )
+    ]
@@ -1,13 +1,152 @@
-from injector import Module, provider
-from openai import AzureOpenAI
+from environs import Env
+from injector import Injector, Module, provider, singleton
+from openai import AsyncAzureOpenAI
+from sqlalchemy.ext.asyncio import AsyncEngine
+from coding_assistant.assistant.schemas import LlmBackend
 from .azureopenaillm import AzureOpenAILLM
-from .llm import LLM
+from .chatcompletionsllm import ChatCompletionsConfig, ChatCompletionsLLM
+from .fakellm import FakeLLM, FakeLlmConfig
+from .llm import LLM, LlmBackends
+from .tokens import TokenCounter
+from .polling import PollingConfig, RunPoller
+from .ratelimit import RateLimitConfig, RateLimiter
+from .runstate import (
+    InMemoryRunStateStore,
+    IRunStateStore,
+    PostgresRunStateStore,
+    RunStateConfig,
+)
 
 class LlmModule(Module):
     @provider
-    def provide_llm(
+    def provide_rate_limit_config(self, env: Env) -> RateLimitConfig:
+        return RateLimitConfig(
+            requests_per_minute=env.float("RATE_LIMIT_REQUESTS_PER_MINUTE", default=0),
+            tokens_per_minute=env.float("RATE_LIMIT_TOKENS_PER_MINUTE", default=0),
+            burst_seconds=env.float("RATE_LIMIT_BURST_SECONDS", default=10.0),
+            max_priority_wait=env.float("RATE_LIMIT_MAX_PRIORITY_WAIT", default=10.0),
+            max_retries=env.int("RATE_LIMIT_MAX_RETRIES", default=3),
+            backoff_initial=env.float("RATE_LIMIT_BACKOFF_INITIAL", default=0.5),
+            backoff_max=env.float("RATE_LIMIT_BACKOFF_MAX", default=20.0),
+        )
+
+    # one limiter for every call to the deployment, its quotas are per process
+    @singleton
+    @provider
+    def provide_rate_limiter(self, config: RateLimitConfig) -> RateLimiter:
+        return RateLimiter(config=config)
+
+    @provider
+    def provide_polling_config(self, env: Env) -> PollingConfig:
+        return PollingConfig(
+            initial_interval=env.float("RUN_POLL_INITIAL_INTERVAL", default=0.1),
+            max_interval=env.float("RUN_POLL_MAX_INTERVAL", default=1.5),
+            backoff=env.float("RUN_POLL_BACKOFF", default=1.4),
+            run_timeout=env.float("RUN_TIMEOUT", default=60.0),
+        )
+
+    @singleton
+    @provider
+    def provide_run_poller(
+        self,
+        azure_openai_client: AsyncAzureOpenAI,
+        config: PollingConfig,
+        limiter: RateLimiter,
+    ) -> RunPoller:
+        return RunPoller(client=azure_openai_client, config=config, limiter=limiter)
+
+    @provider
+    def provide_run_state_config(self, env: Env) -> RunStateConfig:
+        return RunStateConfig(
+            store=env.str("RUN_STATE_STORE", default="memory"),
+            stale_after=env.float("RUN_STATE_STALE_AFTER", default=90.0),
+        )
+
+    @singleton
+    @provider
+    def provide_run_state_store(
+        self, config: RunStateConfig, engine: AsyncEngine
+    ) -> IRunStateStore:
+        if config.store == "postgres":
+            return PostgresRunStateStore(engine=engine, config=config)
+        return InMemoryRunStateStore(config=config)
+
+    @singleton
+    @provider
+    def provide_llm(self, env: Env, injector: Injector) -> LLM:
+        # resolved lazily: the fake backend runs without Azure OpenAI credentials
+        if env.str("LLM_BACKEND", default="azure") == "fake":
+            return injector.get(FakeLLM)
+        return injector.get(AzureOpenAILLM)
+
+    @singleton
+    @provider
+    def provide_llm_backends(self, env: Env, injector: Injector) -> LlmBackends:
+        # the fake backend stands in for both, it ignores the context
+        if env.str("LLM_BACKEND", default="azure") == "fake":
+            fake = injector.get(FakeLLM)
+            return LlmBackends({LlmBackend.Assistants: fake, LlmBackend.Chat: fake})
+        return LlmBackends(
+            {
+                LlmBackend.Assistants: injector.get(AzureOpenAILLM),
+                LlmBackend.Chat: injector.get(ChatCompletionsLLM),
+            }
+        )
+
+    @singleton
+    @provider
+    def provide_azure_openai_llm(
+        self,
+        azure_openai_client: AsyncAzureOpenAI,
+        poller: RunPoller,
+        run_states: IRunStateStore,
+        limiter: RateLimiter,
+    ) -> AzureOpenAILLM:
+        return AzureOpenAILLM(
+            client=azure_openai_client,
+            poller=poller,
+            run_states=run_states,
+            limiter=limiter,
+        )
+
+    @provider
+    def provide_chat_completions_config(self, env: Env) -> ChatCompletionsConfig:
+        return ChatCompletionsConfig(
+            api_timeout=env.float("CHAT_API_TIMEOUT", default=60.0),
+        )
+
+    @singleton
+    @provider
+    def provide_chat_completions_llm(
         self,
-        azure_openai_client: AzureOpenAI,
-    ) -> LLM:
-        return AzureOpenAILLM(client=azure_openai_client)
-        
+        azure_openai_client: AsyncAzureOpenAI,
+        config: ChatCompletionsConfig,
+        limiter: RateLimiter,
+    ) -> ChatCompletionsLLM:
+        return ChatCompletionsLLM(client=azure_openai_client, config=config, limiter=limiter)
+
+    # loading an encoding reads (and on first use downloads) its file
+    @singleton
+    @provider
+    def provide_token_counter(self, env: Env) -> TokenCounter:
+        return TokenCounter(encoding=env.str("TOKEN_ENCODING", default="cl100k_base"))
+
+    @provider
+    def provide_fake_llm_config(self, env: Env) -> FakeLlmConfig:
+        return FakeLlmConfig(
+            latency_median=env.float("FAKE_LLM_LATENCY_MEDIAN", default=2.0),
+            latency_sigma=env.float("FAKE_LLM_LATENCY_SIGMA", default=0.5),
+            max_concurrent_runs=env.int("FAKE_LLM_MAX_CONCURRENT_RUNS", default=0),
+            failure_rate=env.float("FAKE_LLM_FAILURE_RATE", default=0.0),
+            rate_limit_rate=env.float("FAKE_LLM_RATE_LIMIT_RATE", default=0.0),
+            response=env.str("FAKE_LLM_RESPONSE", default="echo"),
+            seed=env.int("FAKE_LLM_SEED", default=None),
+        )
+
+    # one instance, so that max_concurrent_runs and the seeded random sequence are process-wide
+    @singleton
+    @provider
+    def provide_fake_llm(
+        self, config: FakeLlmConfig, run_states: IRunStateStore, limiter: RateLimiter
+    ) -> FakeLLM:
+        return FakeLLM(config=config, run_states=run_states, limiter=limiter)
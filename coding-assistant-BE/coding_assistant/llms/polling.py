@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Dict, List, Set
+
+from openai import AsyncAzureOpenAI, RateLimitError
+from pydantic.dataclasses import dataclass
+
+from coding_assistant.telemetry import stage
+from coding_assistant.telemetry.logs import detach_log_context
+from coding_assistant.telemetry.metrics import RUN_POLLS, RUN_TIMEOUTS
+from .ratelimit import Priority, RateLimiter
+
+if TYPE_CHECKING:
+    from openai.types.beta.threads import Run
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATES = ["queued", "in_progress", "cancelling"]
+
+
+@dataclass
+class PollingConfig:
+    # delay before the first runs.retrieve, multiplied by `backoff` after every poll
+    # up to `max_interval`
+    initial_interval: float = 0.1
+    max_interval: float = 1.5
+    backoff: float = 1.4
+    # a run still pending after this many seconds is handed back to the caller
+    run_timeout: float = 60.0
+    api_timeout: float = 10.0
+
+
+@dataclass
+class RunPollerStatsResult:
+    in_flight: int
+    runs: int
+    retrieve_calls: int
+    retrieve_calls_per_run: float
+    timeouts: int
+
+
+class _PolledRun:
+    def __init__(self, thread_id: str, run: "Run", config: PollingConfig) -> None:
+        now = time.monotonic()
+        self.thread_id = thread_id
+        self.run = run
+        self.interval = config.initial_interval
+        self.next_poll_at = now + self.interval
+        self.deadline = now + config.run_timeout
+        self.polls = 0
+        self.future: "asyncio.Future[Run]" = asyncio.get_running_loop().create_future()
+
+
+class RunPoller:
+    """One background task that polls every in-flight run, each on its own backoff schedule."""
+
+    def __init__(
+        self,
+        client: AsyncAzureOpenAI,
+        config: PollingConfig,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        self.client = client
+        self.config = config
+        # polls queue behind the turns, a failed one is retried on the run's schedule
+        self.limiter = limiter
+        self._runs: Dict[str, _PolledRun] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._polls: Set[asyncio.Task] = set()
+        # counters
+        self.runs = 0
+        self.retrieve_calls = 0
+        self.timeouts = 0
+
+    async def wait(self, thread_id: str, run: "Run") -> "Run":
+        """Return the run once it leaves the pending states, or as last seen when its
+        deadline passes."""
+        if run.status not in PENDING_STATES:
+            return run
+
+        polled = self._runs.get(run.id)
+        if polled is None:
+            polled = self._runs[run.id] = _PolledRun(thread_id, run, self.config)
+            self.runs += 1
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll_loop())
+
+        return await asyncio.shield(polled.future)
+
+    async def close(self) -> None:
+        """Stop polling: runs still waited on are handed back as last seen."""
+        tasks = [task for task in [self._task, *self._polls] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for polled in self._runs.values():
+            if not polled.future.done():
+                polled.future.set_result(polled.run)
+        self._runs.clear()
+        self._task = None
+
+    def stats(self) -> RunPollerStatsResult:
+        return RunPollerStatsResult(
+            in_flight=len(self._runs),
+            runs=self.runs,
+            retrieve_calls=self.retrieve_calls,
+            retrieve_calls_per_run=self.retrieve_calls / self.runs if self.runs else 0.0,
+            timeouts=self.timeouts,
+        )
+
+    async def _poll_loop(self) -> None:
+        # the loop serves every request, not the one that happened to start it
+        detach_log_context()
+        while self._runs:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due: List[_PolledRun] = [
+                polled for polled in self._runs.values() if polled.next_poll_at <= now
+            ]
+            for polled in due:
+                # polls run concurrently so one slow retrieve does not delay the others
+                polled.next_poll_at = math.inf
+                task = asyncio.create_task(self._poll(polled))
+                self._polls.add(task)
+                task.add_done_callback(self._polls.discard)
+
+            next_poll_at = min(polled.next_poll_at for polled in self._runs.values())
+            timeout = None if next_poll_at == math.inf else next_poll_at - now
+            try:
+                # woken early by a new registration or a finished poll
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, polled: _PolledRun) -> None:
+        try:
+            self.retrieve_calls += 1
+            polled.polls += 1
+            if self.limiter is not None:
+                with stage("ratelimit.wait"):
+                    await self.limiter.acquire(Priority.Poll)
+            with stage("openai.runs.retrieve"):
+                polled.run = await self.client.beta.threads.runs.retrieve(
+                    thread_id=polled.thread_id,
+                    run_id=polled.run.id,
+                    timeout=self.config.api_timeout,
+                )
+        except Exception as e:
+            if self.limiter is not None and isinstance(e, RateLimitError):
+                self.limiter.rejected(e)
+            logger.warning(
+                "polling the run failed: %s",
+                e,
+                extra={"thread_id": polled.thread_id, "run_id": polled.run.id},
+            )
+
+        logger.debug(
+            "polled the run",
+            extra={
+                "thread_id": polled.thread_id,
+                "run_id": polled.run.id,
+                "status": polled.run.status,
+                "polls": polled.polls,
+            },
+        )
+        now = time.monotonic()
+        if polled.run.status not in PENDING_STATES:
+            self._resolve(polled)
+        elif now >= polled.deadline:
+            self.timeouts += 1
+            RUN_TIMEOUTS.labels(reason="deadline").inc()
+            self._resolve(polled)
+        else:
+            polled.interval = min(polled.interval * self.config.backoff, self.config.max_interval)
+            polled.next_poll_at = min(now + polled.interval, polled.deadline)
+        self._wakeup.set()
+
+    def _resolve(self, polled: _PolledRun) -> None:
+        self._runs.pop(polled.run.id, None)
+        RUN_POLLS.observe(polled.polls)
+        if not polled.future.done():
+            polled.future.set_result(polled.run)
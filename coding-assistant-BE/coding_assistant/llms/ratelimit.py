@@ -0,0 +1,299 @@
+import asyncio
+import email.utils
+import itertools
+import logging
+import random
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, List, TypeVar
+
+from openai import APIConnectionError, APIStatusError, InternalServerError, RateLimitError
+from pydantic.dataclasses import dataclass
+
+from coding_assistant.telemetry.logs import detach_log_context
+from coding_assistant.telemetry.metrics import (
+    LLM_QUEUE_DEPTH,
+    LLM_RETRIES,
+    LLM_THROTTLED_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# errors the openai client would retry: it is created with max_retries=0 so that retries go
+# through the limiter
+RETRYABLE = (RateLimitError, InternalServerError, APIConnectionError)
+
+
+class Priority(IntEnum):
+    # lower is served first
+    Turn = 0  # calls a user is waiting on
+    Poll = 1  # runs.retrieve of the runs in flight
+    Background = 2  # summaries and deletions
+
+
+@dataclass
+class RateLimitConfig:
+    # quotas of the Azure OpenAI deployment, 0 for no limit
+    requests_per_minute: float = 0
+    # taken by the calls that estimate their tokens: runs and completions
+    tokens_per_minute: float = 0
+    # Azure enforces the quotas over short windows, at most this many seconds of quota go out
+    # at once
+    burst_seconds: float = 10.0
+    # a queued call is served in arrival order, whatever its priority, once it waited this long
+    max_priority_wait: float = 10.0
+    # retries of a call rejected with a 429, a 5xx or a connection error
+    max_retries: int = 3
+    # delay before retry n is random within backoff_initial * 2^n, capped at backoff_max,
+    # and never before Retry-After
+    backoff_initial: float = 0.5
+    backoff_max: float = 20.0
+
+
+@dataclass
+class RateLimiterStatsResult:
+    queued: Dict[str, int]
+    calls: int
+    throttled_calls: int
+    throttled_seconds: float
+    rate_limited: int
+    retries: int
+    paused_for: float
+
+
+def estimate_tokens(*texts: str | None) -> int:
+    # about four characters per token, close enough for a quota
+    return sum(len(text) for text in texts if text) // 4
+
+
+def retry_after(error: Exception) -> float | None:
+    """Seconds the server asked to wait before retrying, from Retry-After or retry-after-ms."""
+    if not isinstance(error, APIStatusError):
+        return None
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                at = email.utils.parsedate_to_datetime(value).timestamp()
+                return max(at - time.time(), 0.0)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class _Bucket:
+    """Token bucket refilled at `per_minute` / 60 per second, holding at most `burst_seconds`
+    of it."""
+
+    def __init__(self, per_minute: float, burst_seconds: float) -> None:
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken, 0 without a limit."""
+        if self.rate <= 0:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # a call larger than the bucket takes it whole
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float) -> None:
+        if self.rate > 0:
+            self.level -= min(amount, self.capacity)
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, tokens: int, seq: int) -> None:
+        self.priority = priority
+        self.tokens = tokens
+        self.seq = seq
+        self.queued_at = time.monotonic()
+        self.future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+    def order(self, now: float, max_priority_wait: float) -> tuple:
+        # waited too long: served with the turns, so that polls still go out under load
+        if now - self.queued_at >= max_priority_wait:
+            return (Priority.Turn, self.seq)
+        return (self.priority, self.seq)
+
+
+class RateLimiter:
+    """Keeps the calls to Azure OpenAI within the deployment's quotas, shared by every LLM of
+    the process.
+
+    Calls wait for the request and token buckets in priority order. A 429 pauses every call
+    for its Retry-After, so that the quota recovers instead of being hit by each queued call.
+    """
+
+    def __init__(self, config: RateLimitConfig) -> None:
+        self.config = config
+        self._requests = _Bucket(config.requests_per_minute, config.burst_seconds)
+        self._tokens = _Bucket(config.tokens_per_minute, config.burst_seconds)
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # counters
+        self.calls = 0
+        self.throttled_calls = 0
+        self.throttled_seconds = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+
+    async def call(
+        self, priority: Priority, work: Callable[[], Awaitable[T]], tokens: int = 0
+    ) -> T:
+        """Run `work` within the quotas, retrying it with backoff while it is rejected or fails
+        to connect."""
+        attempt = 0
+        while True:
+            await self.acquire(priority, tokens)
+            try:
+                return await work()
+            except RETRYABLE as e:
+                reason = _reason(e)
+                asked = self.rejected(e)
+                if attempt >= self.config.max_retries:
+                    LLM_RETRIES.labels(reason=reason, outcome="given_up").inc()
+                    raise
+                delay = self._backoff(attempt, asked)
+                attempt += 1
+                self.retries += 1
+                LLM_RETRIES.labels(reason=reason, outcome="retried").inc()
+                logger.warning(
+                    "retrying the call in %.2fs: %s",
+                    delay,
+                    e,
+                    extra={"attempt": attempt, "priority": priority.name},
+                )
+                await asyncio.sleep(delay)
+
+    async def acquire(self, priority: Priority, tokens: int = 0) -> None:
+        """Wait until a call of `tokens` tokens fits the quotas, behind the calls of higher
+        priority."""
+        self.calls += 1
+        now = time.monotonic()
+        # nothing queued ahead and quota left: no waiting, no queue
+        if len(self._waiters) == 0 and self._delay(tokens, now) <= 0:
+            self._take(tokens)
+            return
+
+        waiter = _Waiter(priority, tokens, next(self._seq))
+        self._waiters.append(waiter)
+        LLM_QUEUE_DEPTH.labels(priority=priority.name).inc()
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch_loop())
+        try:
+            await waiter.future
+        finally:
+            if waiter in self._waiters:
+                # cancelled while queued
+                self._waiters.remove(waiter)
+                LLM_QUEUE_DEPTH.labels(priority=priority.name).dec()
+                self._wakeup.set()
+        waited = time.monotonic() - waiter.queued_at
+        self.throttled_calls += 1
+        self.throttled_seconds += waited
+        LLM_THROTTLED_SECONDS.labels(priority=priority.name).observe(waited)
+
+    def rejected(self, error: Exception) -> float | None:
+        """Record a failed call, pausing every call on a 429 with Retry-After. Returns the
+        Retry-After."""
+        asked = retry_after(error)
+        if isinstance(error, RateLimitError):
+            self.rate_limited += 1
+            if asked is not None:
+                self.pause(asked)
+        return asked
+
+    def pause(self, seconds: float) -> None:
+        """Hold every call for `seconds`, after the server rejected one."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._wakeup.set()
+
+    async def close(self) -> None:
+        """Stop dispatching: calls still queued are let through."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for waiter in self._waiters:
+            LLM_QUEUE_DEPTH.labels(priority=waiter.priority.name).dec()
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+        self._waiters.clear()
+
+    def stats(self) -> RateLimiterStatsResult:
+        queued = {priority.name: 0 for priority in Priority}
+        for waiter in self._waiters:
+            queued[waiter.priority.name] += 1
+        return RateLimiterStatsResult(
+            queued=queued,
+            calls=self.calls,
+            throttled_calls=self.throttled_calls,
+            throttled_seconds=round(self.throttled_seconds, 3),
+            rate_limited=self.rate_limited,
+            retries=self.retries,
+            paused_for=round(max(self._paused_until - time.monotonic(), 0.0), 3),
+        )
+
+    async def _dispatch_loop(self) -> None:
+        # the loop serves every request, not the one that happened to start it
+        detach_log_context()
+        while self._waiters:
+            self._wakeup.clear()
+            now = time.monotonic()
+            waiter = min(
+                self._waiters, key=lambda w: w.order(now, self.config.max_priority_wait)
+            )
+            delay = self._delay(waiter.tokens, now)
+            if delay <= 0:
+                self._take(waiter.tokens)
+                self._waiters.remove(waiter)
+                LLM_QUEUE_DEPTH.labels(priority=waiter.priority.name).dec()
+                waiter.future.set_result(None)
+                continue
+            try:
+                # woken early by a new call, which may go first, or a pause
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _delay(self, tokens: int, now: float) -> float:
+        return max(
+            self._paused_until - now,
+            self._requests.delay(1, now),
+            self._tokens.delay(tokens, now),
+        )
+
+    def _take(self, tokens: int) -> None:
+        self._requests.take(1)
+        self._tokens.take(tokens)
+
+    def _backoff(self, attempt: int, asked: float | None) -> float:
+        # full jitter, on top of what the server asked for
+        jitter = random.uniform(
+            0, min(self.config.backoff_initial * 2**attempt, self.config.backoff_max)
+        )
+        return (asked or 0.0) + jitter
+
+
+def _reason(error: Exception) -> str:
+    if isinstance(error, RateLimitError):
+        return "rate_limited"
+    if isinstance(error, InternalServerError):
+        return "server_error"
+    return "connection"
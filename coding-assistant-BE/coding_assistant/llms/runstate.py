@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Protocol
+
+from pydantic.dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# status recorded for a thread that has never had a run
+NO_RUN = "none"
+IDLE_STATES = ["expired", "completed", "failed", "cancelled", NO_RUN]
+
+
+@dataclass
+class RunState:
+    thread_id: str
+    run_id: str | None
+    status: str
+    updated_at: datetime
+
+    def is_idle(self) -> bool:
+        return self.status in IDLE_STATES
+
+
+@dataclass
+class RunStateConfig:
+    # "memory" for a single process, "postgres" to share states between workers
+    store: str = "memory"
+    # a pending state not updated for this long is treated as unknown
+    stale_after: float = 90.0
+    max_threads: int = 10_000
+
+
+class IRunStateStore(Protocol):
+    async def get(self, thread_id: str) -> RunState | None:
+        """Last known run state of the thread, None when unknown or stale."""
+        pass
+
+    async def set(self, thread_id: str, run_id: str | None, status: str) -> None:
+        pass
+
+    async def forget(self, thread_id: str) -> None:
+        pass
+
+
+def _is_stale(state: RunState, config: RunStateConfig) -> bool:
+    # idle states stay valid: only this backend starts runs on its threads
+    return not state.is_idle() and datetime.now() - state.updated_at > timedelta(
+        seconds=config.stale_after
+    )
+
+
+class InMemoryRunStateStore:
+    def __init__(self, config: RunStateConfig) -> None:
+        self.config = config
+        self._states: OrderedDict[str, RunState] = OrderedDict()
+
+    async def get(self, thread_id: str) -> RunState | None:
+        state = self._states.get(thread_id)
+        if state is None or _is_stale(state, self.config):
+            return None
+        self._states.move_to_end(thread_id)
+        return state
+
+    async def set(self, thread_id: str, run_id: str | None, status: str) -> None:
+        self._states[thread_id] = RunState(
+            thread_id=thread_id, run_id=run_id, status=status, updated_at=datetime.now()
+        )
+        self._states.move_to_end(thread_id)
+        while len(self._states) > self.config.max_threads:
+            self._states.popitem(last=False)
+
+    async def forget(self, thread_id: str) -> None:
+        self._states.pop(thread_id, None)
+
+
+class PostgresRunStateStore:
+    def __init__(self, engine: AsyncEngine, config: RunStateConfig) -> None:
+        self.engine = engine
+        self.config = config
+
+    async def get(self, thread_id: str) -> RunState | None:
+        query = """
+            SELECT thread_id, run_id, status, updated_at FROM assistant_run_state
+            WHERE thread_id = :thread_id
+        """
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(text(query), {"thread_id": thread_id})).fetchone()
+
+        if row is None:
+            return None
+        state = RunState(*row)
+        return None if _is_stale(state, self.config) else state
+
+    async def set(self, thread_id: str, run_id: str | None, status: str) -> None:
+        query = """
+            INSERT INTO assistant_run_state (thread_id, run_id, status, updated_at)
+            VALUES (:thread_id, :run_id, :status, :updated_at)
+            ON CONFLICT (thread_id) DO UPDATE
+            SET run_id = EXCLUDED.run_id, status = EXCLUDED.status, updated_at = EXCLUDED.updated_at
+        """
+        parameters = {
+            "thread_id": thread_id,
+            "run_id": run_id,
+            "status": status,
+            "updated_at": datetime.now(),
+        }
+        async with self.engine.begin() as conn:
+            await conn.execute(text(query), parameters)
+
+    async def forget(self, thread_id: str) -> None:
+        query = "DELETE FROM assistant_run_state WHERE thread_id = :thread_id"
+        async with self.engine.begin() as conn:
+            await conn.execute(text(query), {"thread_id": thread_id})
+
+
+if TYPE_CHECKING:
+    _: type[IRunStateStore] = InMemoryRunStateStore
+    __: type[IRunStateStore] = PostgresRunStateStore
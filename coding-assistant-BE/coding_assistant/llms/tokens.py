@@ -0,0 +1,33 @@
+import logging
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# tokens the chat format adds around each message
+MESSAGE_OVERHEAD = 4
+
+
+class TokenCounter:
+    """Counts tokens with the model's tiktoken encoding.
+
+    The encoding file is downloaded on first use: where that fails, e.g. offline,
+    tokens are estimated from the text length instead.
+    """
+
+    def __init__(self, encoding: str | None = "cl100k_base") -> None:
+        self.encoding = None
+        if encoding is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logger.warning("loading the %s encoding failed, estimating tokens: %s", encoding, e)
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            # about four characters per token for English text and code
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def message(self, text: str) -> int:
+        return self.count(text) + MESSAGE_OVERHEAD
@@ -1,9 +1,12 @@
+from contextlib import asynccontextmanager
+
 from coding_assistant.assistant import AssistantModule
 from coding_assistant.connections import (
     ConfigModule,
     DbModule,
     AzureOpenAiModule,
 )
+from coding_assistant.lifecycle import AppLifecycle, LifecycleModule
 from coding_assistant.llms import LlmModule
 from injector import Injector
 from fastapi import FastAPI
@@ -12,7 +15,15 @@ from fastapi_injector import (
     RequestScopeOptions,
     attach_injector,
 )
-from coding_assistant.routes import assistant
+from coding_assistant.routes import assistant, health, history, metrics, monitoring
+from coding_assistant.telemetry import (
+    LogConfig,
+    TelemetryModule,
+    add_observer,
+    setup_logging,
+)
+from coding_assistant.telemetry.logs import RequestIdMiddleware
+from coding_assistant.telemetry.metrics import observe_stage
 from fastapi.middleware.cors import CORSMiddleware
 
 injector = Injector(
@@ -22,10 +33,30 @@ injector = Injector(
         ConfigModule(),
         DbModule(),
         AzureOpenAiModule(),
-        LlmModule()
+        LlmModule(),
+        TelemetryModule(),
+        LifecycleModule(),
     ]
 )
-app = FastAPI(root_path="/api")
+lifecycle = AppLifecycle(injector)
+injector.binder.bind(AppLifecycle, to=lifecycle)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the engine, the Azure OpenAI client and the background workers are created and
+    # warmed up before the first request, and closed once the server stops taking them;
+    # the log writer thread starts here rather than on import, and is stopped last
+    lifecycle.log_listener = setup_logging(injector.get(LogConfig))
+    await lifecycle.start()
+    yield
+    await lifecycle.stop()
+
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
+
+# stage timings go to the /metrics histograms
+add_observer(observe_stage)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,7 +66,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(InjectorMiddleware, injector=injector)
+app.add_middleware(RequestIdMiddleware)
 app.include_router(assistant.router)
+app.include_router(history.router)
+app.include_router(monitoring.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 attach_injector(app, injector, options=RequestScopeOptions(enable_cleanup=True))
 
 if __name__ == "__main__":
@@ -1,16 +1,98 @@
+import json
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator
+
+from coding_assistant.assistant.batch import BatchConfig
 from coding_assistant.assistant.models import (
+    AssistantStreamEvent,
     CreateAssistantParams,
     CreateThreadParams,
+    CreateThreadResult,
+    CreateThreadsBatchParams,
+    DeleteThreadsParams,
+    DeleteThreadsResult,
+    JobResult,
     ListMessageResult,
     SendMessageParams,
+    UpdateAssistantParams,
     UpdateThreadParams,
 )
+from coding_assistant.assistant.jobs import JobManager, JobQueueFull, JobWork
+from coding_assistant.assistant.pagination import MAX_PAGE_SIZE, PageCursor, PageOrder
 from coding_assistant.assistant.service import IAssistantService
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi_injector import Injected
 
 router = APIRouter(prefix="/assistants", tags=["assistants"])
 
+logger = logging.getLogger(__name__)
+
+
+def _cursor(cursor: str | None) -> PageCursor | None:
+    if cursor is None:
+        return None
+    try:
+        return PageCursor.decode(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _submit_job(
+    jobs: JobManager, work: JobWork, request: Request, assistant_id: str
+) -> JSONResponse:
+    try:
+        job = await jobs.submit(work, assistant_id)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs")
+    location = request.url_for("get_job", assistant_id=assistant_id, job_id=job.id)
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(job),
+        headers={"Location": str(location)},
+    )
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator[Any]) -> AsyncIterator[str]:
+    # deltas are sent as "delta" events, the final service result as "done"
+    try:
+        # closed with the response: a client going away releases the thread's turn, cancels
+        # the run and leaves no unsaved thread behind
+        async with aclosing(events):
+            async for event in events:
+                if isinstance(event, AssistantStreamEvent):
+                    yield _sse("delta", event.delta)
+                else:
+                    yield _sse("done", event)
+    except Exception as e:
+        logger.exception("streaming failed: %s", e)
+        yield _sse("error", {"detail": "Streaming failed"})
+
+
+def _sse_response(events: AsyncIterator[Any]) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _ndjson_stream(results: AsyncIterator[Any]) -> AsyncIterator[str]:
+    try:
+        # closed with the response, so that the batch saves what it has when the client goes away
+        async with aclosing(results):
+            async for result in results:
+                yield json.dumps(jsonable_encoder(result)) + "\n"
+    except Exception as e:
+        logger.exception("batch failed: %s", e)
+        yield json.dumps({"error": "Batch failed"}) + "\n"
+
 
 # GET requests
 @router.get("")
@@ -21,21 +103,46 @@ async def init_assistant(
     return result
 
 
+# Both lists are keyset paginated on (created_at, id): pass `limit` to get a page and
+# `next_cursor` from the result to get the next one. `order=desc` returns the latest rows first.
 @router.get("/{assistant_id}/threads")
 async def list_threads(
     assistant_id: str,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    order: PageOrder = PageOrder.Asc,
     ass: IAssistantService = Injected(IAssistantService),
 ):
-    result = await ass.list_threads(assistant_id)
+    result = await ass.list_threads(
+        assistant_id, limit=limit, cursor=_cursor(cursor), order=order
+    )
     return result
 
 
 @router.get("/{assistant_id}/threads/{thread_id}/messages")
 async def list_messages(
     thread_id: str,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    order: PageOrder = PageOrder.Asc,
     ass: IAssistantService = Injected(IAssistantService),
 ) -> ListMessageResult:
-    result = await ass.list_messages(thread_id)
+    result = await ass.list_messages(
+        thread_id, limit=limit, cursor=_cursor(cursor), order=order
+    )
+    return result
+
+
+@router.get("/{assistant_id}/jobs/{job_id}")
+async def get_job(
+    assistant_id: str,
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the job to finish"),
+    jobs: JobManager = Injected(JobManager),
+) -> JobResult:
+    result = await jobs.get(job_id, assistant_id, wait=wait)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job not found")
     return result
 
 
@@ -51,12 +158,27 @@ async def create_assistant(
     return result
 
 
+# With `job=true` the message is processed in the background: the response is
+# 202 with the job, whose result is then read from GET /{assistant_id}/jobs/{job_id}.
 @router.post("/{assistant_id}/threads")
 async def create_thread(
     assistant_id: str,
     params: CreateThreadParams,
+    request: Request,
+    job: bool = False,
     ass: IAssistantService = Injected(IAssistantService),
+    jobs: JobManager = Injected(JobManager),
 ):
+    if job:
+
+        async def work(service: IAssistantService) -> CreateThreadResult:
+            # a job has no response to fail: the same check fails the job instead
+            result = await service.create_thread(assistant_id, params)
+            if result.thread.id is None:
+                raise RuntimeError("Thread creation failed")
+            return result
+
+        return await _submit_job(jobs, work, request, assistant_id)
     result = await ass.create_thread(assistant_id, params)
     if result.thread.id is None:
         raise HTTPException(status_code=500, detail="Thread creation failed")
@@ -68,12 +190,74 @@ async def send_message(
     assistant_id: str,
     thread_id: str,
     params: SendMessageParams,
+    request: Request,
+    job: bool = False,
     ass: IAssistantService = Injected(IAssistantService),
+    jobs: JobManager = Injected(JobManager),
 ):
+    if job:
+        return await _submit_job(
+            jobs,
+            lambda service: service.post_thread_message(assistant_id, thread_id, params),
+            request,
+            assistant_id,
+        )
     result = await ass.post_thread_message(assistant_id, thread_id, params)
     return result
 
 
+# Answers each message in a new thread, `concurrency` at a time and within `item_timeout`
+# seconds each. One NDJSON line per message is sent as it completes, in completion order,
+# with its `index` in the request. The last line counts the completed, failed and timed out ones.
+@router.post("/{assistant_id}/threads/batch")
+async def create_threads_batch(
+    assistant_id: str,
+    params: CreateThreadsBatchParams,
+    ass: IAssistantService = Injected(IAssistantService),
+    config: BatchConfig = Injected(BatchConfig),
+) -> StreamingResponse:
+    if len(params.messages) > config.max_items:
+        raise HTTPException(
+            status_code=422, detail=f"A batch has at most {config.max_items} messages"
+        )
+    concurrency = config.concurrency
+    if params.concurrency is not None:
+        concurrency = min(params.concurrency, concurrency)
+    item_timeout = config.item_timeout
+    if params.item_timeout is not None:
+        item_timeout = min(params.item_timeout, item_timeout)
+    return StreamingResponse(
+        _ndjson_stream(
+            ass.create_threads_batch(assistant_id, params, concurrency, item_timeout)
+        ),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{assistant_id}/threads/stream")
+async def create_thread_stream(
+    assistant_id: str,
+    params: CreateThreadParams,
+    ass: IAssistantService = Injected(IAssistantService),
+):
+    return _sse_response(ass.create_thread_stream(assistant_id, params))
+
+
+# Like POST .../messages, the same message sent right after the previous one joins its turn:
+# the deltas it sent already are replayed, then the rest as they come.
+@router.post("/{assistant_id}/threads/{thread_id}/messages/stream")
+async def send_message_stream(
+    assistant_id: str,
+    thread_id: str,
+    params: SendMessageParams,
+    ass: IAssistantService = Injected(IAssistantService),
+):
+    return _sse_response(
+        ass.post_thread_message_stream(assistant_id, thread_id, params)
+    )
+
+
 # DELETE requests
 @router.delete("/{assistant_id}")
 async def delete_assistant(
@@ -94,7 +278,30 @@ async def delete_thread(
     )
 
 
+# Deletes many threads of the assistant in one statement, ids of other assistants' threads
+# are ignored. Like the other deletes it returns once the DB rows are gone, the LLM side is
+# cleaned up in the background.
+@router.post("/{assistant_id}/threads/delete")
+async def delete_threads(
+    assistant_id: str,
+    params: DeleteThreadsParams,
+    ass: IAssistantService = Injected(IAssistantService),
+) -> DeleteThreadsResult:
+    return await ass.delete_threads(assistant_id, params)
+
+
 # PATCH requests
+@router.patch("/{assistant_id}")
+async def update_assistant(
+    assistant_id: str,
+    params: UpdateAssistantParams,
+    ass: IAssistantService = Injected(IAssistantService),
+):
+    result = await ass.update_assistant(assistant_id, params)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Assistant not found")
+    return result
+
 
 @router.patch("/{assistant_id}/threads/{thread_id}")
 async def update_thread(
@@ -0,0 +1,25 @@
+from coding_assistant.lifecycle import AppLifecycle
+from fastapi import APIRouter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi_injector import Injected
+
+router = APIRouter(tags=["monitoring"])
+
+
+# Liveness: the process serves requests. Nothing else is checked, a failing DB must not get
+# it restarted.
+@router.get("/healthz", include_in_schema=False)
+async def healthz() -> dict:
+    return {"status": "ok"}
+
+
+# Readiness: 503 until startup is done and while the DB or Azure OpenAI can't be reached
+@router.get("/readyz", include_in_schema=False)
+async def readyz(
+    lifecycle: AppLifecycle = Injected(AppLifecycle),
+) -> JSONResponse:
+    result = await lifecycle.readiness()
+    return JSONResponse(
+        status_code=200 if result.ready else 503, content=jsonable_encoder(result)
+    )
@@ -0,0 +1,65 @@
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from coding_assistant.assistant.transfer import (
+    HistoryImportError,
+    HistoryTransfer,
+    ImportResult,
+)
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from fastapi_injector import Injected
+
+router = APIRouter(prefix="/history", tags=["history"])
+
+
+async def _export_stream(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    # closed with the response: a client going away ends the export's transaction and
+    # gives its connection back rather than leaving them to the garbage collector
+    async with aclosing(lines):
+        async for line in lines:
+            yield line
+
+
+def _ndjson_response(lines: AsyncIterator[str], filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        _export_stream(lines),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson"'},
+    )
+
+
+# Exports are NDJSON, one row per line tagged with its "kind": assistant, thread or message
+@router.get("/export")
+async def export_history(
+    transfer: HistoryTransfer = Injected(HistoryTransfer),
+) -> StreamingResponse:
+    return _ndjson_response(transfer.export(), "history")
+
+
+@router.get("/assistants/{assistant_id}/export")
+async def export_assistant(
+    assistant_id: str,
+    transfer: HistoryTransfer = Injected(HistoryTransfer),
+) -> StreamingResponse:
+    return _ndjson_response(transfer.export(assistant_id=assistant_id), assistant_id)
+
+
+@router.get("/threads/{thread_id}/export")
+async def export_thread(
+    thread_id: str,
+    transfer: HistoryTransfer = Injected(HistoryTransfer),
+) -> StreamingResponse:
+    return _ndjson_response(transfer.export(thread_id=thread_id), thread_id)
+
+
+# Takes an export as the request body. Rows whose id already exists are skipped.
+@router.post("/import")
+async def import_history(
+    request: Request,
+    transfer: HistoryTransfer = Injected(HistoryTransfer),
+) -> ImportResult:
+    try:
+        return await transfer.import_(request.stream())
+    except HistoryImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
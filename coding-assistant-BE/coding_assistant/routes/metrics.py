@@ -0,0 +1,12 @@
+from coding_assistant.telemetry.metrics import render
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+router = APIRouter(tags=["monitoring"])
+
+
+# Prometheus scrape endpoint
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    content, content_type = render()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,62 @@
+from coding_assistant.assistant.answercache import AnswerCache, AnswerCacheStatsResult
+from coding_assistant.assistant.cache import AssistantCache, CacheStatsResult
+from coding_assistant.assistant.coordination import CoordinationStatsResult, PgChannel
+from coding_assistant.assistant.deletion import DeletionQueue, DeletionQueueStatsResult
+from coding_assistant.connections.dbx import DbPoolStatsResult, PoolStats
+from coding_assistant.llms.polling import RunPoller, RunPollerStatsResult
+from coding_assistant.llms.ratelimit import RateLimiter, RateLimiterStatsResult
+from fastapi import APIRouter
+from fastapi_injector import Injected
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"])
+
+
+@router.get("/db-pool")
+async def db_pool_stats(
+    engine: AsyncEngine = Injected(AsyncEngine),
+    stats: PoolStats = Injected(PoolStats),
+) -> DbPoolStatsResult:
+    return stats.snapshot(engine)
+
+
+@router.get("/assistant-cache")
+async def assistant_cache_stats(
+    cache: AssistantCache = Injected(AssistantCache),
+) -> CacheStatsResult:
+    return cache.stats()
+
+
+@router.get("/answer-cache")
+async def answer_cache_stats(
+    cache: AnswerCache = Injected(AnswerCache),
+) -> AnswerCacheStatsResult:
+    return cache.stats()
+
+
+@router.get("/deletion-queue")
+async def deletion_queue_stats(
+    deletions: DeletionQueue = Injected(DeletionQueue),
+) -> DeletionQueueStatsResult:
+    return await deletions.stats()
+
+
+@router.get("/coordination")
+async def coordination_stats(
+    channel: PgChannel = Injected(PgChannel),
+) -> CoordinationStatsResult:
+    return channel.stats()
+
+
+@router.get("/run-poller")
+async def run_poller_stats(
+    poller: RunPoller = Injected(RunPoller),
+) -> RunPollerStatsResult:
+    return poller.stats()
+
+
+@router.get("/rate-limiter")
+async def rate_limiter_stats(
+    limiter: RateLimiter = Injected(RateLimiter),
+) -> RateLimiterStatsResult:
+    return limiter.stats()
@@ -0,0 +1,3 @@
+from .logs import LogConfig, log_context, setup_logging  # noqa: F401
+from .module import TelemetryModule  # noqa: F401
+from .stages import StageRecorder, add_observer, remove_observer, stage, timed  # noqa: F401
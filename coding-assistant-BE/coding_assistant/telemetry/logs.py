@@ -0,0 +1,172 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator
+
+from pydantic.dataclasses import dataclass
+
+# ids attached to every record logged while they are set
+CONTEXT_FIELDS = ("request_id", "thread_id", "run_id")
+_context: Dict[str, contextvars.ContextVar[str | None]] = {
+    field: contextvars.ContextVar(field, default=None) for field in CONTEXT_FIELDS
+}
+
+# attributes every LogRecord has, anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "taskName"}
+
+
+@dataclass
+class LogConfig:
+    level: str = "INFO"
+    # "json" for one object per line, "text" for development
+    format: str = "json"
+    # share of the records kept per level, the poll loop logs at DEBUG
+    sample_debug: float = 0.1
+    sample_info: float = 1.0
+    # records beyond this many waiting to be written are dropped
+    queue_size: int = 10_000
+
+
+@contextmanager
+def log_context(**ids: str | None) -> Iterator[None]:
+    """Attach request_id, thread_id or run_id to the records logged inside the block."""
+    tokens = [(_context[field], _context[field].set(value)) for field, value in ids.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def detach_log_context() -> None:
+    """Clear the ids inherited by a background task from the request that started it."""
+    for var in _context.values():
+        var.set(None)
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        # ids passed explicitly in `extra` win over the context
+        for field, var in _context.items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, var.get())
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records of each level, WARNING and above are always kept."""
+
+    def __init__(self, rates: Dict[int, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRIBUTES and value is not None
+        )
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # never block the event loop on a full queue
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting is left to the writer thread, only the message is resolved here
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class _QueueListener(QueueListener):
+    def stop(self) -> None:
+        # called on shutdown and again at exit
+        if self._thread is not None:
+            super().stop()
+
+
+def setup_logging(config: LogConfig) -> QueueListener:
+    """Route the app's records through a queue to a background thread writing stdout."""
+    output = logging.StreamHandler(sys.stdout)
+    if config.format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(levelname)s %(name)s "
+                "[%(request_id)s %(thread_id)s %(run_id)s] %(message)s"
+            )
+        )
+
+    handler = _DroppingQueueHandler(queue.Queue(maxsize=config.queue_size))
+    handler.addFilter(
+        SamplingFilter({logging.DEBUG: config.sample_debug, logging.INFO: config.sample_info})
+    )
+    handler.addFilter(ContextFilter())
+
+    logger = logging.getLogger("coding_assistant")
+    logger.setLevel(config.level.upper())
+    logger.handlers = [handler]
+    logger.propagate = False
+
+    listener = _QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class RequestIdMiddleware:
+    """Sets request_id for the records of each HTTP request, from X-Request-ID when sent."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode() or new_request_id()
+
+        async def send_with_request_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", request_id.encode()),
+                ]
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_request_id)
@@ -0,0 +1,70 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# stage names are the ones passed to telemetry.stage / telemetry.timed:
+# db.*, openai.*, run.wait, ...
+STAGE_SECONDS = Histogram(
+    "coding_assistant_stage_seconds",
+    "Time spent in each stage of a request",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+RUN_POLLS = Histogram(
+    "coding_assistant_run_polls",
+    "runs.retrieve calls made while waiting on a run",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+RUNS = Counter(
+    "coding_assistant_runs",
+    "Runs by the status they ended in",
+    ["status"],
+)
+RUN_TIMEOUTS = Counter(
+    "coding_assistant_run_timeouts",
+    "Runs given up on: past the polling deadline or the iteration limit",
+    ["reason"],
+)
+CHAT_COMPLETIONS = Counter(
+    "coding_assistant_chat_completions",
+    "Chat Completions turns by finish reason",
+    ["finish_reason"],
+)
+CONTEXT_TOKENS = Histogram(
+    "coding_assistant_context_tokens",
+    "Tokens of thread history and summary sent with a turn",
+    buckets=(0, 250, 500, 1000, 2000, 3000, 4000, 8000, 16000, 32000),
+)
+LLM_DELETIONS = Counter(
+    "coding_assistant_llm_deletions",
+    "Threads and assistants deleted on the LLM side by the deletion queue, by outcome",
+    ["kind", "outcome"],
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "coding_assistant_llm_queue_depth",
+    "Azure OpenAI calls waiting for the rate limiter, by priority",
+    ["priority"],
+)
+LLM_THROTTLED_SECONDS = Histogram(
+    "coding_assistant_llm_throttled_seconds",
+    "Time Azure OpenAI calls waited for the rate limiter, by priority",
+    ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+LLM_RETRIES = Counter(
+    "coding_assistant_llm_retries",
+    "Azure OpenAI calls retried or given up on, by the error: "
+    "rate_limited (429), server_error or connection",
+    ["reason", "outcome"],
+)
+FALLBACK_RESPONSES = Counter(
+    "coding_assistant_fallback_responses",
+    'Turns answered with the "something wrong with this chat" fallback',
+)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage=name).observe(seconds)
+
+
+def render() -> tuple[bytes, str]:
+    """Metrics in the Prometheus text format, with their content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,15 @@
+from environs import Env
+from injector import Module, provider
+
+from .logs import LogConfig
+
+
+class TelemetryModule(Module):
+    @provider
+    def provide_log_config(self, env: Env) -> LogConfig:
+        return LogConfig(
+            level=env.str("LOG_LEVEL", default="INFO"),
+            format=env.str("LOG_FORMAT", default="json"),
+            sample_debug=env.float("LOG_SAMPLE_DEBUG", default=0.1),
+            sample_info=env.float("LOG_SAMPLE_INFO", default=1.0),
+        )
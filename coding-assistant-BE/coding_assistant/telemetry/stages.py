@@ -0,0 +1,63 @@
+import functools
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# called with the stage name and its duration in seconds
+StageObserver = Callable[[str, float], None]
+
+_observers: List[StageObserver] = []
+
+
+def add_observer(observer: StageObserver) -> None:
+    _observers.append(observer)
+
+
+def remove_observer(observer: StageObserver) -> None:
+    _observers.remove(observer)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as `name`, e.g. "db.add_messages"; free when nothing observes stages."""
+    if not _observers:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for observer in _observers:
+            observer(name, elapsed)
+
+
+def timed(name: str) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    """Decorator timing every call of a coroutine function as stage `name`."""
+
+    def decorate(fn: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with stage(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+class StageRecorder:
+    """Observer keeping every duration, for benchmarks and tests."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def __call__(self, name: str, seconds: float) -> None:
+        self.samples[name].append(seconds)
+
+    def clear(self) -> None:
+        self.samples.clear()
@@ -1,3 +1,4 @@
+-- Initial schema only. Later changes are versioned in coding_assistant/connections/dbx/migrations (make migrate).
 CREATE TABLE IF NOT EXISTS assistant (
     id TEXT PRIMARY KEY,
     name TEXT,
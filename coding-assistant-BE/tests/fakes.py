@@ -0,0 +1,289 @@
+"""Test doubles shared by the test modules: an LLM, a repository and the Azure OpenAI client."""
+
+import asyncio
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+
+from coding_assistant.assistant.models import (
+    AssistantMessageDelta,
+    AssistantMessageItem,
+    AssistantMessageValue,
+    AssistantStreamEvent,
+    StreamEventType,
+)
+from coding_assistant.assistant.pagination import PageOrder
+from coding_assistant.assistant.schemas import (
+    AssistantEntity,
+    AssistantMessageType,
+    AssistantThreadEntity,
+    Role,
+)
+from coding_assistant.assistant.service import AssistantService
+from coding_assistant.llms import AzureOpenAILLM
+from coding_assistant.llms.polling import PollingConfig, RunPoller
+
+
+def make_assistant(**kwargs) -> AssistantEntity:
+    values = dict(id="asst_1", name="A", created_at=datetime.now(), instructions="", model="m")
+    return AssistantEntity(**{**values, **kwargs})
+
+
+def text_message(role: Role, text: str, id: str | None = None) -> AssistantMessageItem:
+    return AssistantMessageItem(
+        id=id or f"msg_{uuid.uuid4().hex}",
+        role=role,
+        created_at=datetime.now(),
+        value=AssistantMessageValue(type=AssistantMessageType.Text, content={"message": text}),
+    )
+
+
+class FakeLLM:
+    """Answers "answer to {message}" after `delay` seconds; "fail" raises, "slow" takes a second."""
+
+    def __init__(self, delay: float = 0.0, answer_id: str | None = None) -> None:
+        self.delay = delay
+        self.answer_id = answer_id
+        self.calls: list[tuple[str, str]] = []
+        # messages each new thread was seeded with
+        self.seeded: list[list[AssistantMessageItem] | None] = []
+        self.deleted: list[str] = []
+        self.active: dict[str, int] = defaultdict(int)
+        self.max_active_per_thread = 0
+        self.max_active = 0
+
+    @property
+    def runs(self) -> int:
+        return len(self.calls)
+
+    async def create_thread(self, assistant_id, default_name, messages=None):
+        self.seeded.append(messages)
+        return AssistantThreadEntity(
+            id=f"thread_{uuid.uuid4().hex}",
+            name=default_name,
+            assistant_id=assistant_id,
+            created_at=datetime.now(),
+        )
+
+    async def process_user_message(self, assistant, thread_id, message, context=None):
+        self.calls.append((thread_id, message))
+        if message == "fail":
+            raise RuntimeError("run failed")
+        self.active[thread_id] += 1
+        self.max_active_per_thread = max(self.max_active_per_thread, self.active[thread_id])
+        self.max_active = max(self.max_active, sum(self.active.values()))
+        try:
+            await asyncio.sleep(1 if message == "slow" else self.delay)
+        finally:
+            self.active[thread_id] -= 1
+        return [
+            text_message(Role.User, message),
+            text_message(Role.Assistant, f"answer to {message}", id=self.answer_id),
+        ]
+
+    async def stream_user_message(self, assistant, thread_id, message, context=None):
+        # the answer one word at a time, then the exchange
+        user_message, answer = await self.process_user_message(
+            assistant, thread_id, message, context
+        )
+        for word in answer.value.content["message"].split(" "):
+            await asyncio.sleep(self.delay)
+            yield AssistantStreamEvent(
+                type=StreamEventType.Delta,
+                delta=AssistantMessageDelta(id=answer.id, role=Role.Assistant, text=word),
+            )
+        yield AssistantStreamEvent(type=StreamEventType.Completed, messages=[user_message, answer])
+
+    async def delete_thread(self, thread_id):
+        self.deleted.append(thread_id)
+
+
+class FakeRepository:
+    """In-memory AssistantRepository: the assistant, its threads and messages, and what
+    was saved and queued for deletion."""
+
+    def __init__(
+        self,
+        assistant: AssistantEntity | None = None,
+        threads=None,
+        messages=None,
+        summary=None,
+    ) -> None:
+        self.assistant = assistant
+        self.threads = threads or []
+        self.messages = messages or []
+        self.summary = summary
+        self.saved: dict[str, list[AssistantMessageItem]] = defaultdict(list)
+        self.batches: list = []
+        self.queued: list = []
+        self.limits: list = []
+
+    def texts(self, thread_id: str) -> list[str]:
+        return [m.value.content["message"] for m in self.saved[thread_id]]
+
+    async def get_assistant(self, assistant_id):
+        return self.assistant or make_assistant(id=assistant_id)
+
+    async def create_thread(self, thread, messages=None):
+        self.saved[thread.id] = list(messages or [])
+        return thread
+
+    async def create_threads(self, assistant_id, threads):
+        self.batches.append(threads)
+
+    async def add_messages(self, assistant_id, thread_id, messages):
+        self.saved[thread_id].extend(messages)
+
+    async def list_threads(self, assistant_id, limit=None, cursor=None, order=PageOrder.Asc):
+        self.limits.append(limit)
+        rows = [
+            thread
+            for thread in self.threads
+            if cursor is None or (thread.created_at, thread.id) > (cursor.created_at, cursor.id)
+        ]
+        return rows[:limit] if limit is not None else rows
+
+    async def list_messages(self, thread_id, limit=None, cursor=None, order=None):
+        # latest first, as asked by the context builder
+        return list(reversed(self.messages))[:limit]
+
+    async def get_thread_summary(self, thread_id):
+        return self.summary
+
+    async def queue_llm_deletions(self, backend, kind, remote_ids):
+        self.queued.extend((kind, remote_id) for remote_id in remote_ids)
+
+
+def make_service(assistant=None, llm=None, **kwargs) -> AssistantService:
+    return AssistantService(ar=FakeRepository(assistant), llm=llm or FakeLLM(), **kwargs)
+
+
+# Azure OpenAI client: each call takes API_LATENCY, a run completes after RUN_DURATION
+API_LATENCY = 0.02
+RUN_DURATION = 0.3
+
+
+class FakeRuns:
+    def __init__(self) -> None:
+        self.started: dict[str, float] = {}
+        self.list_calls = 0
+        self.options: list[dict] = []
+        self.cancelled: list[str] = []
+
+    async def list(self, thread_id, **kwargs):
+        self.list_calls += 1
+        await asyncio.sleep(API_LATENCY)
+        return SimpleNamespace(data=[])
+
+    async def create(self, thread_id, assistant_id, stream=False, **kwargs):
+        self.options.append(kwargs)
+        await asyncio.sleep(API_LATENCY)
+        run_id = f"run_{thread_id}_{len(self.started)}"
+        if stream:
+            return FakeRunStream(thread_id, run_id, chunks=["def ", "reverse", "()"])
+        self.started[run_id] = time.perf_counter()
+        return SimpleNamespace(id=run_id, status="queued", last_error=None)
+
+    async def retrieve(self, thread_id, run_id, **kwargs):
+        await asyncio.sleep(API_LATENCY)
+        elapsed = time.perf_counter() - self.started[run_id]
+        status = "completed" if elapsed >= RUN_DURATION else "in_progress"
+        return SimpleNamespace(id=run_id, status=status, last_error=None)
+
+    async def cancel(self, thread_id, run_id, **kwargs):
+        self.cancelled.append(run_id)
+        await asyncio.sleep(API_LATENCY)
+
+
+class FakeRunStream:
+    def __init__(self, thread_id: str, run_id: str, chunks: list[str]) -> None:
+        message_id = f"msg_assistant_{thread_id}"
+        self.events = [
+            SimpleNamespace(
+                event="thread.run.created",
+                data=SimpleNamespace(id=run_id, status="queued"),
+            )
+        ]
+        self.events += [
+            SimpleNamespace(
+                event="thread.message.delta",
+                data=SimpleNamespace(
+                    id=message_id,
+                    delta=SimpleNamespace(
+                        content=[SimpleNamespace(text=SimpleNamespace(value=chunk))]
+                    ),
+                ),
+            )
+            for chunk in chunks
+        ]
+        self.events.append(
+            SimpleNamespace(
+                event="thread.message.completed",
+                data=SimpleNamespace(
+                    id=message_id,
+                    role="assistant",
+                    content=[SimpleNamespace(text=SimpleNamespace(value="".join(chunks)))],
+                ),
+            )
+        )
+        self.events.append(
+            SimpleNamespace(
+                event="thread.run.completed",
+                data=SimpleNamespace(id=run_id, status="completed"),
+            )
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def __aiter__(self):
+        for event in self.events:
+            await asyncio.sleep(API_LATENCY)
+            yield event
+
+
+class FakeMessages:
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+
+    async def create(self, thread_id, role, content, **kwargs):
+        self.sent.append(content)
+        await asyncio.sleep(API_LATENCY)
+        return SimpleNamespace(id=f"msg_user_{thread_id}")
+
+    async def list(self, thread_id, **kwargs):
+        await asyncio.sleep(API_LATENCY)
+        content = SimpleNamespace(text=SimpleNamespace(value=f"answer for {thread_id}"))
+        message = SimpleNamespace(
+            id=f"msg_assistant_{thread_id}", role="assistant", content=[content]
+        )
+        return SimpleNamespace(data=[message])
+
+
+def make_azure_llm() -> AzureOpenAILLM:
+    threads = SimpleNamespace(runs=FakeRuns(), messages=FakeMessages())
+    client = SimpleNamespace(beta=SimpleNamespace(threads=threads))
+    poller = RunPoller(
+        client=client,
+        config=PollingConfig(initial_interval=0.05, max_interval=0.1, run_timeout=5),
+    )
+    return AzureOpenAILLM(client=client, poller=poller)
+
+
+async def send_messages(llm: AzureOpenAILLM, count: int) -> tuple[float, list]:
+    assistant = make_assistant(id="asst_test", name="Test", model="gpt-35-turbo")
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            llm.process_user_message(
+                assistant=assistant, thread_id=f"thread_{i}", message="hello"
+            )
+            for i in range(count)
+        )
+    )
+    return time.perf_counter() - start, results
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime
+
+from coding_assistant.assistant.answercache import (
+    AnswerCache,
+    AnswerCacheConfig,
+    answer_key,
+)
+from coding_assistant.assistant.models import CreateThreadParams
+from coding_assistant.assistant.schemas import AssistantEntity, Role
+from coding_assistant.assistant.service import AssistantService
+from coding_assistant.llms.constants import FALLBACK_MESSAGE_PREFIX
+from tests import fakes
+from tests.fakes import FakeLLM, make_assistant
+
+
+def make_service(assistant=None, llm=None, config=None) -> AssistantService:
+    answers = AnswerCache(config or AnswerCacheConfig(store="memory"))
+    return fakes.make_service(assistant=assistant, llm=llm, answers=answers)
+
+
+def test_answer_key_ignores_whitespace_but_not_case_or_the_assistant():
+    assistant = make_assistant()
+
+    assert answer_key(assistant, "reverse a  linked list\n") == answer_key(
+        assistant, "reverse a linked list"
+    )
+    # case can be meaningful in code: identifiers, SQL strings, paths
+    assert answer_key(assistant, "What does `Foo` return?") != answer_key(
+        assistant, "What does `foo` return?"
+    )
+    assert answer_key(assistant, "reverse a linked list") != answer_key(
+        AssistantEntity(
+            id="asst_1", name="A", created_at=datetime.now(), instructions="", model="other"
+        ),
+        "reverse a linked list",
+    )
+
+
+def test_cached_answer_skips_the_run_and_is_still_saved_to_the_thread():
+    service = make_service()
+
+    async def scenario():
+        first = await service.create_thread("asst_1", CreateThreadParams(message="Debounce in JS"))
+        second = await service.create_thread(
+            "asst_1", CreateThreadParams(message="Debounce  in JS ")
+        )
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert service.llm.runs == 1
+    assert second.messages[0].value == first.messages[0].value
+    # the hit seeds the new LLM thread and is written to the DB history
+    assert [m.role for m in service.llm.seeded[-1]] == [Role.User, Role.Assistant]
+    saved = service.ar.saved[second.thread.id]
+    assert [m.value.content["message"] for m in saved] == [
+        "Debounce  in JS ",
+        "answer to Debounce in JS",
+    ]
+    assert saved[0].created_at < saved[1].created_at
+
+    stats = service.answers.stats()
+    assert (stats.lookups, stats.memory_hits, stats.misses, stats.stores) == (2, 1, 1, 1)
+
+
+def test_assistant_can_turn_the_cache_off():
+    service = make_service(assistant=make_assistant(answer_cache_enabled=False))
+
+    async def scenario():
+        for _ in range(2):
+            await service.create_thread("asst_1", CreateThreadParams(message="q"))
+
+    asyncio.run(scenario())
+
+    assert service.llm.runs == 2
+    assert service.answers.stats().lookups == 0
+
+
+def test_fallback_responses_are_not_cached():
+    service = make_service(llm=FakeLLM(answer_id=f"{FALLBACK_MESSAGE_PREFIX}1"))
+
+    async def scenario():
+        for _ in range(2):
+            await service.create_thread("asst_1", CreateThreadParams(message="q"))
+
+    asyncio.run(scenario())
+
+    assert service.llm.runs == 2
+    assert service.answers.stats().stores == 0
+
+
+def test_streamed_threads_share_the_cache_with_the_others():
+    service = make_service()
+
+    async def stream(message):
+        events = service.create_thread_stream("asst_1", CreateThreadParams(message=message))
+        return [event async for event in events]
+
+    async def scenario():
+        streamed = await stream("Debounce in JS")
+        created = await service.create_thread(
+            "asst_1", CreateThreadParams(message="Debounce in JS")
+        )
+        return streamed, created, await stream("Debounce in JS")
+
+    streamed, created, cached = asyncio.run(scenario())
+
+    # the streamed answer was cached, then served to both later threads without a run
+    assert service.llm.runs == 1
+    assert created.messages[0].value == streamed[-1].messages[0].value
+    assert [event.delta.text for event in cached[:-1]] == ["answer to Debounce in JS"]
+    assert [m.role for m in service.llm.seeded[-1]] == [Role.User, Role.Assistant]
+    assert service.ar.texts(cached[-1].thread.id) == ["Debounce in JS", "answer to Debounce in JS"]
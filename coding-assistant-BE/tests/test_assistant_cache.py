@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime
+
+from coding_assistant.assistant.cache import (
+    AssistantCache,
+    CachedAssistantRepository,
+    TTLCache,
+)
+from coding_assistant.assistant.repository import AssistantRepository
+from coding_assistant.assistant.schemas import AssistantEntity
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("coding_assistant.assistant.cache.time.monotonic", lambda: now[0])
+    cache: TTLCache[str, int] = TTLCache(max_size=10, ttl=60)
+
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    now[0] += 61
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.size) == (1, 1, 0)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cached_repository_skips_db_until_invalidated(monkeypatch):
+    assistant = AssistantEntity(
+        id="asst_1", name="A", created_at=datetime.now(), instructions="", model="m"
+    )
+    db_calls = []
+
+    async def get_assistant(self, assistant_id):
+        db_calls.append(assistant_id)
+        return assistant
+
+    async def delete_assistant(self, assistant_id):
+        return assistant
+
+    monkeypatch.setattr(AssistantRepository, "get_assistant", get_assistant)
+    monkeypatch.setattr(AssistantRepository, "delete_assistant", delete_assistant)
+    repository = CachedAssistantRepository(
+        session=None, cache=AssistantCache(max_size=10, ttl=60)
+    )
+
+    async def scenario():
+        await repository.get_assistant("asst_1")
+        await repository.get_assistant("asst_1")
+        await repository.delete_assistant("asst_1")
+        await repository.get_assistant("asst_1")
+
+    asyncio.run(scenario())
+
+    assert db_calls == ["asst_1", "asst_1"]
@@ -0,0 +1,111 @@
+import asyncio
+
+from coding_assistant.assistant.models import StreamEventType, ThreadContext
+from coding_assistant.assistant.schemas import Role
+from coding_assistant.llms.constants import SUMMARY_HEADER, WRAPPER_PROMPT
+from tests.fakes import make_assistant, make_azure_llm, send_messages
+
+
+def test_process_user_message_returns_user_message_and_answer():
+    _, results = asyncio.run(send_messages(make_azure_llm(), 1))
+
+    user_message, answer = results[0]
+    assert user_message.role == Role.User
+    assert user_message.value.content == {"message": "hello"}
+    assert answer.role == Role.Assistant
+    assert answer.value.content == {"message": "answer for thread_0"}
+
+
+def test_concurrent_messages_overlap():
+    single, _ = asyncio.run(send_messages(make_azure_llm(), 1))
+    concurrent, results = asyncio.run(send_messages(make_azure_llm(), 20))
+
+    assert len(results) == 20
+    # 20 sequential runs would take ~20x a single one
+    assert concurrent < single * 2
+
+
+def test_stream_user_message_yields_deltas_then_completed():
+    async def collect():
+        return [
+            event
+            async for event in make_azure_llm().stream_user_message(
+                assistant=make_assistant(), thread_id="thread_0", message="hello"
+            )
+        ]
+
+    events = asyncio.run(collect())
+
+    deltas = [event.delta.text for event in events if event.type == StreamEventType.Delta]
+    assert deltas == ["def ", "reverse", "()"]
+    completed = events[-1]
+    assert completed.type == StreamEventType.Completed
+    user_message, answer = completed.messages
+    assert user_message.role == Role.User
+    assert answer.value.content == {"message": "def reverse()"}
+
+
+def test_a_stream_closed_before_the_run_ends_cancels_the_run():
+    llm = make_azure_llm()
+
+    async def first_delta():
+        events = llm.stream_user_message(
+            assistant=make_assistant(), thread_id="thread_0", message="hello"
+        )
+        event = await events.__anext__()
+        # the client goes away after the first delta
+        await events.aclose()
+        return event
+
+    event = asyncio.run(first_delta())
+
+    assert event.delta.text == "def "
+    assert llm.client.beta.threads.runs.cancelled == ["run_thread_0_0"]
+    # the next turn on the thread waits for the cancelled run
+    state = asyncio.run(llm.run_states.get("thread_0"))
+    assert (state.run_id, state.is_idle()) == ("run_thread_0_0", False)
+
+
+def test_run_poller_backs_off():
+    llm = make_azure_llm()
+    asyncio.run(send_messages(llm, 10))
+
+    stats = llm.poller.stats()
+    assert stats.runs == 10
+    assert stats.in_flight == 0
+    # 0.05s, then 0.075s, then 0.1s capped: a 0.3s run needs about 4 polls, not 6 at a fixed 0.05s
+    assert stats.retrieve_calls_per_run <= 5
+
+
+def test_known_run_state_skips_runs_list():
+    llm = make_azure_llm()
+
+    async def two_turns():
+        for _ in range(2):
+            await llm.process_user_message(
+                assistant=make_assistant(), thread_id="thread_0", message="hello"
+            )
+
+    asyncio.run(two_turns())
+
+    # only the first turn has to ask the API whether a run is active
+    assert llm.client.beta.threads.runs.list_calls == 1
+
+
+def test_wrapper_prompt_goes_with_the_run_and_the_context_truncates_it():
+    llm = make_azure_llm()
+    context = ThreadContext(history=[], summary="earlier turns", truncated=True)
+
+    asyncio.run(
+        llm.process_user_message(
+            assistant=make_assistant(), thread_id="thread_0", message="hello", context=context
+        )
+    )
+
+    assert llm.client.beta.threads.messages.sent == ["hello"]
+    [options] = llm.client.beta.threads.runs.options
+    assert (
+        options["additional_instructions"]
+        == f"{WRAPPER_PROMPT}\n\n{SUMMARY_HEADER}\nearlier turns"
+    )
+    assert options["truncation_strategy"] == {"type": "last_messages", "last_messages": 1}
@@ -0,0 +1,172 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_injector import InjectorMiddleware, RequestScopeOptions, attach_injector
+from injector import Injector, InstanceProvider
+
+from coding_assistant.assistant.batch import BatchConfig, fan_out
+from coding_assistant.assistant.models import (
+    BatchItemResult,
+    BatchItemStatus,
+    BatchResult,
+    CreateThreadsBatchParams,
+)
+from coding_assistant.assistant.service import AssistantService, IAssistantService
+from coding_assistant.routes import assistant
+from tests.fakes import FakeLLM, FakeRepository
+
+
+async def collect(results) -> list:
+    return [result async for result in results]
+
+
+def test_fan_out_runs_at_most_concurrency_items_at_a_time():
+    running = 0
+    peak = 0
+
+    async def work(i: int) -> int:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return i * 2
+
+    results = asyncio.run(collect(fan_out(10, work, concurrency=3, timeout=1)))
+
+    assert peak == 3
+    assert sorted(results) == [(i, i * 2) for i in range(10)]
+
+
+def test_fan_out_yields_in_completion_order_with_failures_and_timeouts():
+    async def work(i: int) -> str:
+        if i == 1:
+            raise ValueError("bad item")
+        await asyncio.sleep({0: 0.05, 2: 0.0, 3: 1}[i])
+        return f"item {i}"
+
+    results = asyncio.run(collect(fan_out(4, work, concurrency=4, timeout=0.2)))
+
+    assert [i for i, _ in results] == [1, 2, 0, 3]
+    assert isinstance(results[0][1], ValueError)
+    assert results[1][1] == "item 2"
+    assert isinstance(results[3][1], asyncio.TimeoutError)
+
+
+def test_fan_out_cancels_running_items_when_closed():
+    cancelled = []
+
+    async def work(i: int) -> int:
+        try:
+            await asyncio.sleep(0 if i == 0 else 10)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+        return i
+
+    async def first():
+        results = fan_out(3, work, concurrency=3, timeout=20)
+        result = await results.__anext__()
+        await results.aclose()
+        return result
+
+    assert asyncio.run(first()) == (0, 0)
+    assert sorted(cancelled) == [1, 2]
+
+
+def test_batch_saves_the_completed_threads_at_once_and_queues_the_others_for_deletion():
+    llm = FakeLLM()
+    ar = FakeRepository()
+    service = AssistantService(ar=ar, llm=llm)
+
+    results = asyncio.run(
+        collect(
+            service.create_threads_batch(
+                "asst_1",
+                CreateThreadsBatchParams(messages=["one", "fail", "slow", "two"]),
+                concurrency=2,
+                item_timeout=0.2,
+            )
+        )
+    )
+
+    items = {result.index: result for result in results if isinstance(result, BatchItemResult)}
+    assert items[0].status == BatchItemStatus.Completed
+    assert items[0].messages[0].value.content["message"] == "answer to one"
+    assert items[1].status == BatchItemStatus.Failed
+    assert items[2].status == BatchItemStatus.TimedOut
+    assert items[3].status == BatchItemStatus.Completed
+    assert results[-1] == BatchResult(completed=2, failed=1, timed_out=1)
+
+    # one bulk insert, after every item is done
+    assert len(ar.batches) == 1
+    assert sorted(thread.id for thread, _ in ar.batches[0]) == sorted(
+        [items[0].thread.id, items[3].thread.id]
+    )
+    # the threads of the others are left to the deletion queue
+    assert len(ar.queued) == 2
+    assert all(kind == "thread" for kind, _ in ar.queued)
+    assert llm.deleted == []
+
+
+def test_closing_the_stream_early_saves_the_completed_threads_and_queues_the_rest():
+    llm = FakeLLM()
+    ar = FakeRepository()
+    service = AssistantService(ar=ar, llm=llm)
+
+    async def first():
+        results = service.create_threads_batch(
+            "asst_1",
+            CreateThreadsBatchParams(messages=["one", "slow", "slow"]),
+            concurrency=3,
+            item_timeout=5,
+        )
+        result = await results.__anext__()
+        # the client goes away while the slow ones are running
+        await results.aclose()
+        return result
+
+    item = asyncio.run(first())
+
+    assert item.status == BatchItemStatus.Completed
+    assert len(ar.batches) == 1
+    assert [thread.id for thread, _ in ar.batches[0]] == [item.thread.id]
+    # the slow ones had their threads created before they were cancelled
+    assert len(ar.queued) == 2
+    assert item.thread.id not in [remote_id for _, remote_id in ar.queued]
+
+
+class RecordingService:
+    def __init__(self) -> None:
+        self.limits: list = []
+
+    async def create_threads_batch(self, assistant_id, params, concurrency, item_timeout):
+        self.limits.append((concurrency, item_timeout))
+        yield BatchResult(completed=0, failed=0, timed_out=0)
+
+
+def test_route_lowers_the_server_limits_and_rejects_bad_ones():
+    service = RecordingService()
+    injector = Injector()
+    injector.binder.bind(IAssistantService, to=InstanceProvider(service))
+    injector.binder.bind(BatchConfig, to=BatchConfig(concurrency=8, item_timeout=120))
+    app = FastAPI()
+    app.add_middleware(InjectorMiddleware, injector=injector)
+    app.include_router(assistant.router)
+    attach_injector(app, injector, options=RequestScopeOptions(enable_cleanup=True))
+
+    def post(**limits):
+        return TestClient(app).post(
+            "/assistants/asst_1/threads/batch", json={"messages": ["q"], **limits}
+        )
+
+    assert post().status_code == 200
+    assert post(concurrency=2, item_timeout=0.5).status_code == 200
+    assert post(concurrency=20, item_timeout=600).status_code == 200
+    assert service.limits == [(8, 120), (2, 0.5), (8, 120)]
+
+    assert post(concurrency=0).status_code == 422
+    assert post(concurrency=-1).status_code == 422
+    assert post(item_timeout=0).status_code == 422
+    assert len(service.limits) == 3
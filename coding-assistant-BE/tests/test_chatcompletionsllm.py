@@ -0,0 +1,169 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from coding_assistant.assistant.models import (
+    AssistantMessageItem,
+    AssistantMessageValue,
+    StreamEventType,
+    ThreadContext,
+)
+from coding_assistant.assistant.schemas import (
+    AssistantEntity,
+    AssistantMessageType,
+    LlmBackend,
+    Role,
+)
+from coding_assistant.llms import ChatCompletionsLLM
+from coding_assistant.llms.chatcompletionsllm import ChatCompletionsConfig
+from coding_assistant.llms.constants import FALLBACK_MESSAGE_PREFIX, SUMMARY_HEADER, WRAPPER_PROMPT
+
+ASSISTANT = AssistantEntity(
+    id="asst_local_1",
+    name="Test",
+    created_at=datetime.now(),
+    instructions="You answer coding questions.",
+    model="gpt-35-turbo",
+    backend=LlmBackend.Chat,
+)
+
+
+class FakeStream:
+    def __init__(self, chunks: list[str], finish_reason: str) -> None:
+        # the first chunk carries Azure's prompt filter results and no choices
+        self.chunks = [SimpleNamespace(choices=[])]
+        self.chunks += [
+            SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk), finish_reason=None)]
+            )
+            for chunk in chunks
+        ]
+        self.chunks.append(
+            SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        delta=SimpleNamespace(content=None), finish_reason=finish_reason
+                    )
+                ]
+            )
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class FakeCompletions:
+    def __init__(self, answer: str = "def reverse(): ...", finish_reason: str = "stop") -> None:
+        self.answer = answer
+        self.finish_reason = finish_reason
+        self.requests: list[dict] = []
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self.requests.append({"model": model, "messages": messages})
+        if stream:
+            return FakeStream([self.answer[:4], self.answer[4:]], self.finish_reason)
+        message = SimpleNamespace(content=self.answer)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message, finish_reason=self.finish_reason)]
+        )
+
+
+def make_llm(**kwargs) -> ChatCompletionsLLM:
+    completions = FakeCompletions(**kwargs)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return ChatCompletionsLLM(client=client, config=ChatCompletionsConfig())
+
+
+def text_message(id: str, role: Role, text: str, age: int) -> AssistantMessageItem:
+    return AssistantMessageItem(
+        id=id,
+        role=role,
+        created_at=datetime.now() - timedelta(seconds=age),
+        value=AssistantMessageValue(type=AssistantMessageType.Text, content={"message": text}),
+    )
+
+
+CONTEXT = ThreadContext(
+    history=[
+        text_message("msg_1", Role.User, "reverse a list", 30),
+        text_message("msg_2", Role.Assistant, "use reversed()", 29),
+    ],
+    summary="The user asked about sorting.",
+    truncated=True,
+)
+
+
+def test_turn_is_one_request_built_from_the_context():
+    llm = make_llm()
+
+    user_message, answer = asyncio.run(
+        llm.process_user_message(ASSISTANT, "thread_local_1", "in place?", context=CONTEXT)
+    )
+
+    [request] = llm.client.chat.completions.requests
+    assert request["model"] == "gpt-35-turbo"
+    # the wrapper prompt and summary are sent once, user messages as they were written
+    assert request["messages"] == [
+        {
+            "role": "system",
+            "content": f"You answer coding questions.\n\n{WRAPPER_PROMPT}\n\n"
+            f"{SUMMARY_HEADER}\nThe user asked about sorting.",
+        },
+        {"role": "user", "content": "reverse a list"},
+        {"role": "assistant", "content": "use reversed()"},
+        {"role": "user", "content": "in place?"},
+    ]
+    assert user_message.value.content == {"message": "in place?"}
+    assert answer.role == Role.Assistant
+    assert answer.value.content == {"message": "def reverse(): ..."}
+    assert answer.created_at > user_message.created_at
+
+
+def test_filtered_completion_gets_the_fallback_answer():
+    llm = make_llm(finish_reason="content_filter")
+
+    _, answer = asyncio.run(llm.process_user_message(ASSISTANT, "thread_local_1", "hello"))
+
+    assert answer.id.startswith(FALLBACK_MESSAGE_PREFIX)
+
+
+def test_stream_forwards_deltas_then_the_completed_messages():
+    llm = make_llm()
+
+    async def collect():
+        return [
+            event
+            async for event in llm.stream_user_message(ASSISTANT, "thread_local_1", "hello")
+        ]
+
+    *deltas, completed = asyncio.run(collect())
+
+    assert [event.delta.text for event in deltas] == ["def ", "reverse(): ..."]
+    assert completed.type == StreamEventType.Completed
+    user_message, answer = completed.messages
+    assert answer.value.content == {"message": "def reverse(): ..."}
+    assert {event.delta.id for event in deltas} == {answer.id}
+
+
+def test_threads_and_assistants_are_local():
+    llm = make_llm()
+
+    async def scenario():
+        assistant = await llm.create_assistant("Test", "", "gpt-35-turbo")
+        thread = await llm.create_thread(assistant.id, "New chat")
+        await llm.delete_thread(thread.id)
+        await llm.delete_assistant(assistant.id)
+        return assistant, thread
+
+    assistant, thread = asyncio.run(scenario())
+
+    assert assistant.id.startswith("asst_local_")
+    assert thread.id.startswith("thread_local_")
+    assert llm.client.chat.completions.requests == []
@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from coding_assistant.assistant.context import ContextConfig, ThreadContextBuilder
+from coding_assistant.assistant.models import AssistantMessageItem, AssistantMessageValue
+from coding_assistant.assistant.schemas import (
+    AssistantEntity,
+    AssistantMessageEntity,
+    AssistantMessageType,
+    Role,
+    ThreadSummaryEntity,
+)
+from coding_assistant.llms.constants import FALLBACK_MESSAGE_PREFIX
+from coding_assistant.llms.tokens import MESSAGE_OVERHEAD, TokenCounter
+from tests.fakes import FakeRepository
+
+START = datetime(2024, 1, 1)
+# every message is 100 tokens
+MESSAGE_TOKENS = 100
+
+
+def message(i: int, id: str | None = None) -> AssistantMessageEntity:
+    return AssistantMessageEntity(
+        id=id or f"msg_{i:03}",
+        assistant_id="asst_1",
+        thread_id="thread_1",
+        created_at=START + timedelta(seconds=i),
+        role=Role.User if i % 2 == 0 else Role.Assistant,
+        type=AssistantMessageType.Text,
+        content={"message": f"message {i}"},
+        token_count=MESSAGE_TOKENS,
+    )
+
+
+def make_builder(**config) -> ThreadContextBuilder:
+    builder = ThreadContextBuilder(
+        config=ContextConfig(**config),
+        tokens=TokenCounter(encoding=None),
+        sessionmaker=None,
+        llms={},
+    )
+    builder.scheduled = []
+
+    async def summarize(assistant, thread_id, until):
+        builder.scheduled.append(until)
+
+    builder._summarize = summarize
+    return builder
+
+
+def assistant(context_max_tokens: int, context_summarize: bool = True) -> AssistantEntity:
+    return AssistantEntity(
+        id="asst_1",
+        name="A",
+        created_at=START,
+        instructions="",
+        model="m",
+        context_max_tokens=context_max_tokens,
+        context_summarize=context_summarize,
+    )
+
+
+def build(builder, repository, assistant):
+    async def scenario():
+        context = await builder.build(repository, assistant, "thread_1")
+        # let a scheduled summary start
+        await asyncio.sleep(0)
+        return context
+
+    return asyncio.run(scenario())
+
+
+def test_history_keeps_the_latest_messages_within_the_budget():
+    builder = make_builder(summarize_after_tokens=10_000)
+    repository = FakeRepository(messages=[message(i) for i in range(10)])
+
+    context = build(builder, repository, assistant(context_max_tokens=350))
+
+    assert [item.id for item in context.history] == ["msg_007", "msg_008", "msg_009"]
+    assert context.truncated
+    assert context.summary is None
+
+
+def test_whole_thread_is_sent_when_it_fits():
+    builder = make_builder()
+    messages = [message(i) for i in range(4)] + [message(4, id=f"{FALLBACK_MESSAGE_PREFIX}1")]
+
+    context = build(builder, FakeRepository(messages=messages), assistant(context_max_tokens=0))
+
+    assert [item.id for item in context.history] == ["msg_000", "msg_001", "msg_002", "msg_003"]
+    assert not context.truncated
+    assert builder.scheduled == []
+
+
+def test_summary_stands_for_the_left_out_messages_and_uses_the_budget():
+    summary = ThreadSummaryEntity(
+        thread_id="thread_1",
+        summary="earlier turns",
+        token_count=150,
+        until_created_at=message(5).created_at,
+        until_id="msg_005",
+    )
+    builder = make_builder(summarize_after_tokens=10_000)
+    repository = FakeRepository(messages=[message(i) for i in range(10)], summary=summary)
+
+    context = build(builder, repository, assistant(context_max_tokens=350))
+
+    assert [item.id for item in context.history] == ["msg_008", "msg_009"]
+    assert context.summary == "earlier turns"
+
+
+def test_left_out_messages_past_the_summary_are_summarised_in_the_background():
+    summary = ThreadSummaryEntity(
+        thread_id="thread_1",
+        summary="earlier turns",
+        token_count=0,
+        until_created_at=message(2).created_at,
+        until_id="msg_002",
+    )
+    builder = make_builder(summarize_after_tokens=300)
+    repository = FakeRepository(messages=[message(i) for i in range(10)], summary=summary)
+
+    build(builder, repository, assistant(context_max_tokens=400))
+    # msg_003..msg_005 are left out and not summarised: 300 tokens
+    assert builder.scheduled == [(message(5).created_at, "msg_005")]
+
+    builder.scheduled.clear()
+    build(builder, repository, assistant(context_max_tokens=500))
+    # only msg_003 and msg_004 are behind the summary: below the threshold
+    assert builder.scheduled == []
+
+    build(builder, repository, assistant(context_max_tokens=400, context_summarize=False))
+    assert builder.scheduled == []
+
+
+def test_tokens_are_counted_before_messages_are_saved():
+    builder = make_builder()
+    counter = TokenCounter(encoding=None)
+    items = [
+        AssistantMessageItem(
+            id="msg_1",
+            role=Role.User,
+            created_at=START,
+            value=AssistantMessageValue(
+                type=AssistantMessageType.Text, content={"message": "x" * 40}
+            ),
+        )
+    ]
+    builder.count(items)
+
+    assert items[0].token_count == counter.count("x" * 40) + MESSAGE_OVERHEAD
@@ -0,0 +1,63 @@
+import asyncio
+
+from coding_assistant.assistant.deletion import DeletionConfig, DeletionQueue, _Deletion
+from coding_assistant.assistant.schemas import LlmBackend
+
+
+class FakeLLM:
+    def __init__(self) -> None:
+        self.deleted: list[tuple[str, str]] = []
+
+    async def delete_assistant(self, assistant_id):
+        self.deleted.append(("assistant", assistant_id))
+
+    async def delete_thread(self, thread_id):
+        if thread_id == "thread_down":
+            raise RuntimeError("service unavailable")
+        self.deleted.append(("thread", thread_id))
+
+
+class QueueWithoutDb(DeletionQueue):
+    def __init__(self, deletions, **config) -> None:
+        llm = FakeLLM()
+        super().__init__(
+            DeletionConfig(**config), engine=None, llms={LlmBackend.Assistants: llm}
+        )
+        self.llm = llm
+        self.deletions = deletions
+        self.finished = None
+
+    async def _claim(self):
+        deletions, self.deletions = self.deletions, []
+        return deletions
+
+    async def _finish(self, done, failed):
+        self.finished = (done, failed)
+
+
+def deletion(id: int, kind: str, remote_id: str, attempts: int = 1) -> _Deletion:
+    return _Deletion(id=id, backend="assistants", kind=kind, remote_id=remote_id, attempts=attempts)
+
+
+def test_claimed_rows_are_deleted_on_the_llm_side_by_kind():
+    queue = QueueWithoutDb(
+        [
+            deletion(1, "thread", "thread_1"),
+            deletion(2, "assistant", "asst_1"),
+            deletion(3, "thread", "thread_down"),
+        ]
+    )
+
+    assert asyncio.run(queue.work_once()) == 3
+
+    assert sorted(queue.llm.deleted) == [("assistant", "asst_1"), ("thread", "thread_1")]
+    done, failed = queue.finished
+    assert sorted(d.id for d in done) == [1, 2]
+    assert [(d.id, type(e)) for d, e in failed] == [(3, RuntimeError)]
+
+
+def test_an_empty_queue_claims_nothing():
+    queue = QueueWithoutDb([])
+
+    assert asyncio.run(queue.work_once()) == 0
+    assert queue.finished is None
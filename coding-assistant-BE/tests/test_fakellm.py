@@ -0,0 +1,90 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+from openai import RateLimitError
+
+from coding_assistant.assistant.models import StreamEventType
+from coding_assistant.assistant.schemas import AssistantEntity, Role
+from coding_assistant.llms import FakeLLM
+from coding_assistant.llms.constants import FALLBACK_MESSAGE_PREFIX
+from coding_assistant.llms.fakellm import CANNED_RESPONSE, FakeLlmConfig
+
+LATENCY = 0.1
+
+ASSISTANT = AssistantEntity(
+    id="asst_fake", name="A", created_at=datetime.now(), instructions="", model="m"
+)
+
+
+def make_llm(**kwargs) -> FakeLLM:
+    return FakeLLM(config=FakeLlmConfig(latency_median=LATENCY, latency_sigma=0, seed=1, **kwargs))
+
+
+def test_run_goes_through_queued_and_in_progress_to_completed():
+    llm = make_llm(queued_fraction=0.5)
+    seen = []
+
+    async def scenario():
+        thread = await llm.create_thread(ASSISTANT.id, "New chat")
+        task = asyncio.create_task(llm.process_user_message(ASSISTANT, thread.id, "hi"))
+        # sample the middle of the queued and in_progress halves, then after the run
+        await asyncio.sleep(LATENCY / 4)
+        for _ in range(3):
+            seen.append((await llm.run_states.get(thread.id)).status)
+            await asyncio.sleep(LATENCY / 2)
+        return await task, (await llm.run_states.get(thread.id)).status
+
+    messages, status = asyncio.run(scenario())
+
+    assert seen == ["queued", "in_progress", "completed"]
+    assert status == "completed"
+    assert [m.role for m in messages] == [Role.User, Role.Assistant]
+    assert messages[1].value.content["message"] == "You asked: hi"
+
+
+def test_failed_run_returns_the_fallback_response():
+    llm = make_llm(failure_rate=1.0, response="canned")
+
+    async def scenario():
+        return await llm.process_user_message(ASSISTANT, "thread_1", "hi")
+
+    messages = asyncio.run(scenario())
+
+    assert messages[1].id.startswith(FALLBACK_MESSAGE_PREFIX)
+
+
+def test_rate_limited_run_raises_like_the_openai_client():
+    llm = make_llm(rate_limit_rate=1.0)
+
+    with pytest.raises(RateLimitError) as e:
+        asyncio.run(llm.process_user_message(ASSISTANT, "thread_1", "hi"))
+    assert e.value.status_code == 429
+
+
+def test_runs_beyond_the_concurrency_limit_wait_queued():
+    llm = make_llm(max_concurrent_runs=2)
+
+    async def scenario():
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(llm.process_user_message(ASSISTANT, f"thread_{i}", "hi") for i in range(4))
+        )
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) >= 2 * LATENCY
+
+
+def test_stream_deltas_add_up_to_the_completed_answer():
+    llm = make_llm(response="canned", stream_chunk_size=10)
+
+    async def scenario():
+        return [event async for event in llm.stream_user_message(ASSISTANT, "thread_1", "hi")]
+
+    events = asyncio.run(scenario())
+
+    deltas = [e.delta.text for e in events if e.type == StreamEventType.Delta]
+    assert len(deltas) > 1
+    assert "".join(deltas) == CANNED_RESPONSE
+    assert events[-1].messages[1].value.content["message"] == CANNED_RESPONSE
@@ -0,0 +1,198 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_injector import InjectorMiddleware, RequestScopeOptions, attach_injector
+from injector import Injector, InstanceProvider
+
+from coding_assistant.assistant.jobs import (
+    SHUTDOWN_ERROR,
+    InMemoryJobStore,
+    JobConfig,
+    JobManager,
+    JobQueueFull,
+)
+from coding_assistant.assistant.models import (
+    CreateThreadResult,
+    JobStatus,
+    SendMessageResult,
+)
+from coding_assistant.assistant.schemas import AssistantThreadEntity
+from coding_assistant.assistant.service import IAssistantService
+from coding_assistant.routes import assistant
+
+
+class FakeFactory:
+    def __init__(self, service="service") -> None:
+        self.service = service
+
+    @asynccontextmanager
+    async def create(self):
+        yield self.service
+
+
+class FakeChannel:
+    """PgChannel delivering each notification to every subscriber, as to every worker."""
+
+    def __init__(self) -> None:
+        self.subscribers = []
+
+    def subscribe(self, topic, callback):
+        self.subscribers.append((topic, callback))
+
+    async def notify(self, topic, key):
+        for subscribed, callback in self.subscribers:
+            if subscribed == topic:
+                callback(key)
+
+
+def make_jobs(service="service", store=None, channel=None, **config) -> JobManager:
+    return JobManager(
+        factory=FakeFactory(service),
+        config=JobConfig(**config),
+        store=store or InMemoryJobStore(),
+        channel=channel,
+    )
+
+
+async def answer(service):
+    await asyncio.sleep(0.05)
+    return SendMessageResult(thread_id="thread_1", messages=[])
+
+
+async def fail(service):
+    raise RuntimeError("run failed")
+
+
+def test_job_completes_and_long_poll_returns_result():
+    async def scenario():
+        jobs = make_jobs(workers=2)
+        job = await jobs.submit(answer, "asst_1")
+        assert job.status == JobStatus.Pending
+
+        result = await jobs.get(job.id, "asst_1", wait=1)
+        await jobs.close()
+        return result
+
+    result = asyncio.run(scenario())
+
+    assert result.status == JobStatus.Completed
+    assert result.result.thread_id == "thread_1"
+    assert result.finished_at is not None
+
+
+def test_failed_job_reports_error():
+    async def scenario():
+        jobs = make_jobs(workers=1)
+        job = await jobs.submit(fail, "asst_1")
+        result = await jobs.get(job.id, "asst_1", wait=1)
+        await jobs.close()
+        return result
+
+    result = asyncio.run(scenario())
+
+    assert result.status == JobStatus.Failed
+    assert result.error == "run failed"
+
+
+def test_submit_rejects_when_queue_is_full():
+    async def scenario():
+        jobs = make_jobs(workers=1, queue_size=1)
+        await jobs.submit(answer, "asst_1")
+        try:
+            with pytest.raises(JobQueueFull):
+                await jobs.submit(answer, "asst_1")
+        finally:
+            await jobs.close()
+
+    asyncio.run(scenario())
+
+
+def test_a_job_is_only_found_under_its_assistant():
+    async def scenario():
+        jobs = make_jobs(workers=1)
+        job = await jobs.submit(answer, "asst_1")
+        other = await jobs.get(job.id, "asst_2")
+        own = await jobs.get(job.id, "asst_1", wait=1)
+        await jobs.close()
+        return other, own
+
+    other, own = asyncio.run(scenario())
+
+    assert other is None
+    assert own.status == JobStatus.Completed
+
+
+def test_another_worker_reads_the_job_and_is_woken_when_it_finishes():
+    async def scenario():
+        store, channel = InMemoryJobStore(), FakeChannel()
+        accepting = make_jobs(store=store, channel=channel, workers=1)
+        # polling alone would only see the job finish after 10 seconds
+        other = make_jobs(store=store, channel=channel, poll_interval=10)
+        job = await accepting.submit(answer, "asst_1")
+        result = await asyncio.wait_for(other.get(job.id, "asst_1", wait=5), timeout=1)
+        await accepting.close()
+        return result
+
+    result = asyncio.run(scenario())
+
+    assert result.status == JobStatus.Completed
+    assert result.result.thread_id == "thread_1"
+
+
+def test_close_fails_the_jobs_left_unfinished():
+    async def slow(service):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        store = InMemoryJobStore()
+        jobs = make_jobs(store=store, workers=1)
+        running = await jobs.submit(slow, "asst_1")
+        queued = await jobs.submit(slow, "asst_1")
+        await asyncio.sleep(0.01)
+        await jobs.close()
+        return [await store.get(job.id, "asst_1") for job in (running, queued)]
+
+    results = asyncio.run(scenario())
+
+    assert [result.status for result in results] == [JobStatus.Failed, JobStatus.Failed]
+    assert all(result.error == SHUTDOWN_ERROR for result in results)
+    assert all(result.finished_at is not None for result in results)
+
+
+class NamelessThreadService:
+    async def create_thread(self, assistant_id, params) -> CreateThreadResult:
+        thread = AssistantThreadEntity(
+            id="thread_1", name="New chat", assistant_id=assistant_id, created_at=datetime.now()
+        )
+        # what the service returns when the thread was not created
+        thread.id = None
+        return CreateThreadResult(thread=thread, messages=[])
+
+
+def test_a_thread_created_by_a_job_is_checked_like_one_created_in_the_request():
+    service = NamelessThreadService()
+    injector = Injector()
+    injector.binder.bind(IAssistantService, to=InstanceProvider(service))
+    injector.binder.bind(
+        JobManager, to=make_jobs(service, workers=1)
+    )
+    app = FastAPI()
+    app.add_middleware(InjectorMiddleware, injector=injector)
+    app.include_router(assistant.router)
+    attach_injector(app, injector, options=RequestScopeOptions(enable_cleanup=True))
+
+    with TestClient(app) as client:
+        assert client.post("/assistants/asst_1/threads", json={"message": "hi"}).status_code == 500
+
+        response = client.post("/assistants/asst_1/threads?job=true", json={"message": "hi"})
+        assert response.status_code == 202
+        job = client.get(f"{response.headers['Location']}?wait=5").json()
+        assert job["status"] == JobStatus.Failed.value
+        assert job["error"] == "Thread creation failed"
+
+        other = client.get(f"/assistants/asst_2/jobs/{job['id']}")
+        assert other.status_code == 404
@@ -0,0 +1,217 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from environs import Env
+from injector import Injector
+from openai import AsyncAzureOpenAI
+
+from coding_assistant.connections import AzureOpenAiModule, ConfigModule
+from coding_assistant.lifecycle import AppLifecycle, StartupConfig
+from coding_assistant.llms.polling import PollingConfig, RunPoller
+
+
+def test_env_and_client_are_built_once_per_process(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "key")
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_VERSION", "2024-05-01-preview")
+    injector = Injector([ConfigModule(), AzureOpenAiModule()])
+
+    assert injector.get(Env) is injector.get(Env)
+    assert injector.get(AsyncAzureOpenAI) is injector.get(AsyncAzureOpenAI)
+
+
+def test_stop_closes_in_reverse_order_past_failures():
+    closed = []
+
+    def closer(name: str, fail: bool = False):
+        async def close() -> None:
+            closed.append(name)
+            if fail:
+                raise RuntimeError(f"{name} failed")
+
+        return close
+
+    lifecycle = AppLifecycle(Injector())
+    lifecycle._closers = [closer("engine"), closer("client", fail=True), closer("jobs")]
+    asyncio.run(lifecycle.stop())
+
+    assert closed == ["jobs", "client", "engine"]
+    assert lifecycle._closers == []
+
+
+def test_a_failing_or_slow_step_is_recorded_and_startup_goes_on():
+    async def fail() -> None:
+        raise ConnectionError("refused")
+
+    async def steps() -> None:
+        config = StartupConfig(step_timeout=0.05)
+        await lifecycle._step("db_pool", fail(), config)
+        await lifecycle._step("http_pool", asyncio.sleep(1), config)
+        await lifecycle._step("default_assistant", asyncio.sleep(0), config)
+
+    lifecycle = AppLifecycle(Injector())
+    asyncio.run(steps())
+
+    assert lifecycle.steps["db_pool"] is None
+    assert lifecycle.steps["http_pool"] is None
+    assert lifecycle.steps["default_assistant"] is not None
+
+
+def test_closing_the_poller_hands_back_the_runs_waited_on():
+    class Runs:
+        async def retrieve(self, thread_id: str, run_id: str, **kwargs) -> SimpleNamespace:
+            return SimpleNamespace(id=run_id, status="in_progress", last_error=None)
+
+    async def wait_then_close() -> SimpleNamespace:
+        client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=Runs())))
+        poller = RunPoller(client=client, config=PollingConfig(initial_interval=0.01))
+        waiting = asyncio.create_task(
+            poller.wait("thread", SimpleNamespace(id="run_1", status="queued", last_error=None))
+        )
+        await asyncio.sleep(0.05)
+        await poller.close()
+        return await waiting
+
+    run = asyncio.run(wait_then_close())
+
+    assert run.id == "run_1"
+    assert run.status == "in_progress"
+
+
+class FailingEngine:
+    def connect(self):
+        raise ConnectionRefusedError("db down")
+
+
+class Models:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def list(self, **kwargs) -> list:
+        self.calls += 1
+        return []
+
+
+def test_not_ready_before_startup_or_without_the_db():
+    lifecycle = AppLifecycle(Injector())
+    assert asyncio.run(lifecycle.readiness()).ready is False
+
+    lifecycle.started = True
+    lifecycle._engine = FailingEngine()
+    result = asyncio.run(lifecycle.readiness())
+
+    assert result.ready is False
+    assert result.db == "failed"
+    assert result.llm == "skipped"
+
+
+def test_a_successful_llm_check_is_reused_within_the_interval():
+    models = Models()
+    lifecycle = AppLifecycle(Injector())
+    lifecycle.config = StartupConfig(llm_probe_interval=60)
+    lifecycle._client = SimpleNamespace(models=models)
+
+    assert asyncio.run(lifecycle._check_llm()) == "ok"
+    assert asyncio.run(lifecycle._check_llm()) == "ok"
+    assert models.calls == 1
+
+
+def test_not_ready_while_migrations_are_pending(monkeypatch):
+    pending = ["0007_llm_deletion_queue"]
+
+    async def pending_migrations(engine) -> list:
+        return list(pending)
+
+    async def check_db() -> str:
+        return "ok"
+
+    monkeypatch.setattr("coding_assistant.lifecycle.pending_migrations", pending_migrations)
+    lifecycle = AppLifecycle(Injector())
+    lifecycle.started = True
+    lifecycle._check_db = check_db
+
+    result = asyncio.run(lifecycle.readiness())
+    assert result.ready is False
+    assert result.schema == "behind"
+
+    pending.clear()
+    assert asyncio.run(lifecycle.readiness()).ready is True
+    # current from then on, without querying again
+    pending.append("0008_next")
+    assert asyncio.run(lifecycle.readiness()).schema == "ok"
+
+
+class AdvisoryLocks:
+    """Engine whose connections take one shared lock for pg_advisory_lock."""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def connect(self):
+        locks = self.lock
+
+        class Connection:
+            async def execute(self, statement, parameters=None):
+                if "pg_advisory_lock" in str(statement):
+                    await locks.acquire()
+                elif "pg_advisory_unlock" in str(statement):
+                    locks.release()
+
+        yield Connection()
+
+
+class DefaultAssistantFactory:
+    def __init__(self, assistants: list, create_time: float) -> None:
+        self.assistants = assistants
+        self.create_time = create_time
+
+    @asynccontextmanager
+    async def create(self):
+        factory = self
+
+        class Service:
+            async def init_assistant(self) -> None:
+                if not factory.assistants:
+                    await asyncio.sleep(factory.create_time)
+                    factory.assistants.append("asst_default")
+
+        yield Service()
+
+
+def test_workers_starting_together_create_one_default_assistant():
+    assistants = []
+    engine = AdvisoryLocks()
+
+    async def start_workers() -> None:
+        workers = [AppLifecycle(Injector()) for _ in range(3)]
+        for worker in workers:
+            worker._engine = engine
+        factory = DefaultAssistantFactory(assistants, create_time=0.01)
+        await asyncio.gather(*(worker._ensure_default_assistant(factory) for worker in workers))
+
+    asyncio.run(start_workers())
+
+    assert assistants == ["asst_default"]
+
+
+def test_a_default_assistant_still_being_created_at_the_step_timeout_is_kept():
+    assistants = []
+
+    async def start() -> AppLifecycle:
+        lifecycle = AppLifecycle(Injector())
+        lifecycle._engine = AdvisoryLocks()
+        factory = DefaultAssistantFactory(assistants, create_time=0.1)
+        await lifecycle._step(
+            "default_assistant",
+            lifecycle._ensure_default_assistant(factory),
+            StartupConfig(step_timeout=0.02),
+        )
+        await asyncio.sleep(0.15)
+        return lifecycle
+
+    lifecycle = asyncio.run(start())
+
+    assert lifecycle.steps["default_assistant"] is None
+    assert assistants == ["asst_default"]
@@ -0,0 +1,68 @@
+import json
+import logging
+
+from coding_assistant.telemetry import LogConfig, log_context, setup_logging
+from coding_assistant.telemetry.logs import (
+    ContextFilter,
+    JsonFormatter,
+    SamplingFilter,
+)
+
+
+def make_record(level: int = logging.INFO, **extra) -> logging.LogRecord:
+    record = logging.makeLogRecord(
+        {
+            "name": "coding_assistant.test",
+            "levelno": level,
+            "levelname": logging.getLevelName(level),
+            "msg": "run %s",
+            "args": ("done",),
+        }
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+def test_context_ids_are_attached_and_explicit_ids_win():
+    context = ContextFilter()
+
+    with log_context(request_id="req_1", thread_id="thread_1"):
+        record = make_record(thread_id="thread_2", run_id="run_1")
+        context.filter(record)
+    outside = make_record()
+    context.filter(outside)
+
+    assert (record.request_id, record.thread_id, record.run_id) == ("req_1", "thread_2", "run_1")
+    assert outside.request_id is None
+
+
+def test_sampling_drops_by_level_but_keeps_warnings():
+    sampling = SamplingFilter({logging.DEBUG: 0.0})
+
+    assert not sampling.filter(make_record(logging.DEBUG))
+    assert sampling.filter(make_record(logging.INFO))
+    assert sampling.filter(make_record(logging.WARNING))
+
+
+def test_json_records_carry_the_extra_fields():
+    entry = json.loads(JsonFormatter().format(make_record(run_id="run_1", status="completed")))
+
+    assert entry["message"] == "run done"
+    assert entry["level"] == "INFO"
+    assert (entry["run_id"], entry["status"]) == ("run_1", "completed")
+
+
+def test_records_are_written_by_the_background_listener(capsys):
+    logger = logging.getLogger("coding_assistant")
+    handlers, level, propagate = logger.handlers, logger.level, logger.propagate
+    listener = setup_logging(LogConfig(level="DEBUG", sample_debug=0.0))
+    try:
+        with log_context(request_id="req_1"):
+            logging.getLogger("coding_assistant.llms.polling").debug("polled")
+            logging.getLogger("coding_assistant.llms.polling").info("run %s", "finished")
+    finally:
+        listener.stop()
+        logger.handlers, logger.level, logger.propagate = handlers, level, propagate
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(line["message"], line["request_id"]) for line in lines] == [("run finished", "req_1")]
@@ -0,0 +1,50 @@
+import asyncio
+
+from prometheus_client import REGISTRY
+
+from coding_assistant.llms.fakellm import FakeLlmConfig
+from coding_assistant.llms import FakeLLM
+from coding_assistant.telemetry import add_observer, remove_observer
+from coding_assistant.telemetry.metrics import observe_stage, render
+from tests.fakes import make_assistant, make_azure_llm, send_messages
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_turn_stages_and_run_outcomes_are_exported():
+    stages = [
+        "openai.runs.list",
+        "openai.messages.create",
+        "openai.runs.create",
+        "run.wait",
+        "openai.messages.list",
+    ]
+    before = {name: sample("coding_assistant_stage_seconds_count", stage=name) for name in stages}
+    completed = sample("coding_assistant_runs_total", status="completed")
+    polled_runs = sample("coding_assistant_run_polls_count")
+
+    add_observer(observe_stage)
+    try:
+        asyncio.run(send_messages(make_azure_llm(), 2))
+    finally:
+        remove_observer(observe_stage)
+
+    for name in stages:
+        assert sample("coding_assistant_stage_seconds_count", stage=name) == before[name] + 2
+    assert sample("coding_assistant_runs_total", status="completed") == completed + 2
+    assert sample("coding_assistant_run_polls_count") == polled_runs + 2
+    assert sample("coding_assistant_run_polls_sum") > 0
+
+
+def test_fallback_responses_are_counted():
+    fallbacks = sample("coding_assistant_fallback_responses_total")
+    llm = FakeLLM(config=FakeLlmConfig(latency_median=0.01, latency_sigma=0, failure_rate=1.0))
+
+    asyncio.run(llm.process_user_message(make_assistant(), "thread_1", "hi"))
+
+    assert sample("coding_assistant_fallback_responses_total") == fallbacks + 1
+    content, content_type = render()
+    assert content_type.startswith("text/plain")
+    assert b"coding_assistant_fallback_responses_total" in content
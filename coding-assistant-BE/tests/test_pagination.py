@@ -0,0 +1,166 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_injector import InjectorMiddleware, RequestScopeOptions, attach_injector
+from injector import Injector, InstanceProvider
+
+from coding_assistant.assistant.models import ListThreadsResult
+from coding_assistant.assistant.pagination import (
+    PageCursor,
+    PageOrder,
+    keyset_clause,
+    order_clause,
+)
+from coding_assistant.assistant.repository import AssistantRepository
+from coding_assistant.assistant.schemas import AssistantThreadEntity
+from coding_assistant.assistant.service import AssistantService, IAssistantService
+from coding_assistant.routes import assistant
+from tests.fakes import FakeRepository
+
+START = datetime(2024, 4, 1, 12, 0, 0)
+
+
+def make_threads(count: int) -> list:
+    return [
+        AssistantThreadEntity(
+            id=f"thread_{i}",
+            name="New chat",
+            assistant_id="asst_1",
+            created_at=START + timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def test_cursor_round_trip():
+    cursor = PageCursor(created_at=datetime(2024, 4, 1, 12, 30, 15, 123456), id="msg_abc")
+
+    assert PageCursor.decode(cursor.encode()) == cursor
+
+
+def test_invalid_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        PageCursor.decode("not-a-cursor")
+
+
+def test_keyset_clause_selects_the_rows_after_the_cursor_in_either_order():
+    cursor = PageCursor(created_at=START, id="thread_3")
+
+    assert keyset_clause(None, PageOrder.Asc) == ("TRUE", {})
+    asc, parameters = keyset_clause(cursor, PageOrder.Asc)
+    desc, _ = keyset_clause(cursor, PageOrder.Desc)
+
+    assert asc == "(created_at, id) > (:cursor_created_at, :cursor_id)"
+    assert desc == "(created_at, id) < (:cursor_created_at, :cursor_id)"
+    assert parameters == {"cursor_created_at": START, "cursor_id": "thread_3"}
+    assert order_clause(PageOrder.Asc) == "ORDER BY created_at ASC, id ASC"
+    assert order_clause(PageOrder.Desc) == "ORDER BY created_at DESC, id DESC"
+
+
+def test_pages_follow_the_cursor_until_the_last_one():
+    ar = FakeRepository(threads=make_threads(5))
+    service = AssistantService(ar=ar, llm=None)
+
+    async def pages() -> list:
+        results, cursor = [], None
+        while True:
+            page = await service.list_threads(
+                "asst_1", limit=2, cursor=PageCursor.decode(cursor) if cursor else None
+            )
+            results.append(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                return results
+
+    results = asyncio.run(pages())
+
+    # one row more than the page is fetched, to know whether there is a next one
+    assert ar.limits == [3, 3, 3]
+    assert [[thread.id for thread in page.threads] for page in results] == [
+        ["thread_0", "thread_1"],
+        ["thread_2", "thread_3"],
+        ["thread_4"],
+    ]
+    assert PageCursor.decode(results[0].next_cursor) == PageCursor(
+        created_at=START + timedelta(seconds=1), id="thread_1"
+    )
+    # without a limit everything comes back on one page
+    everything = asyncio.run(service.list_threads("asst_1"))
+    assert len(everything.threads) == 5
+    assert everything.next_cursor is None
+    assert ar.limits[-1] is None
+
+
+def test_repository_sends_the_keyset_order_and_limit():
+    sent = []
+
+    class Rows:
+        def fetchall(self):
+            return []
+
+    async def execute(query, parameters=None):
+        sent.append((" ".join(query.split()), parameters))
+        return Rows()
+
+    repository = AssistantRepository(session=None)
+    repository._execute = execute
+    cursor = PageCursor(created_at=START, id="thread_1")
+    asyncio.run(repository.list_threads("asst_1", limit=3, cursor=cursor, order=PageOrder.Desc))
+
+    query, parameters = sent[0]
+    assert (
+        "WHERE assistant_id = :assistant_id"
+        " AND (created_at, id) < (:cursor_created_at, :cursor_id)"
+    ) in query
+    assert query.endswith("ORDER BY created_at DESC, id DESC LIMIT :limit")
+    assert parameters == {
+        "assistant_id": "asst_1",
+        "cursor_created_at": START,
+        "cursor_id": "thread_1",
+        "limit": 3,
+    }
+
+
+class RecordingService:
+    def __init__(self) -> None:
+        self.calls: list = []
+
+    async def list_threads(self, assistant_id, limit=None, cursor=None, order=PageOrder.Asc):
+        self.calls.append((assistant_id, limit, cursor, order))
+        return ListThreadsResult(threads=[], next_cursor=None)
+
+
+def make_client(service: RecordingService) -> TestClient:
+    injector = Injector()
+    injector.binder.bind(IAssistantService, to=InstanceProvider(service))
+    app = FastAPI()
+    app.add_middleware(InjectorMiddleware, injector=injector)
+    app.include_router(assistant.router)
+    attach_injector(app, injector, options=RequestScopeOptions(enable_cleanup=True))
+    return TestClient(app)
+
+
+def test_route_passes_the_page_parameters_and_rejects_bad_ones():
+    service = RecordingService()
+    client = make_client(service)
+    cursor = PageCursor(created_at=START, id="thread_1")
+
+    response = client.get(
+        "/assistants/asst_1/threads",
+        params={"limit": 10, "cursor": cursor.encode(), "order": "desc"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"threads": [], "next_cursor": None}
+    assert service.calls[-1] == ("asst_1", 10, cursor, PageOrder.Desc)
+
+    client.get("/assistants/asst_1/threads")
+    assert service.calls[-1] == ("asst_1", None, None, PageOrder.Asc)
+
+    assert client.get("/assistants/asst_1/threads", params={"cursor": "nope"}).status_code == 400
+    assert client.get("/assistants/asst_1/threads", params={"limit": 0}).status_code == 422
+    assert client.get("/assistants/asst_1/threads", params={"limit": 501}).status_code == 422
+    assert client.get("/assistants/asst_1/threads", params={"order": "up"}).status_code == 422
+    assert len(service.calls) == 2
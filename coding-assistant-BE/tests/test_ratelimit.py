@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from coding_assistant.llms.ratelimit import Priority, RateLimitConfig, RateLimiter, retry_after
+
+
+def rate_limit_error(headers: dict) -> RateLimitError:
+    request = httpx.Request("POST", "https://example.openai.azure.com/threads/runs")
+    response = httpx.Response(429, request=request, headers=headers)
+    return RateLimitError("Rate limit is exceeded", response=response, body=None)
+
+
+def test_retry_after_reads_seconds_and_milliseconds():
+    assert retry_after(rate_limit_error({"retry-after": "2"})) == 2.0
+    assert retry_after(rate_limit_error({"retry-after-ms": "250", "retry-after": "1"})) == 0.25
+    assert retry_after(rate_limit_error({})) is None
+    assert retry_after(ValueError("not an api error")) is None
+
+
+def test_queued_calls_are_served_turns_first():
+    # a burst of one call, then one every 0.1s: the first goes straight out
+    limiter = RateLimiter(RateLimitConfig(requests_per_minute=600, burst_seconds=0.1))
+    served = []
+
+    async def call(name: str, priority: Priority) -> None:
+        await limiter.acquire(priority)
+        served.append(name)
+
+    async def scenario() -> None:
+        await call("first", Priority.Turn)
+        await asyncio.gather(
+            call("poll", Priority.Poll),
+            call("summary", Priority.Background),
+            call("turn", Priority.Turn),
+        )
+
+    asyncio.run(scenario())
+
+    assert served == ["first", "turn", "poll", "summary"]
+    assert limiter.stats().throttled_calls == 3
+
+
+def test_a_call_that_waited_too_long_goes_before_newer_turns():
+    limiter = RateLimiter(
+        RateLimitConfig(requests_per_minute=600, burst_seconds=0.1, max_priority_wait=0.05)
+    )
+    served = []
+
+    async def call(name: str, priority: Priority) -> None:
+        await limiter.acquire(priority)
+        served.append(name)
+
+    async def scenario() -> None:
+        await call("first", Priority.Turn)
+        poll = asyncio.create_task(call("poll", Priority.Poll))
+        await asyncio.sleep(0.06)
+        await asyncio.gather(poll, call("turn", Priority.Turn))
+
+    asyncio.run(scenario())
+
+    assert served == ["first", "poll", "turn"]
+
+
+def test_a_429_pauses_every_call_for_its_retry_after_then_is_retried():
+    limiter = RateLimiter(RateLimitConfig(max_retries=2, backoff_initial=0.01))
+    attempts = []
+
+    async def work() -> str:
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise rate_limit_error({"retry-after-ms": "200"})
+        return "ok"
+
+    async def scenario() -> tuple:
+        result = asyncio.create_task(limiter.call(Priority.Turn, work))
+        await asyncio.sleep(0.05)
+        # another call arriving during the pause waits for it too
+        start = time.monotonic()
+        await limiter.acquire(Priority.Turn)
+        return await result, time.monotonic() - start
+
+    result, waited = asyncio.run(scenario())
+
+    assert result == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert waited >= 0.1
+    stats = limiter.stats()
+    assert stats.rate_limited == 1
+    assert stats.retries == 1
+
+
+def test_the_error_is_raised_once_the_retries_are_used_up():
+    limiter = RateLimiter(RateLimitConfig(max_retries=2, backoff_initial=0.001))
+    attempts = []
+
+    async def work() -> None:
+        attempts.append(1)
+        raise rate_limit_error({})
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(limiter.call(Priority.Background, work))
+
+    assert len(attempts) == 3
+
+
+def test_token_quota_throttles_large_calls():
+    # 6000 tokens per minute is 100 per second, the burst holds 100
+    limiter = RateLimiter(RateLimitConfig(tokens_per_minute=6000, burst_seconds=1))
+
+    async def scenario() -> float:
+        start = time.monotonic()
+        await limiter.acquire(Priority.Turn, tokens=100)
+        await limiter.acquire(Priority.Turn, tokens=20)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.15
+
+
+def test_a_cancelled_call_leaves_the_queue():
+    limiter = RateLimiter(RateLimitConfig(requests_per_minute=60, burst_seconds=1))
+
+    async def scenario() -> int:
+        await limiter.acquire(Priority.Turn)
+        waiting = asyncio.create_task(limiter.acquire(Priority.Poll))
+        await asyncio.sleep(0.01)
+        assert limiter.stats().queued["Poll"] == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await limiter.close()
+        return sum(limiter.stats().queued.values())
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,195 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from coding_assistant.assistant.models import AssistantMessageItem, AssistantMessageValue
+from coding_assistant.assistant.repository import (
+    MESSAGE_COLUMNS,
+    AssistantRepository,
+    _message_row,
+    _messages_values,
+)
+from coding_assistant.assistant.schemas import AssistantMessageType, AssistantThreadEntity, Role
+
+
+def test_messages_are_inserted_as_one_multi_row_values_list():
+    messages = [
+        AssistantMessageItem(
+            id=f"msg_{i}",
+            role=Role.User,
+            created_at=datetime(2024, 1, 1, 0, 0, i),
+            value=AssistantMessageValue(
+                type=AssistantMessageType.Text, content={"message": f"m{i}"}
+            ),
+            token_count=i,
+        )
+        for i in range(3)
+    ]
+
+    values, parameters = _messages_values(
+        [_message_row("asst_1", "thread_1", message) for message in messages]
+    )
+
+    assert values.count("(") == 3
+    assert values.startswith("(:id_0, :assistant_id_0, ")
+    assert len(parameters) == 3 * len(MESSAGE_COLUMNS)
+    assert parameters["id_2"] == "msg_2"
+    assert parameters["content_1"] == '{"message": "m1"}'
+    assert parameters["thread_id_0"] == "thread_1"
+
+
+class FakeSession:
+    """Records what AsyncSession is asked to do, with its autobegin and transaction state."""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.transaction = False
+        self.log: list = []
+
+    def in_transaction(self) -> bool:
+        return self.transaction
+
+    @asynccontextmanager
+    async def begin(self):
+        self.transaction = True
+        self.log.append("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.log.append("ROLLBACK")
+            raise
+        else:
+            self.log.append("COMMIT")
+        finally:
+            self.transaction = False
+
+    async def connection(self, execution_options=None):
+        self.transaction = True
+        self.log.append(("connection", execution_options))
+
+    async def execute(self, statement, parameters=None):
+        self.transaction = True
+        self.log.append(" ".join(str(statement).split()))
+        if self.fail:
+            raise RuntimeError("statement failed")
+        row = ("thread_1", "New chat", "asst_1", datetime(2024, 1, 1))
+        return SimpleNamespace(fetchone=lambda: row)
+
+    async def commit(self):
+        self.log.append("commit")
+        self.transaction = False
+
+
+def inserts(session: FakeSession) -> list:
+    return [entry for entry in session.log if isinstance(entry, str) and "INSERT" in entry]
+
+
+def test_a_statement_outside_a_unit_of_work_runs_in_autocommit_and_releases_the_session():
+    session = FakeSession()
+    repository = AssistantRepository(session)
+
+    asyncio.run(repository._execute("SELECT 1"))
+
+    assert session.log == [("connection", {"isolation_level": "AUTOCOMMIT"}), "SELECT 1", "commit"]
+    assert session.in_transaction() is False
+
+
+def test_a_failed_autocommit_statement_still_releases_the_session():
+    session = FakeSession(fail=True)
+    repository = AssistantRepository(session)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(repository._execute("SELECT 1"))
+
+    assert session.log[-1] == "commit"
+    assert session.in_transaction() is False
+
+
+def test_nested_units_of_work_share_one_transaction():
+    session = FakeSession()
+    repository = AssistantRepository(session)
+
+    async def work() -> None:
+        async with repository.unit_of_work():
+            await repository._execute("SELECT 1")
+            async with repository.unit_of_work():
+                await repository._execute("SELECT 2")
+            await repository._execute("SELECT 3")
+
+    asyncio.run(work())
+
+    # no autocommit connection and no commit per statement
+    assert session.log == ["BEGIN", "SELECT 1", "SELECT 2", "SELECT 3", "COMMIT"]
+    assert repository._in_unit_of_work is False
+
+
+def test_a_failure_in_a_nested_unit_of_work_rolls_back_the_outer_one():
+    session = FakeSession()
+    repository = AssistantRepository(session)
+
+    async def work() -> None:
+        async with repository.unit_of_work():
+            await repository._execute("SELECT 1")
+            async with repository.unit_of_work():
+                raise ValueError("failed half way")
+
+    with pytest.raises(ValueError):
+        asyncio.run(work())
+
+    assert session.log == ["BEGIN", "SELECT 1", "ROLLBACK"]
+    assert repository._in_unit_of_work is False
+    # statements after it are back in autocommit
+    asyncio.run(repository._execute("SELECT 2"))
+    assert session.log[-3:] == [
+        ("connection", {"isolation_level": "AUTOCOMMIT"}),
+        "SELECT 2",
+        "commit",
+    ]
+
+
+def test_a_thread_and_its_messages_are_written_in_one_statement():
+    session = FakeSession()
+    repository = AssistantRepository(session)
+    thread = AssistantThreadEntity(
+        id="thread_1", name="New chat", assistant_id="asst_1", created_at=datetime(2024, 1, 1)
+    )
+    messages = [
+        AssistantMessageItem(
+            id=f"msg_{i}",
+            role=Role.User,
+            created_at=datetime(2024, 1, 1, 0, 0, i),
+            value=AssistantMessageValue(type=AssistantMessageType.Text, content={"message": "hi"}),
+        )
+        for i in range(2)
+    ]
+
+    created = asyncio.run(repository.create_thread(thread, messages))
+
+    statements = inserts(session)
+    # a single statement is atomic: when the messages fail to insert, so does the thread
+    assert len(statements) == 1
+    assert statements[0].startswith("WITH thread AS ( INSERT INTO assistant_thread")
+    assert "INSERT INTO assistant_message" in statements[0]
+    assert created.id == "thread_1"
+
+
+def test_a_failed_thread_statement_writes_nothing_else():
+    session = FakeSession(fail=True)
+    repository = AssistantRepository(session)
+    thread = AssistantThreadEntity(
+        id="thread_1", name="New chat", assistant_id="asst_1", created_at=datetime(2024, 1, 1)
+    )
+    message = AssistantMessageItem(
+        id="msg_1",
+        role=Role.User,
+        created_at=datetime(2024, 1, 1),
+        value=AssistantMessageValue(type=AssistantMessageType.Text, content={"message": "hi"}),
+    )
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(repository.create_thread(thread, [message]))
+
+    assert len(inserts(session)) == 1
@@ -0,0 +1,40 @@
+import asyncio
+
+from coding_assistant.telemetry import StageRecorder, add_observer, remove_observer, stage, timed
+
+
+@timed("db.query")
+async def query(fail: bool = False) -> str:
+    await asyncio.sleep(0.01)
+    if fail:
+        raise ValueError("failed")
+    return "rows"
+
+
+def test_stages_are_reported_to_observers_even_on_errors():
+    recorder = StageRecorder()
+    add_observer(recorder)
+    try:
+        assert asyncio.run(query()) == "rows"
+        try:
+            asyncio.run(query(fail=True))
+        except ValueError:
+            pass
+        with stage("llm.run"):
+            pass
+    finally:
+        remove_observer(recorder)
+
+    assert len(recorder.samples["db.query"]) == 2
+    assert all(seconds >= 0.01 for seconds in recorder.samples["db.query"])
+    assert len(recorder.samples["llm.run"]) == 1
+
+
+def test_stages_are_not_recorded_without_observers():
+    recorder = StageRecorder()
+    add_observer(recorder)
+    remove_observer(recorder)
+
+    asyncio.run(query())
+
+    assert recorder.samples == {}
@@ -0,0 +1,43 @@
+import dataclasses
+import os
+import subprocess
+import sys
+
+from coding_assistant.assistant import models
+
+
+def test_models_are_built_at_import():
+    # a dataclass left incomplete, e.g. by a forward reference, has its validator built on first use
+    incomplete = [
+        name
+        for name, value in vars(models).items()
+        if dataclasses.is_dataclass(value) and not getattr(value, "__pydantic_complete__", True)
+    ]
+    assert incomplete == []
+
+
+def import_the_app(code: str) -> str:
+    env = {
+        "DB_HOST": "localhost",
+        "DB_USER": "postgres",
+        "DB_PASSWORD": "postgres",
+        "DB_DATABASE": "postgres",
+        **os.environ,
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, threading, coding_assistant.main; {code}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_importing_the_app_leaves_the_run_types_to_the_client():
+    assert import_the_app("print('openai.types.beta.threads' in sys.modules)") == "False"
+
+
+def test_importing_the_app_starts_no_thread():
+    # the log writer is started by the lifespan, not by tools and tests importing the app
+    assert import_the_app("print(threading.active_count())") == "1"
@@ -0,0 +1,70 @@
+import asyncio
+
+from coding_assistant.assistant.models import (
+    AssistantStreamEvent,
+    CreateThreadParams,
+    CreateThreadResult,
+    SendMessageParams,
+    SendMessageResult,
+)
+from coding_assistant.routes.assistant import _sse_stream
+from tests.fakes import FakeLLM, make_service
+
+
+async def first_event_then_close(events):
+    event = await events.__anext__()
+    await events.aclose()
+    return event
+
+
+def test_a_created_thread_is_saved_with_its_streamed_answer():
+    service = make_service()
+
+    async def collect():
+        return [
+            event
+            async for event in service.create_thread_stream(
+                "asst_1", CreateThreadParams(message="reverse a list")
+            )
+        ]
+
+    *deltas, result = asyncio.run(collect())
+
+    assert [delta.delta.text for delta in deltas] == ["answer", "to", "reverse", "a", "list"]
+    assert isinstance(result, CreateThreadResult)
+    assert service.ar.texts(result.thread.id) == ["reverse a list", "answer to reverse a list"]
+    assert service.ar.queued == []
+
+
+def test_a_thread_stream_closed_early_queues_the_thread_for_deletion():
+    service = make_service(llm=FakeLLM(delay=0.01))
+
+    events = service.create_thread_stream("asst_1", CreateThreadParams(message="q"))
+    event = asyncio.run(first_event_then_close(events))
+
+    assert isinstance(event, AssistantStreamEvent)
+    # no row for the thread, whose LLM side is left to the deletion queue
+    assert service.ar.saved == {}
+    assert [kind for kind, _ in service.ar.queued] == ["thread"]
+
+
+def test_a_closed_message_stream_releases_the_thread_turn():
+    service = make_service(llm=FakeLLM(delay=0.01))
+
+    async def scenario():
+        stream = service.post_thread_message_stream(
+            "asst_1", "thread_1", SendMessageParams(message="q")
+        )
+        await first_event_then_close(_sse_stream(stream))
+        # the route closed the service stream with its own, rather than leaving it holding
+        # the turn until the garbage collector gets to it
+        assert stream.ag_frame is None
+        assert service.coordinator.in_flight() == 0
+        return await asyncio.wait_for(
+            service.post_thread_message("asst_1", "thread_1", SendMessageParams(message="next")),
+            timeout=1,
+        )
+
+    result = asyncio.run(scenario())
+
+    assert isinstance(result, SendMessageResult)
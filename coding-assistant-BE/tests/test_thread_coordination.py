@@ -0,0 +1,277 @@
+import asyncio
+
+import pytest
+
+from coding_assistant.assistant.models import SendMessageParams, SendMessageResult
+from coding_assistant.assistant.cache import AssistantCache
+from coding_assistant.assistant.coordination import (
+    ASSISTANT_TOPIC,
+    CoordinationConfig,
+    PgChannel,
+    ThreadCoordinator,
+    TurnCancelled,
+)
+from coding_assistant.assistant.service import AssistantService
+from tests import fakes
+from tests.fakes import FakeLLM, FakeRepository
+
+RUN_DURATION = 0.1
+
+
+def make_service() -> AssistantService:
+    return fakes.make_service(llm=FakeLLM(delay=RUN_DURATION))
+
+
+def post(service: AssistantService, thread_id: str, message: str):
+    return service.post_thread_message("asst_1", thread_id, SendMessageParams(message=message))
+
+
+def test_messages_on_one_thread_run_one_after_another_in_order():
+    service = make_service()
+
+    async def scenario():
+        return await asyncio.gather(*(post(service, "thread_1", f"q{i}") for i in range(3)))
+
+    results = asyncio.run(scenario())
+
+    assert service.llm.max_active_per_thread == 1
+    assert service.llm.calls == [("thread_1", "q0"), ("thread_1", "q1"), ("thread_1", "q2")]
+    assert [r.messages[0].value.content["message"] for r in results] == [
+        "answer to q0",
+        "answer to q1",
+        "answer to q2",
+    ]
+    assert service.coordinator.in_flight() == 0
+
+
+def test_back_to_back_identical_submissions_are_coalesced_into_one_run():
+    service = make_service()
+
+    async def scenario():
+        # the copies arrive while the first is running
+        first = asyncio.create_task(post(service, "thread_1", "reverse a list"))
+        await asyncio.sleep(0)
+        copies = [
+            asyncio.create_task(post(service, "thread_1", "reverse a list")) for _ in range(2)
+        ]
+        return await asyncio.gather(first, *copies)
+
+    first, *copies = asyncio.run(scenario())
+
+    assert service.llm.calls == [("thread_1", "reverse a list")]
+    assert all(copy == first for copy in copies)
+    assert service.ar.texts("thread_1").count("reverse a list") == 1
+
+
+def test_a_message_repeated_after_another_one_runs_again():
+    service = make_service()
+
+    async def scenario():
+        # "yes" is queued again behind "no", it is a new answer rather than a duplicate
+        tasks = []
+        for message in ["yes", "no", "yes"]:
+            tasks.append(asyncio.create_task(post(service, "thread_1", message)))
+            await asyncio.sleep(0)
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(scenario())
+
+    assert service.llm.calls == [("thread_1", "yes"), ("thread_1", "no"), ("thread_1", "yes")]
+    assert [r.messages[0].value.content["message"] for r in results] == [
+        "answer to yes",
+        "answer to no",
+        "answer to yes",
+    ]
+    assert results[0] != results[2]
+    assert service.ar.texts("thread_1").count("yes") == 2
+
+
+def stream(service: AssistantService, thread_id: str, message: str):
+    return service.post_thread_message_stream(
+        "asst_1", thread_id, SendMessageParams(message=message)
+    )
+
+
+async def collect(events) -> list:
+    return [event async for event in events]
+
+
+def test_an_identical_streamed_message_joins_the_running_turn():
+    service = fakes.make_service(llm=FakeLLM(delay=0.02))
+
+    async def scenario():
+        first = asyncio.create_task(collect(stream(service, "thread_1", "reverse a list")))
+        # joins once the first has sent some of its deltas
+        await asyncio.sleep(0.05)
+        copy = asyncio.create_task(collect(stream(service, "thread_1", "reverse a list")))
+        posted = asyncio.create_task(post(service, "thread_1", "reverse a list"))
+        return await asyncio.gather(first, copy, posted)
+
+    first, copy, posted = asyncio.run(scenario())
+
+    assert service.llm.calls == [("thread_1", "reverse a list")]
+    assert copy == first
+    assert isinstance(first[-1], SendMessageResult)
+    assert posted == first[-1]
+    assert service.ar.texts("thread_1").count("reverse a list") == 1
+    assert service.coordinator.in_flight() == 0
+
+
+def test_a_streamed_message_joining_a_posted_one_gets_its_result():
+    service = make_service()
+
+    async def scenario():
+        posted = asyncio.create_task(post(service, "thread_1", "q"))
+        await asyncio.sleep(0)
+        return await asyncio.gather(posted, collect(stream(service, "thread_1", "q")))
+
+    posted, events = asyncio.run(scenario())
+
+    assert service.llm.runs == 1
+    assert events == [posted]
+
+
+def test_closing_the_stream_running_a_turn_cancels_the_streams_joining_it():
+    service = fakes.make_service(llm=FakeLLM(delay=0.02))
+
+    async def scenario():
+        running = stream(service, "thread_1", "q")
+        await running.__anext__()
+        joined = asyncio.create_task(collect(stream(service, "thread_1", "q")))
+        await asyncio.sleep(0.01)
+        await running.aclose()
+        with pytest.raises(TurnCancelled):
+            await joined
+        return await post(service, "thread_1", "q")
+
+    retried = asyncio.run(scenario())
+
+    assert service.llm.runs == 2
+    assert retried.messages[0].value.content["message"] == "answer to q"
+    assert service.coordinator.in_flight() == 0
+
+
+def test_different_threads_still_run_concurrently():
+    service = make_service()
+
+    async def scenario():
+        await asyncio.gather(*(post(service, f"thread_{i}", "hello") for i in range(5)))
+
+    asyncio.run(scenario())
+
+    assert service.llm.max_active == 5
+
+
+def test_failed_turn_releases_the_thread():
+    service = make_service()
+
+    async def failing(assistant, thread_id, message, context=None):
+        raise RuntimeError("run failed")
+
+    async def scenario():
+        original = service.llm.process_user_message
+        service.llm.process_user_message = failing
+        results = await asyncio.gather(
+            post(service, "thread_1", "q"), post(service, "thread_1", "q"), return_exceptions=True
+        )
+        service.llm.process_user_message = original
+        return results, await post(service, "thread_1", "q")
+
+    failed, retried = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in failed)
+    assert retried.messages[0].value.content["message"] == "answer to q"
+
+
+class SharedLocks:
+    """Stands in for the advisory locks of the database the workers share."""
+
+    def __init__(self) -> None:
+        self.held: set[str] = set()
+        self.released = asyncio.Condition()
+
+
+class FakeChannel:
+    def __init__(self, locks: SharedLocks) -> None:
+        self.locks = locks
+
+    async def lock_thread(self, thread_id):
+        async with self.locks.released:
+            await self.locks.released.wait_for(lambda: thread_id not in self.locks.held)
+            self.locks.held.add(thread_id)
+
+    async def unlock_thread(self, thread_id):
+        async with self.locks.released:
+            self.locks.held.discard(thread_id)
+            self.locks.released.notify_all()
+
+
+def test_turns_on_one_thread_run_one_after_another_across_workers():
+    llm = FakeLLM(delay=RUN_DURATION)
+    locks = SharedLocks()
+    workers = [
+        AssistantService(
+            ar=FakeRepository(), llm=llm, coordinator=ThreadCoordinator(FakeChannel(locks))
+        )
+        for _ in range(2)
+    ]
+
+    async def scenario():
+        await asyncio.gather(
+            *(post(workers[i % 2], "thread_1", f"q{i}") for i in range(4)),
+            post(workers[0], "thread_2", "other"),
+        )
+
+    asyncio.run(scenario())
+
+    assert llm.max_active_per_thread == 1
+    assert llm.max_active == 2
+    assert locks.held == set()
+
+
+def test_a_failed_turn_unlocks_the_thread_for_the_other_workers():
+    locks = SharedLocks()
+    coordinator = ThreadCoordinator(FakeChannel(locks))
+
+    async def failing():
+        raise RuntimeError("run failed")
+
+    async def scenario():
+        try:
+            await coordinator.run("thread_1", "q", failing)
+        except RuntimeError:
+            pass
+
+    asyncio.run(scenario())
+
+    assert locks.held == set()
+    assert coordinator.in_flight() == 0
+
+
+def test_notifications_wake_the_waiting_turn_and_invalidate_caches():
+    channel = PgChannel(CoordinationConfig(), engine=None)
+    cache = AssistantCache(max_size=10, ttl=60, channel=channel)
+    cache.set("asst_1", "assistant")
+    cache.set(AssistantCache.ALL_ASSISTANTS_KEY, ["assistant"])
+    released = channel._released["thread_1"] = asyncio.Event()
+
+    channel._on_notification(None, 1, "coding_assistant", "thread:thread_1")
+    channel._on_notification(None, 1, "coding_assistant", f"{ASSISTANT_TOPIC}:asst_1")
+
+    assert released.is_set()
+    assert cache.get("asst_1") is None
+    assert cache.get(AssistantCache.ALL_ASSISTANTS_KEY) is None
+    assert channel.stats().notifications == 2
+
+
+def test_local_backend_takes_no_locks():
+    channel = PgChannel(CoordinationConfig(backend="local"), engine=None)
+
+    async def scenario():
+        await channel.lock_thread("thread_1")
+        await channel.unlock_thread("thread_1")
+        await channel.notify(ASSISTANT_TOPIC, "asst_1")
+
+    asyncio.run(scenario())
+
+    assert channel.stats().connected is False
@@ -0,0 +1,138 @@
+import asyncio
+import json
+from datetime import datetime
+
+from coding_assistant.assistant.transfer import (
+    MESSAGE_COLUMNS,
+    THREAD_COLUMNS,
+    _columns,
+    _json_row,
+    _lines,
+    _record,
+)
+from coding_assistant.routes.history import _export_stream
+
+
+async def chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def collect(lines) -> list:
+    return [line async for line in lines]
+
+
+def test_lines_are_rejoined_across_chunks():
+    data = '{"a": 1}\n{"b": "ü"}\n\n{"c": 3}'.encode()
+
+    for size in (1, 3, len(data)):
+        assert asyncio.run(collect(_lines(chunks(data, size)))) == [
+            '{"a": 1}',
+            '{"b": "ü"}',
+            "",
+            '{"c": 3}',
+        ]
+
+
+def test_record_types_the_values_copy_needs():
+    row = {
+        "kind": "message",
+        "id": "msg_1",
+        "assistant_id": "asst_1",
+        "thread_id": "thread_1",
+        "created_at": "2024-05-01T10:20:30.123456",
+        "role": "user",
+        "type": "text",
+        "content": {"message": "hi"},
+        "token_count": None,
+    }
+
+    assert _record(row, MESSAGE_COLUMNS) == (
+        "msg_1",
+        "asst_1",
+        "thread_1",
+        datetime(2024, 5, 1, 10, 20, 30, 123456),
+        "user",
+        "text",
+        json.dumps({"message": "hi"}),
+        None,
+    )
+
+
+def test_only_the_columns_a_line_has_are_copied():
+    # written before the assistants had a backend and a context budget
+    row = {
+        "kind": "assistant",
+        "id": "asst_1",
+        "name": "A",
+        "created_at": "2024-05-01T10:20:30",
+        "instructions": "",
+        "model": "m",
+        "unknown": 1,
+    }
+
+    columns = _columns("assistant", row)
+
+    assert columns == ("id", "name", "created_at", "instructions", "model")
+    assert _record(row, columns) == ("asst_1", "A", datetime(2024, 5, 1, 10, 20, 30), "", "m")
+
+
+def test_exported_lines_carry_the_kind_and_every_column():
+    select = _json_row("message", MESSAGE_COLUMNS)
+
+    assert select.startswith("json_build_object('kind', 'message', ")
+    for column in MESSAGE_COLUMNS:
+        assert f"'{column}', " in select
+
+
+def test_exported_timestamps_keep_every_digit_of_the_fraction():
+    select = _json_row("thread", THREAD_COLUMNS)
+
+    assert "'created_at', to_char(created_at, 'YYYY-MM-DD\"T\"HH24:MI:SS.US')" in select
+
+
+def test_exported_threads_import_back_whatever_the_fraction():
+    created_at = datetime(2024, 5, 1, 10, 20, 30, 120000)
+    # as written by the export, and by json_build_object before it padded the fraction
+    for exported in ("2024-05-01T10:20:30.120000", "2024-05-01T10:20:30.12"):
+        line = json.dumps(
+            {
+                "kind": "thread",
+                "id": "thread_1",
+                "name": "New chat",
+                "assistant_id": "asst_1",
+                "created_at": exported,
+            }
+        )
+        lines = asyncio.run(collect(_lines(chunks(f"{line}\n".encode(), 7))))
+
+        assert _record(json.loads(lines[0]), THREAD_COLUMNS) == (
+            "thread_1",
+            "New chat",
+            "asst_1",
+            created_at,
+        )
+
+    assert _record({"created_at": "2024-05-01T10:20:30"}, ["created_at"])[0] == datetime(
+        2024, 5, 1, 10, 20, 30
+    )
+
+
+def test_an_export_stream_closed_early_closes_the_export():
+    async def export():
+        for i in range(3):
+            yield f"line {i}\n"
+
+    async def scenario():
+        lines = export()
+        stream = _export_stream(lines)
+        first = await stream.__anext__()
+        # the client went away: the response closes its stream
+        await stream.aclose()
+        return first, lines
+
+    first, lines = asyncio.run(scenario())
+
+    assert first == "line 0\n"
+    # the export ended there, with its transaction, rather than when collected
+    assert lines.ag_frame is None